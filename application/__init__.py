@@ -5,10 +5,34 @@ from django.conf.urls import patterns, include, url
 from django.shortcuts import render, redirect
 
 from decorators import *
+import metrics
 
 # this should be somewhere else
 def mix(*args):
     return type('abc', tuple(args), {})
+
+
+class ApplicationType(type):
+    
+    '''
+        Metaclass collecting the @view methods of an Application class once, when the class is created.
+        Methods overridden in a subclass replace the inherited View of the same name
+    '''
+    
+    def __new__(cls, name, bases, attrs):
+        
+        new_class = super(ApplicationType, cls).__new__(cls, name, bases, attrs)
+        
+        views = {}
+        for klass in reversed(new_class.__mro__):
+            for attr, value in vars(klass).items():
+                if callable(value) and hasattr(value, 'view'):
+                    views[attr] = value.view
+                elif attr in views:
+                    del views[attr]
+                    
+        new_class._view_registry = [views[attr] for attr in sorted(views)]
+        return new_class
                 
                 
 class Application(object):  
@@ -19,18 +43,29 @@ class Application(object):
         Use @view decorator on methods to define views of the application
     '''
     
+    __metaclass__ = ApplicationType
+    
     notifications = []
     
     def __init__(self):
         super(Application, self).__init__()
-             
-        self.views = []
-        for attr in dir(self):
-            value = getattr(self, attr)
-            if callable(value) and hasattr(value, 'view'):
-                view = value.view
-                view.application = self
-                self.views.append(view)   
+        
+        self._urls = None
+        
+        # the class's views, collected by ApplicationType, bound to this instance
+        self.views = [view.bind(self) for view in self._view_registry]
+                
+    def get_view(self, method):
+        '''Return the View of the named method bound to the Application, or None'''
+        # None while the Application is initialised
+        for view in getattr(self, 'views', []):
+            if view.view == method:
+                return view
+        return None
+    
+    def url_name(self, name):
+        '''Return the URLConf name of the named view ie. app.model.name'''
+        return "{0}.{1}.{2}".format(self.model._meta.app_label, self.model._meta.verbose_name, name)
                 
     def _view_map(self):
         views = []
@@ -43,18 +78,27 @@ class Application(object):
         '''
             Return a list of urls for the Application.
             
-            Named URLConfs are available as app.model.name  
+            Named URLConfs are available as app.model.name.  The patterns are built on first use and
+            the same list returned after.  Callbacks of Views with enforce set check login_required and perm
         '''
         
+        if self._urls is not None:
+            return self._urls
+        
         views = []
         for view in self.views:
+            callback = view.protect(getattr(self, view.view))
+            if metrics.enabled():
+                callback = metrics.instrument(view, self.url_name(view.name or view.view), callback)
+                
+            view.callback = callback
             if view.name:
-                name = "{0}.{1}.{2}".format(self.model._meta.app_label, self.model._meta.verbose_name, view.name)
-                views.append(url(view.url, getattr(self, view.view), view.opts, name=name))
+                views.append(url(view.url, callback, view.opts, name=self.url_name(view.name)))
             else:
-                views.append(url(view.url, getattr(self, view.view), view.opts))
+                views.append(url(view.url, callback, view.opts))
                     
-        return patterns('', *views)
+        self._urls = patterns('', *views)
+        return self._urls
     
     # for prettier urls.py
     urls = property(get_urls)
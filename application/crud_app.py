@@ -1,40 +1,95 @@
 from django.core.exceptions import ImproperlyConfigured
+from django.forms.models import modelform_factory
 
 from application import Application, view
-from application.views.single import *
-from application.views.list import GenericListView
+from generic.views.single import *
+from generic.views.list import GenericListView
+from generic.views.bulk import GenericBulkUpdateView, GenericBulkDeleteView
+from generic.views.mixins.list import FilterMixin
+from generic.views.mixins.queryset import FilterByUser
 
 class CRUDApplication(Application):
     
     '''
         Generic application providing complete CRUD capability.
+        
+        The generic views and model form are built once when the application is instantiated and
+        every request is dispatched to the same view instances.  Override the *_view_class attributes
+        to use customised generic views.
+        
+        Set json_fields to serve the list and read views as JSON built from values() projections
+        rather than rendering templates.  The URLs are unchanged.
+        
+        Bulk views are optional - set bulk_update_fields to a dictionary of field:value pairs to
+        enable bulk/update/, and bulk_delete_enabled to True to enable bulk/delete/.  Both act on the
+        posted pks, or on every object of the list's current filter when 'all' is posted, and
+        redirect to the list.  They are scoped like list_view_class - its FilterMixin filter and
+        FilterByUser user - and, unlike the other views, their login and perm are enforced, by
+        default Django's change and delete permissions of the model.
+        
+        Set background_delete to delete objects with the generic.deletion worker rather than in the
+        delete request, and projection to load only the fields the list, read and update templates
+        use, with projection_extra for fields used from python.  See GenericView.
+        
+        Set related and prefetch to load the relations the list and read templates follow with
+        select_related and prefetch_related, or related to 'auto' to find them from the list's
+        sort_fields and the templates.  See GenericView.
     '''
     
     name = ''
     model = None
+    form = None
+    
+    json_fields = None
+    
+    bulk_update_fields = None
+    bulk_delete_enabled = False
+    
+    background_delete = False
+    
+    projection = False
+    projection_extra = []
+    
+    related = None
+    prefetch = []
+    
+    list_view_class = GenericListView
+    create_view_class = GenericCreateView
+    read_view_class = GenericReadView
+    update_view_class = GenericUpdateView
+    delete_view_class = GenericDeleteView
+    bulk_update_view_class = GenericBulkUpdateView
+    bulk_delete_view_class = GenericBulkDeleteView
     
     list_template = None
     create_template = None
     read_template = None
     update_template = None
+    delete_template = None
     
     list_urlconf = r'^$'
     create_urlconf = r'^create/$'
     read_urlconf = r'^read/(?P<object_id>\d+)/$'
     update_urlconf = r'^update/(?P<object_id>\d+)/$'
     delete_urlconf = r'^delete/(?P<object_id>\d+)/$'
+    bulk_update_urlconf = r'^bulk/update/$'
+    bulk_delete_urlconf = r'^bulk/delete/$'
     
     list_login = False
     create_login = True
     read_login = False
     update_login = True
     delete_login = True
+    bulk_update_login = True
+    bulk_delete_login = True
     
     list_perm = None
     create_perm = 'create'
     read_perm = None
     update_perm = 'update'
     delete_perm = 'delete'
+    bulk_update_perm = 'change'
+    bulk_delete_perm = 'delete'
         
     def __init__(self, **kwargs):
                 
@@ -49,42 +104,138 @@ class CRUDApplication(Application):
         self.read_template = kwargs.pop('read_template', getattr(self.__class__, 'read_template') or template_name('read'))
         self.update_template = kwargs.pop('update_template', getattr(self.__class__, 'update_template') or template_name('update'))
         self.delete_template = kwargs.pop('delete_template', getattr(self.__class__, 'delete_template') or template_name('delete'))
+        
+        # one form class shared by the create and update views
+        self.form = kwargs.pop('form', self.form) or modelform_factory(self.model, fields='__all__')
+        
+        self.json_fields = kwargs.pop('json_fields', self.json_fields)
+        
+        self.bulk_update_fields = kwargs.pop('bulk_update_fields', self.bulk_update_fields)
+        self.bulk_delete_enabled = kwargs.pop('bulk_delete_enabled', self.bulk_delete_enabled)
+        
+        self.background_delete = kwargs.pop('background_delete', self.background_delete)
+        
+        self.projection = kwargs.pop('projection', self.projection)
+        self.projection_extra = kwargs.pop('projection_extra', self.projection_extra)
+        
+        self.related = kwargs.pop('related', self.related)
+        self.prefetch = kwargs.pop('prefetch', self.prefetch)
                 
         super(CRUDApplication, self).__init__()
+        
+        # disabled bulk views get no url
+        disabled = []
+        if not self.bulk_update_fields:
+            disabled.append('bulk_update')
+        if not self.bulk_delete_enabled:
+            disabled.append('bulk_delete')
+        self.views = [view for view in self.views if view.view not in disabled]
+        
+        self.build_views()
+        
+    def build_views(self):
+        
+        '''Instantiate the generic views requests are dispatched to'''
+        
+        self.list_view = self.list_view_class(
+            model=self.model,
+            background_delete=self.background_delete,
+            template=self.list_template,
+            json_fields=self.json_fields,
+            projection=self.projection,
+            projection_extra=self.projection_extra,
+            related=self.related,
+            prefetch=self.prefetch
+        )
+        self.create_view = self.create_view_class(
+            model=self.model,
+            form=self.form,
+            template=self.create_template
+        )
+        self.read_view = self.read_view_class(
+            model=self.model,
+            background_delete=self.background_delete,
+            template=self.read_template,
+            json_fields=self.json_fields,
+            projection=self.projection,
+            projection_extra=self.projection_extra,
+            related=self.related,
+            prefetch=self.prefetch
+        )
+        self.update_view = self.update_view_class(
+            model=self.model,
+            background_delete=self.background_delete,
+            form=self.form,
+            template=self.update_template,
+            projection=self.projection,
+            projection_extra=self.projection_extra
+        )
+        # redirect by URLConf name, the urls aren't loaded yet so they can't be reversed here
+        self.delete_view = self.delete_view_class(
+            model=self.model,
+            background_delete=self.background_delete,
+            post_delete_redirect=self.url_name('list')
+        )
+        if self.bulk_update_fields:
+            view_class, scope = self.bulk_scope(self.bulk_update_view_class)
+            self.bulk_update_view = view_class(
+                model=self.model,
+                background_delete=self.background_delete,
+                set_model_fields=self.bulk_update_fields,
+                post_action_redirect=self.url_name('list'),
+                **scope
+            )
+        if self.bulk_delete_enabled:
+            view_class, scope = self.bulk_scope(self.bulk_delete_view_class)
+            self.bulk_delete_view = view_class(
+                model=self.model,
+                background_delete=self.background_delete,
+                post_action_redirect=self.url_name('list'),
+                **scope
+            )
+            
+    def bulk_scope(self, view_class):
+        
+        '''
+            Return view_class with the list view's FilterMixin and FilterByUser mixed in, and their
+            options, so bulk actions act within the list's current filter and user scope
+        '''
+        
+        mixins = [mixin for mixin in (FilterByUser, FilterMixin) if isinstance(self.list_view, mixin) and not issubclass(view_class, mixin)]
+        if mixins:
+            view_class = type(view_class.__name__, tuple(mixins) + (view_class, ), {})
+            
+        scope = {}
+        if isinstance(self.list_view, FilterMixin):
+            scope.update(filter_fields=self.list_view.filter_fields, default_filter=self.list_view.default_filter, stateless=self.list_view.stateless)
+        if isinstance(self.list_view, FilterByUser):
+            scope['user_field'] = self.list_view.user_field
+        return view_class, scope
                 
     @view(list_urlconf, login_required=list_login, perm=list_perm, name='list')
     def list(self, request, *args, **kwargs):
-        return GenericListView(
-            model=self.model,
-            template=self.list_template
-        )(request, *args, **kwargs)
+        return self.list_view(request, *args, **kwargs)
         
     @view(create_urlconf, login_required=create_login, perm=create_perm, name='create')
     def create(self, request, *args, **kwargs):
-        return GenericCreateView(
-            model=self.model,
-            template=self.create_template
-        )(request, *args, **kwargs)
+        return self.create_view(request, *args, **kwargs)
         
     @view(read_urlconf, login_required=read_login, perm=read_perm, name='read')
     def read(self, request, *args, **kwargs):
-        return GenericReadView(
-            model=self.model,
-            template=self.read_template
-        )(request, *args, **kwargs)
+        return self.read_view(request, *args, **kwargs)
         
     @view(update_urlconf, login_required=update_login, perm=update_perm, name='update')
     def update(self, request, *args, **kwargs):
-        return GenericUpdateView(
-            model=self.model,
-            template=self.update_template
-        )(request, *args, **kwargs)
+        return self.update_view(request, *args, **kwargs)
         
     @view(delete_urlconf, login_required=delete_login, perm=delete_perm, name='delete')
     def delete(self, request, *args, **kwargs):
-        return GenericDeleteView(
-            model=self.model,
-            post_delete_redirect=self.list.view.get_absolute_url()
-        )(request, *args, **kwargs)
+        return self.delete_view(request, *args, **kwargs)
+        
+    @view(bulk_update_urlconf, login_required=bulk_update_login, perm=bulk_update_perm, enforce=True, name='bulk_update')
+    def bulk_update(self, request, *args, **kwargs):
+        return self.bulk_update_view(request, *args, **kwargs)
         
- 
\ No newline at end of file
+    @view(bulk_delete_urlconf, login_required=bulk_delete_login, perm=bulk_delete_perm, enforce=True, name='bulk_delete')
+    def bulk_delete(self, request, *args, **kwargs):
+        return self.bulk_delete_view(request, *args, **kwargs)
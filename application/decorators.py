@@ -1,21 +1,34 @@
-from functools import wraps
+import weakref
+from functools import update_wrapper, wraps
 
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import redirect
 from django.core.urlresolvers import reverse
 from django.core.exceptions import PermissionDenied
 
+from generic.reverse import cached_reverse
+
 
 class View(object):
     
     '''
         View object stores various view related information.  Usually created by @view decorator but
         there is no reason not to directly instantiate it if you like.
+        
+        Each Application instance works on its own copies of its class's Views, bound to it by bind()
+        
+        Options -
+            enforce - check login_required and perm before calling the view, otherwise they are
+                      only information for the view
+            login_required - anonymous requests are redirected to settings.LOGIN_URL
+            perm - permission the user must have, either 'app_label.codename' or a codename prefix
+                   completed with the application's model, eg. 'change' is 'app_label.change_model'
     '''
     
-    # track instances
-    _views = []
+    # track views bound to applications, released with their application
+    _views = weakref.WeakSet()
     
-    def __init__(self, url, view, name=None, perm=None, **opts):
+    def __init__(self, url, view, name=None, perm=None, enforce=False, **opts):
         
         super(View, self).__init__()
         
@@ -23,18 +36,89 @@ class View(object):
         self.view = view
         self.name = name
         self.perm = perm
+        self.enforce = enforce
         self.opts = opts
-                
-        View._views.append(self)
+        
+    def bind(self, application):
+        
+        '''Return a copy of the View belonging to application'''
+        
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__dict__)
+        view.application = application
+        View._views.add(view)
+        return view
                 
     def get_absolute_url(self, *args, **kwargs):
         
-        view = getattr(self.application, self.view)
-        return reverse(view, args=args, kwargs=kwargs)
+        if self.name:
+            return cached_reverse(self.application.url_name(self.name), args=args, kwargs=kwargs)
+        # the callback the application's urls were built with
+        self.application.get_urls()
+        return reverse(self.callback, args=args, kwargs=kwargs)
     
     abs_url = property(get_absolute_url)
+    
+    def get_perm(self):
+        '''Return the full name of the View's permission, or None'''
+        if not self.perm or '.' in self.perm:
+            return self.perm
+        opts = self.application.model._meta
+        return '{0}.{1}_{2}'.format(opts.app_label, self.perm, opts.model_name)
+    
+    def protect(self, callback):
+        
+        '''Return callback enforcing the View's login_required and perm options, if enforce is set'''
+        
+        perm = self.get_perm()
+        if not self.enforce or (not self.opts.get('login_required') and not perm):
+            return callback
+        
+        @wraps(callback)
+        def wrapper(request, *args, **kwargs):
+            user = getattr(request, 'user', None)
+            if user is None or not user.is_authenticated():
+                return redirect_to_login(request.get_full_path())
+            if perm and not user.has_perm(perm):
+                raise PermissionDenied
+            return callback(request, *args, **kwargs)
+        
+        return wrapper
         
                     
+class ViewMethod(object):
+    
+    '''
+        Application method decorated with @view.  The method's view attribute is the class's View,
+        and on an Application instance, the View bound to that instance, eg. app.list.view.abs_url
+    '''
+    
+    def __init__(self, func):
+        update_wrapper(self, func)
+        self.func = func
+        
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+        
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return BoundViewMethod(self.func.__get__(instance, owner), instance.get_view(self.func.__name__) or self.view)
+    
+    
+class BoundViewMethod(object):
+    
+    '''An @view method of an Application instance, with the View bound to it'''
+    
+    def __init__(self, method, view):
+        update_wrapper(self, method)
+        self.method = method
+        self.view = view
+        
+    def __call__(self, *args, **kwargs):
+        return self.method(*args, **kwargs)
+    
+    
 def view(url, **opts):
     
     '''
@@ -47,7 +131,7 @@ def view(url, **opts):
             
         view = View(url, func.__name__, **opts)
         func.view = view
-        return func
+        return ViewMethod(func)
         
     return decorator
 
@@ -0,0 +1,219 @@
+from hashlib import md5
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.core.urlresolvers import get_resolver
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.sql.datastructures import EmptyResultSet
+
+from application import View
+from generic.views import GenericView
+from generic.views.list import GenericListView
+from generic.views.mixins.queryset import FilterByUser
+
+
+def _column(model, name):
+    
+    '''Return db column of a local field name, None for lookups across relations'''
+    
+    if '__' in name:
+        return None
+    if name == 'pk':
+        return model._meta.pk.column
+    return model._meta.get_field(name).column
+
+
+def query_shapes(view):
+    
+    '''
+        Return the (equality fields, order field) combinations a generic view can query with.
+        
+        List views combine FilterByUser, default_filter and each filter field with each sort field,
+        single object views look up by slug (pk lookups are always indexed)
+    '''
+    
+    equality = []
+    if isinstance(view, FilterByUser):
+        equality.append(view.user_field)
+        
+    if not isinstance(view, GenericListView):
+        if 'slug' in [field.name for field in view.model._meta.fields]:
+            return [(equality + ['slug'], None)]
+        return [(equality, None)] if equality else []
+    
+    equality += sorted(getattr(view, 'default_filter', {}).keys())
+    
+    filters = [[]] + [[field] for field in getattr(view, 'filter_fields', []) if field not in equality]
+    
+    sorts = list(getattr(view, 'sort_fields', []))
+    default_sort = getattr(view, 'default_sort_field', None) or (view.model._meta.ordering or [None])[0]
+    if default_sort:
+        default_sort = default_sort.lstrip('-')
+    if default_sort not in sorts:
+        sorts.insert(0, default_sort)
+    
+    shapes = []
+    for filter in filters:
+        for sort in sorts:
+            if equality + filter or sort:
+                shapes.append((equality + filter, sort))
+    return shapes
+
+
+class Command(NoArgsCommand):
+    
+    help = 'Check the queries of every registered Application view against the existing indexes'
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Database to inspect and run EXPLAIN against. Defaults to the "default" database.'),
+        make_option('--no-explain', action='store_false', dest='explain', default=True,
+            help='Skip running EXPLAIN for each query.'),
+        make_option('--migration', action='store_true', dest='migration', default=False,
+            help='Print the missing indexes as a migration rather than a report.'),
+    )
+    
+    def handle_noargs(self, **options):
+        
+        self.connection = connections[options['database']]
+        self.database = options['database']
+        self.explain = options['explain']
+        
+        # applications are instantiated by the urlconf that includes them
+        get_resolver(None).url_patterns
+        
+        applications = []
+        for view in View._views:
+            application = getattr(view, 'application', None)
+            if application is not None and application not in applications:
+                applications.append(application)
+        
+        missing = []
+        for application in applications:
+            for name, view in sorted(vars(application).items()):
+                if isinstance(view, GenericView):
+                    missing += self.check_view(application, name, view)
+                    
+        if options['migration']:
+            self.write_migration(missing)
+        elif missing:
+            self.stdout.write('\nMissing indexes:')
+            for model, columns in missing:
+                self.stdout.write('    {0} ({1})'.format(model._meta.db_table, ', '.join(columns)))
+        else:
+            self.stdout.write('\nNo missing indexes')
+            
+    def indexes(self, model):
+        
+        '''Return column lists of the existing indexes of a model's table'''
+        
+        cursor = self.connection.cursor()
+        introspection = self.connection.introspection
+        
+        if hasattr(introspection, 'get_constraints'):
+            constraints = introspection.get_constraints(cursor, model._meta.db_table)
+            return [constraint['columns'] for constraint in constraints.values() if constraint['index'] or constraint['unique'] or constraint['primary_key']]
+        
+        # older backends only introspect single column indexes, take composites from the model
+        indexes = [[column] for column in introspection.get_indexes(cursor, model._meta.db_table)]
+        for fields in list(model._meta.index_together) + list(model._meta.unique_together):
+            indexes.append([model._meta.get_field(field).column for field in fields])
+        return indexes
+    
+    def check_view(self, application, name, view):
+        
+        model = view.model
+        indexes = self.indexes(model)
+        missing = []
+        
+        for equality, sort in query_shapes(view):
+            
+            columns = [_column(model, field) for field in equality]
+            order = _column(model, sort) if sort else None
+            
+            description = '{0}.{1}: WHERE {2} ORDER BY {3}'.format(
+                application.__class__.__name__, name, ', '.join(equality) or '-', sort or '-')
+            
+            if None in columns or (sort and order is None):
+                self.stdout.write('{0}  [skipped, lookup across a relation]'.format(description))
+                continue
+            
+            candidate = columns + ([order] if order and order not in columns else [])
+            covered = [index for index in indexes if set(index[:len(columns)]) == set(columns) and (not order or order in columns or index[len(columns):len(columns) + 1] == [order])]
+            
+            self.stdout.write('{0}  [{1}]'.format(description, 'ok' if covered else 'missing'))
+            if not covered and (model, candidate) not in missing:
+                missing.append((model, candidate))
+                
+            if self.explain:
+                self.explain_query(model, equality, sort)
+                
+        return missing
+    
+    def explain_query(self, model, equality, sort):
+        
+        '''Print the plan of the query shape using values from a sample row'''
+        
+        queryset = model._default_manager.using(self.database)
+        if equality:
+            sample = queryset.values(*equality)[:1]
+            values = sample[0] if sample else dict((field, None) for field in equality)
+            queryset = queryset.filter(**values)
+        if sort:
+            queryset = queryset.order_by(sort)
+            
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return
+        
+        prefix = 'EXPLAIN QUERY PLAN ' if self.connection.vendor == 'sqlite' else 'EXPLAIN '
+        cursor = self.connection.cursor()
+        cursor.execute(prefix + sql, params)
+        for row in cursor.fetchall():
+            self.stdout.write('        ' + ' '.join(unicode(column) for column in row))
+    
+    def write_migration(self, missing):
+        
+        # migrations need django 1.7, the command only imports them when printing one
+        from django.db.migrations.loader import MigrationLoader
+        
+        qn = self.connection.ops.quote_name
+        editor = self.connection.schema_editor()
+        graph = MigrationLoader(self.connection).graph
+        
+        operations = []
+        dependencies = []
+        for model, columns in missing:
+            table = model._meta.db_table
+            name = '{0}_{1}'.format(table[:20], md5('_'.join(columns)).hexdigest()[:8])
+            create = editor.sql_create_index % {'name': qn(name), 'table': qn(table), 'columns': ', '.join(qn(column) for column in columns), 'extra': ''}
+            drop = editor.sql_delete_index % {'name': qn(name), 'table': qn(table)}
+            operations.append('        migrations.RunSQL(\n            {0!r},\n            {1!r},\n        ),'.format(create, drop))
+            
+            # run after the latest migration of the table's app, which created it
+            for node in graph.leaf_nodes(model._meta.app_label):
+                if node not in dependencies:
+                    dependencies.append(node)
+                    
+        self.stdout.write(MIGRATION.format(
+            dependencies=''.join("        ('{0}', '{1}'),\n".format(*node) for node in sorted(dependencies)),
+            operations='\n'.join(operations)))
+        
+        
+MIGRATION = '''# -*- coding: utf-8 -*-
+# Generated by index_advisor
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+{dependencies}    ]
+
+    operations = [
+{operations}
+    ]
+'''
@@ -0,0 +1,263 @@
+'''
+    Opt-in per View instrumentation.
+    
+    Enable with settings.VIEW_METRICS = True.  Every View served by an Application then records
+    latency histograms and response sizes, and a sample of requests (settings.VIEW_METRICS_SAMPLE_RATE,
+    defaults to 0.1) also records database query count and time.  Template render time is recorded
+    for the generic views.
+    
+    Counters are kept in per-thread shards that only their own thread writes to, so recording takes
+    no locks; shards are summed when the stats are read.  The shard of a thread (or greenlet) that
+    has finished is folded into a retired total, so shards don't pile up with short lived threads.
+    
+    Include metrics.urls for the stats endpoints, which are available to staff users and INTERNAL_IPS -
+        stats/ - JSON, including generic.callbacks deferred callback stats
+        prometheus/ - Prometheus text exposition format
+'''
+
+import json
+import random
+import threading
+import weakref
+from functools import wraps
+from timeit import default_timer
+
+from django.conf import settings
+from django.conf.urls import patterns, url
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+
+from generic.callbacks import callback_stats
+
+
+# latency histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def enabled():
+    return getattr(settings, 'VIEW_METRICS', False)
+
+
+class _Shard(object):
+    
+    '''Counters written by a single thread'''
+    
+    def __init__(self):
+        self.requests = 0
+        self.latency = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.bytes = 0
+        self.render_time = 0.0
+        self.sampled = 0
+        self.queries = 0
+        self.query_time = 0.0
+        
+    def add(self, shard):
+        '''Add the counters of another shard to this one'''
+        for attr in ('requests', 'latency', 'bytes', 'render_time', 'sampled', 'queries', 'query_time'):
+            setattr(self, attr, getattr(self, attr) + getattr(shard, attr))
+        self.buckets = [a + b for a, b in zip(self.buckets, shard.buckets)]
+        
+        
+class _Owner(object):
+    '''Held only by the writing thread's local, so it is released when the thread finishes'''
+    
+
+class ViewMetrics(object):
+    
+    '''Metrics of a single View'''
+    
+    def __init__(self, name):
+        
+        self.name = name
+        self._local = threading.local()
+        # weak reference to the owner of each live thread's shard -> shard
+        self._shards = {}
+        self._retired = _Shard()
+        # reentrant, the retire callback may run from garbage collection in a thread holding it
+        self._lock = threading.RLock()
+        
+    def _shard(self):
+        
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard()
+            owner = self._local.owner = _Owner()
+            with self._lock:
+                self._shards[weakref.ref(owner, self._retire)] = shard
+            self._local.shard = shard
+        return shard
+    
+    def _retire(self, ref):
+        # the thread has finished, fold its shard into the retired total
+        with self._lock:
+            shard = self._shards.pop(ref, None)
+            if shard is not None:
+                self._retired.add(shard)
+    
+    def record(self, latency, size, render_time, queries=None, query_time=None):
+        
+        shard = self._shard()
+        shard.requests += 1
+        shard.latency += latency
+        shard.bytes += size
+        shard.render_time += render_time
+        
+        for i, bound in enumerate(BUCKETS):
+            if latency <= bound:
+                shard.buckets[i] += 1
+                break
+        else:
+            shard.buckets[-1] += 1
+            
+        if queries is not None:
+            shard.sampled += 1
+            shard.queries += queries
+            shard.query_time += query_time
+            
+    def snapshot(self):
+        
+        '''Return totals over every thread's shard'''
+        
+        totals = _Shard()
+        with self._lock:
+            totals.add(self._retired)
+            for shard in self._shards.values():
+                totals.add(shard)
+        return totals
+    
+
+# View -> ViewMetrics, released with the View
+registry = weakref.WeakKeyDictionary()
+
+
+def get_metrics(view, name):
+    metrics = registry.get(view)
+    if metrics is None:
+        metrics = registry.setdefault(view, ViewMetrics(name))
+    return metrics
+
+
+def instrument(view, name, callback):
+    
+    '''Wrap an Application view callback to record metrics for View view under name'''
+    
+    metrics = get_metrics(view, name)
+    sample_rate = getattr(settings, 'VIEW_METRICS_SAMPLE_RATE', 0.1)
+    
+    @wraps(callback)
+    def wrapper(request, *args, **kwargs):
+        
+        sampled = random.random() < sample_rate
+        if sampled:
+            # capture queries with the debug cursor for this request only
+            capture = CaptureQueriesContext(connection)
+            capture.__enter__()
+            
+        start = default_timer()
+        try:
+            response = callback(request, *args, **kwargs)
+        finally:
+            latency = default_timer() - start
+            if sampled:
+                capture.__exit__(None, None, None)
+                captured = capture.captured_queries
+                    
+        size = 0 if getattr(response, 'streaming', False) else len(response.content)
+        render_time = getattr(response, 'render_time', 0.0)
+        
+        if sampled:
+            metrics.record(latency, size, render_time, len(captured), sum(float(query['time']) for query in captured))
+        else:
+            metrics.record(latency, size, render_time)
+        return response
+    
+    return wrapper
+
+
+def _check_access(request):
+    user = getattr(request, 'user', None)
+    if not (user is not None and user.is_staff) and request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise PermissionDenied
+
+
+def _snapshots():
+    return sorted((metrics.name, metrics.snapshot()) for metrics in registry.values())
+
+
+def stats(request):
+    
+    '''JSON stats of every instrumented View'''
+    
+    _check_access(request)
+    
+    data = {}
+    for name, totals in _snapshots():
+        data[name] = {
+            'requests': totals.requests,
+            'latency_seconds': totals.latency,
+            'latency_buckets': dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'], totals.buckets)),
+            'response_bytes': totals.bytes,
+            'render_seconds': totals.render_time,
+            'sampled_requests': totals.sampled,
+            'db_queries': totals.queries,
+            'db_query_seconds': totals.query_time,
+        }
+    data = {'views': data, 'callbacks': callback_stats()}
+    return HttpResponse(json.dumps(data, indent=2, sort_keys=True), content_type='application/json')
+
+
+def prometheus(request):
+    
+    '''Stats of every instrumented View in the Prometheus text format'''
+    
+    _check_access(request)
+    
+    lines = [
+        '# HELP view_request_seconds View latency.',
+        '# TYPE view_request_seconds histogram',
+    ]
+    snapshots = _snapshots()
+    for name, totals in snapshots:
+        cumulative = 0
+        for bound, count in zip([repr(bound) for bound in BUCKETS] + ['+Inf'], totals.buckets):
+            cumulative += count
+            lines.append('view_request_seconds_bucket{{view="{0}",le="{1}"}} {2}'.format(name, bound, cumulative))
+        lines.append('view_request_seconds_sum{{view="{0}"}} {1!r}'.format(name, totals.latency))
+        lines.append('view_request_seconds_count{{view="{0}"}} {1}'.format(name, totals.requests))
+        
+    counters = [
+        ('view_response_bytes_total', 'Response body bytes.', 'bytes'),
+        ('view_render_seconds_total', 'Template render time.', 'render_time'),
+        ('view_sampled_requests_total', 'Requests sampled for database metrics.', 'sampled'),
+        ('view_db_queries_total', 'Database queries of sampled requests.', 'queries'),
+        ('view_db_query_seconds_total', 'Database query time of sampled requests.', 'query_time'),
+    ]
+    for metric, help, attr in counters:
+        lines.append('# HELP {0} {1}'.format(metric, help))
+        lines.append('# TYPE {0} counter'.format(metric))
+        for name, totals in snapshots:
+            lines.append('{0}{{view="{1}"}} {2!r}'.format(metric, name, getattr(totals, attr)))
+            
+    callbacks = sorted(callback_stats().items())
+    counters = [
+        ('deferred_callback_calls_total', 'Deferred callback runs.', 'calls'),
+        ('deferred_callback_failures_total', 'Deferred callback runs that raised.', 'failures'),
+        ('deferred_callback_retries_total', 'Deferred callback runs retried.', 'retries'),
+        ('deferred_callback_seconds_total', 'Deferred callback run time.', 'seconds'),
+    ]
+    for metric, help, key in counters:
+        lines.append('# HELP {0} {1}'.format(metric, help))
+        lines.append('# TYPE {0} counter'.format(metric))
+        for name, stats in callbacks:
+            lines.append('{0}{{callback="{1}"}} {2!r}'.format(metric, name, stats[key]))
+            
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
+
+
+urls = patterns('',
+    url(r'^stats/$', stats, name='view_metrics.stats'),
+    url(r'^prometheus/$', prometheus, name='view_metrics.prometheus'),
+)
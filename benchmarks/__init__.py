@@ -0,0 +1,61 @@
+'''
+    Benchmarks for the generic views and applications.
+    
+    Run from the repository root, eg.
+        python -m benchmarks.bench_crud_app
+        
+    setup() configures a standalone Django project using the benchmarks app and an in-memory
+    SQLite database, set BENCH_DB to a file path to benchmark against an on-disk database.
+'''
+
+import os
+
+
+def setup(**overrides):
+    
+    '''Configure settings and create the database tables'''
+    
+    from django.conf import settings
+    
+    if not settings.configured:
+        options = dict(
+            DEBUG=False,
+            DATABASES={
+                'default': {
+                    'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': os.environ.get('BENCH_DB', ':memory:'),
+                }
+            },
+            INSTALLED_APPS=[
+                'django.contrib.contenttypes',
+                'django.contrib.auth',
+                'django.contrib.sessions',
+                'comment',
+                'benchmarks',
+            ],
+            ROOT_URLCONF='benchmarks.urls',
+            SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+            TEMPLATE_DIRS=[os.path.join(os.path.dirname(__file__), 'templates')],
+            SECRET_KEY='benchmarks',
+        )
+        options.update(overrides)
+        settings.configure(**options)
+    
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    
+    from django.core.management import call_command
+    call_command('syncdb', interactive=False, verbosity=0)
+    
+
+def timed(func, iterations):
+    
+    '''Call func iterations times and return the mean time per call in microseconds'''
+    
+    from timeit import default_timer
+    
+    start = default_timer()
+    for i in xrange(iterations):
+        func()
+    return (default_timer() - start) / iterations * 1000000
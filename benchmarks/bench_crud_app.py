@@ -0,0 +1,61 @@
+'''
+    Per-request cost of CRUDApplication dispatch.
+    
+    Compares building the generic view (and for create/update its ModelForm class) on every
+    request, as CRUDApplication used to, with dispatching to the views it builds at instantiation.
+'''
+
+from benchmarks import setup, timed
+setup()
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test.client import RequestFactory
+
+from generic.views.list import GenericListView
+from generic.views.single import GenericCreateView, GenericReadView, GenericUpdateView
+
+from benchmarks.models import Category, Item
+from benchmarks.urls import items
+
+
+ITERATIONS = 2000
+
+
+def per_request(view_class, app, action):
+    
+    '''Old behaviour - new view instance, and ModelForm class, per request'''
+    
+    template = getattr(app, action + '_template')
+    return lambda request, **kwargs: view_class(model=app.model, template=template)(request, **kwargs)
+
+
+def main():
+    
+    user = User.objects.create(username='bench')
+    category = Category.objects.create(name='bench')
+    item = Item.objects.create(name='item', category=category, user=user)
+    
+    factory = RequestFactory()
+    request = factory.get('/')
+    request.user = AnonymousUser()
+    request.session = {}
+    
+    cases = [
+        ('list', GenericListView, {}),
+        ('create', GenericCreateView, {}),
+        ('read', GenericReadView, {'object_id': item.pk}),
+        ('update', GenericUpdateView, {'object_id': item.pk}),
+    ]
+    
+    print('{0:<10}{1:>16}{2:>16}{3:>10}'.format('view', 'per request us', 'prebuilt us', 'saving'))
+    for action, view_class, kwargs in cases:
+        before = per_request(view_class, items, action)
+        after = getattr(items, action)
+        
+        before_us = timed(lambda: before(request, **kwargs), ITERATIONS)
+        after_us = timed(lambda: after(request, **kwargs), ITERATIONS)
+        print('{0:<10}{1:>16.1f}{2:>16.1f}{3:>9.0f}%'.format(action, before_us, after_us, (1 - after_us / before_us) * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+'''
+    Peak memory of exporting a list against row count.
+    
+    Each measurement runs in a fresh process so peak RSS isn't carried between sizes.  Compares the
+    streaming CSV export with evaluating the queryset for a template, eg.
+        python -m benchmarks.bench_export 1000 10000 100000
+'''
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+
+def measure(rows, mode):
+    
+    '''Seed rows items then export them, returning peak RSS in MB'''
+    
+    from benchmarks import setup
+    setup()
+    
+    from django.contrib.auth.models import User
+    from django.test.client import RequestFactory
+    
+    from generic.views.list import GenericListView
+    from benchmarks.models import Category, Item
+    
+    user = User.objects.create(username='bench')
+    category = Category.objects.create(name='bench')
+    batch = []
+    for i in xrange(rows):
+        batch.append(Item(name='item {0}'.format(i), category=category, user=user, notes='x' * 200))
+        if len(batch) == 5000:
+            Item.objects.bulk_create(batch)
+            batch = []
+    Item.objects.bulk_create(batch)
+    
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    if mode == 'stream':
+        view = GenericListView(model=Item, export_fields=['id', 'name', 'category__name', 'created_date', 'notes'])
+        response = view(RequestFactory().get('/', {'export': 'csv'}))
+        for line in response.streaming_content:
+            pass
+    else:
+        for item in list(Item.objects.select_related('category')):
+            pass
+            
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kB on Linux
+    return (peak - baseline) / 1024.0
+
+
+def main(sizes):
+    
+    print('{0:>10}{1:>16}{2:>16}'.format('rows', 'stream MB', 'template MB'))
+    for rows in sizes:
+        results = []
+        for mode in ('stream', 'template'):
+            # on-disk database so seeding doesn't count towards the process memory
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            try:
+                env = dict(os.environ, BENCH_DB=path)
+                output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_export', '--measure', str(rows), mode], env=env)
+                results.append(float(output))
+            finally:
+                os.remove(path)
+        print('{0:>10}{1:>16.1f}{2:>16.1f}'.format(rows, *results))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        print(measure(int(sys.argv[2]), sys.argv[3]))
+    else:
+        main([int(size) for size in sys.argv[1:]] or [1000, 10000, 100000, 1000000])
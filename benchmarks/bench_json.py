@@ -0,0 +1,52 @@
+'''
+    Throughput of the JSON mode of the list and read views against template rendering.
+'''
+
+from benchmarks import setup, timed
+setup()
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test.client import RequestFactory
+
+from generic.views.list import GenericListView
+from generic.views.mixins.list import PageMixin
+from generic.views.single import GenericReadView
+
+from benchmarks.models import Category, Item
+
+
+ITERATIONS = 500
+FIELDS = ['id', 'name', 'closed', 'created_date']
+
+
+class PagedListView(PageMixin, GenericListView):
+    pass
+
+
+def main():
+    
+    user = User.objects.create(username='bench')
+    category = Category.objects.create(name='bench')
+    Item.objects.bulk_create([Item(name='item {0}'.format(i), category=category, user=user) for i in range(1000)])
+    item = Item.objects.all()[0]
+    
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    
+    cases = [
+        ('list', PagedListView, 'benchmarks/item/list.html', {}),
+        ('read', GenericReadView, 'benchmarks/item/read.html', {'object_id': item.pk}),
+    ]
+    
+    print('{0:<10}{1:>16}{2:>16}'.format('view', 'template req/s', 'json req/s'))
+    for name, view_class, template, kwargs in cases:
+        html = view_class(model=Item, template=template)
+        api = view_class(model=Item, template=template, json_fields=FIELDS)
+        
+        html_us = timed(lambda: html(request, **kwargs), ITERATIONS)
+        api_us = timed(lambda: api(request, **kwargs), ITERATIONS)
+        print('{0:<10}{1:>16.0f}{2:>16.0f}'.format(name, 1000000 / html_us, 1000000 / api_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+    Cost of instantiating Applications.
+    
+    Compares the attribute scan Application.__init__ used to run on every instance, which touched
+    every attribute including the urls property, with binding the views ApplicationType collects
+    once per class.  Also checks bound Views are released along with their application.
+'''
+
+import gc
+
+from benchmarks import setup, timed
+setup()
+
+from application import Application
+from application.decorators import View
+from application.crud_app import CRUDApplication
+
+from benchmarks.models import Item
+
+
+ITERATIONS = 500
+
+
+def scan(application):
+    
+    '''Old behaviour - find @view methods with dir() and getattr()'''
+    
+    application._urls = None
+    views = []
+    for attr in dir(application):
+        value = getattr(application, attr)
+        if callable(value) and hasattr(value, 'view'):
+            views.append(value.view)
+    return views
+
+
+def bind(application):
+    return [view.bind(application) for view in application._view_registry]
+
+
+def main():
+    
+    application = CRUDApplication(model=Item)
+    
+    scan_us = timed(lambda: scan(application), ITERATIONS)
+    bind_us = timed(lambda: bind(application), ITERATIONS)
+    create_us = timed(lambda: CRUDApplication(model=Item), ITERATIONS)
+    
+    print('{0:<32}{1:>12}'.format('', 'us'))
+    print('{0:<32}{1:>12.1f}'.format('view scan per instance', scan_us))
+    print('{0:<32}{1:>12.1f}'.format('view bind per instance', bind_us))
+    print('{0:<32}{1:>12.1f}'.format('CRUDApplication()', create_us))
+    
+    gc.collect()
+    print('{0:<32}{1:>12}'.format('live bound views', len(View._views)))
+
+
+if __name__ == '__main__':
+    main()
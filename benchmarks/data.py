@@ -0,0 +1,92 @@
+'''
+    Synthetic data for the benchmarks.
+'''
+
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from comment.models import Comment
+
+from models import Category, Item
+
+
+USERS = 50
+CATEGORIES = 20
+BATCH_SIZE = 5000
+
+# comments on the first item, read by the thread benchmarks
+THREAD_COMMENTS = 500
+
+
+@contextmanager
+def _explicit_dates(model):
+    
+    '''Turn off auto_now and auto_now_add, which bulk_create would otherwise apply to every row'''
+    
+    fields = [(field, field.auto_now, field.auto_now_add) for field in model._meta.fields if hasattr(field, 'auto_now')]
+    for field, auto_now, auto_now_add in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+            
+
+def _batched(model, objects):
+    batch = []
+    for object in objects:
+        batch.append(object)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+    
+
+def generate(rows, seed=0):
+    
+    '''
+        Create rows items spread over a fixed set of users and categories, with a comment thread
+        on the first item.  The same seed always generates the same data.
+    '''
+    
+    rng = random.Random(seed)
+    
+    User.objects.bulk_create([User(username='user{0}'.format(i)) for i in xrange(USERS)])
+    Category.objects.bulk_create([Category(name='category {0}'.format(i)) for i in xrange(CATEGORIES)])
+    users = list(User.objects.values_list('pk', flat=True))
+    categories = list(Category.objects.values_list('pk', flat=True))
+    
+    start = timezone.now() - timedelta(days=365)
+    
+    def items():
+        for i in xrange(rows):
+            created = start + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            yield Item(
+                name='item {0:07d}'.format(rng.randint(0, rows)),
+                category_id=rng.choice(categories),
+                user_id=rng.choice(users),
+                closed=rng.random() < 0.2,
+                created_date=created,
+                updated_at=created,
+                notes='x' * rng.randint(0, 200),
+            )
+    with _explicit_dates(Item):
+        _batched(Item, items())
+    
+    item = Item.objects.order_by('pk')[0]
+    content_type = ContentType.objects.get_for_model(Item)
+    
+    def comments():
+        for i in xrange(THREAD_COMMENTS):
+            created = start + timedelta(minutes=i)
+            yield Comment(content_type=content_type, object_id=item.pk, user_id=rng.choice(users), content='comment {0}'.format(i), created_date=created)
+    with _explicit_dates(Comment):
+        _batched(Comment, comments())
+    
+    return item
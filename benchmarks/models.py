@@ -0,0 +1,36 @@
+from django.db.models import *
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.generic import GenericRelation
+
+from comment.models import Comment
+
+
+class Category(Model):
+    
+    name = CharField(max_length=100)
+    
+    def __unicode__(self):
+        return self.name
+
+
+class Item(Model):
+    
+    '''Synthetic model exercising the field types the generic views filter and sort on'''
+    
+    name = CharField(max_length=100)
+    category = ForeignKey(Category)
+    user = ForeignKey(User)
+    closed = BooleanField(default=False)
+    created_date = DateTimeField(auto_now_add=True)
+    updated_at = DateTimeField(auto_now=True)
+    notes = TextField(blank=True)
+    
+    comments = GenericRelation(Comment)
+    
+    def __unicode__(self):
+        return self.name
+    
+    @permalink
+    def get_absolute_url(self):
+        return ('benchmarks.item.read', (), {'object_id': self.pk})
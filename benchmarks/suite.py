@@ -0,0 +1,319 @@
+'''
+    Benchmark suite of the generic views, list mixins, CRUDApplication and comments.
+    
+    Each data size runs in a fresh process against a generated database, and every case reports
+    throughput, latency percentiles and the number of queries of a single request, eg.
+        python -m benchmarks.suite                            # 1,000 rows
+        python -m benchmarks.suite 1000 100000 1000000
+        python -m benchmarks.suite --save                     # store the results as the baseline
+        
+    Results are compared against the baseline file (benchmarks/baseline.json by default) when it
+    exists.  A case regresses when it makes more queries than the baseline.  With --timings it also
+    regresses when its throughput falls or its p95 latency rises by more than the tolerance, relative
+    to the REFERENCE case of the same run so that a baseline saved on one machine holds on another;
+    --absolute compares the timings themselves, for runs on the machine the baseline was saved on.
+    Timings are noisy, so the timing gate is opt-in.  The exit status is 1 on regression.
+    
+    Set BENCH_DB to benchmark an on-disk SQLite database rather than an in-memory one.
+'''
+
+import itertools
+import json
+import os
+import subprocess
+import sys
+from optparse import OptionParser, SUPPRESS_HELP
+from timeit import default_timer
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+SIZES = [1000]
+
+# requests timed per case, after WARMUP untimed requests, stopping early once a case has run
+# for BUDGET seconds
+ITERATIONS = 100
+WARMUP = 5
+BUDGET = 5.0
+MIN_ITERATIONS = 5
+
+# lists without PageMixin render every row, so are left out of larger sizes
+UNPAGINATED_ROWS = 10000
+
+# case the other timings are compared relative to, run at every size
+REFERENCE = 'list+page'
+
+
+def percentile(times, percent):
+    '''Return the nearest rank percentile of sorted times'''
+    index = int(round(percent / 100.0 * len(times))) - 1
+    return times[min(max(index, 0), len(times) - 1)]
+
+
+def measure(func, iterations=ITERATIONS, warmup=WARMUP, budget=BUDGET):
+    
+    '''Call func, returning throughput, latency percentiles in milliseconds and queries per call'''
+    
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    
+    for i in xrange(warmup):
+        func()
+        
+    with CaptureQueriesContext(connection) as queries:
+        func()
+        
+    times = []
+    for i in xrange(iterations):
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+        if len(times) >= MIN_ITERATIONS and sum(times) > budget:
+            break
+    times.sort()
+    
+    return {
+        'throughput': len(times) / sum(times),
+        'p50': percentile(times, 50) * 1000,
+        'p95': percentile(times, 95) * 1000,
+        'p99': percentile(times, 99) * 1000,
+        'queries': len(queries),
+    }
+    
+    
+def list_cases(item, rows):
+    
+    '''GenericListView with every combination of the filter, sort and page mixins, and the result cache'''
+    
+    from generic.views.list import GenericListView
+    from generic.views.mixins.list import FilterMixin, PageMixin, ResultCacheMixin, SortMixin
+    
+    from models import Item
+    
+    options = {
+        FilterMixin: {'filter_fields': ['category', 'closed'], 'default_filter': {'closed': False}},
+        SortMixin: {'sort_fields': ['name', 'created_date'], 'default_sort_field': 'created_date', 'default_sort_order': 'dec'},
+        PageMixin: {'page_size': 50},
+        ResultCacheMixin: {},
+    }
+    
+    # outermost mixin first, PageMixin wraps the others
+    order = [PageMixin, SortMixin, FilterMixin]
+    combinations = []
+    for count in range(len(order) + 1):
+        combinations.extend(itertools.combinations(order, count))
+    combinations.append((ResultCacheMixin, PageMixin, SortMixin, FilterMixin))
+    
+    for mixins in combinations:
+        if PageMixin not in mixins and rows > UNPAGINATED_ROWS:
+            continue
+        kwargs = {'model': Item, 'template': 'benchmarks/item/list.html'}
+        for mixin in mixins:
+            kwargs.update(options[mixin])
+        view_class = type('BenchListView', mixins + (GenericListView, ), {})
+        name = 'list' + ''.join('+' + mixin.__name__[:-len('Mixin')].lower() for mixin in mixins)
+        yield name, view_class(**kwargs), {}
+        
+        
+def crud_cases(item, rows):
+    
+    '''Create, read, update and delete requests through CRUDApplication'''
+    
+    from models import Item
+    from urls import items
+    
+    data = {'name': 'bench', 'category': item.category_id, 'user': item.user_id, 'notes': ''}
+    created = []
+    seeded = []
+    
+    def create(request):
+        response = items.create(request)
+        created.append(Item.objects.order_by('-pk').values_list('pk', flat=True)[0])
+        return response
+    
+    def delete(request):
+        # deletes the items created by the create case, so the table keeps its size.  That case may
+        # stop early on its time budget, so the first (untimed warmup) call adds any items missing
+        if not seeded:
+            missing = WARMUP + 1 + ITERATIONS - len(created)
+            if missing > 0:
+                Item.objects.bulk_create([Item(name='bench', category_id=item.category_id, user_id=item.user_id) for i in xrange(missing)])
+                created[:0] = Item.objects.order_by('-pk').values_list('pk', flat=True)[:missing]
+            seeded.append(True)
+        return items.delete(request, object_id=created.pop())
+    
+    yield 'crud.create', create, {'method': 'post', 'data': data}
+    yield 'crud.read', items.read, {'object_id': item.pk}
+    yield 'crud.update', items.update, {'object_id': item.pk, 'method': 'post', 'data': data}
+    yield 'crud.delete', delete, {'method': 'post'}
+    
+    
+def comment_cases(item, rows):
+    
+    '''Comment thread read with each count strategy'''
+    
+    from comment.views import CommentReadMixin
+    from generic.views.single import GenericReadView
+    
+    from models import Item
+    
+    view_class = type('BenchThreadView', (CommentReadMixin, GenericReadView), {})
+    for strategy in ('exact', 'none'):
+        view = view_class(model=Item, template='benchmarks/item/thread.html', comment_count_strategy=strategy)
+        yield 'comments.thread.' + strategy, view, {'object_id': item.pk}
+    view = view_class(model=Item, template='benchmarks/item/thread_summary.html', comment_summary=True)
+    yield 'comments.thread.summary', view, {'object_id': item.pk}
+    
+    
+def filter_form_cases(item, rows):
+    
+    '''Filter form generation and rendering, with and without cached choices'''
+    
+    from generic.views.list import GenericListView
+    from generic.views.mixins.list import FilterMixin
+    
+    from models import Item
+    
+    view_class = type('BenchFilterView', (FilterMixin, GenericListView), {})
+    for name, timeout in (('filter_form', None), ('filter_form.cached_choices', 300)):
+        view = view_class(model=Item, filter_fields=['category', 'user', 'closed'], filter_choice_cache_timeout=timeout)
+        render = lambda request, view=view: view._filter_form()(initial={'closed': False}).as_p()
+        yield name, render, {}
+        
+
+CASES = [list_cases, crud_cases, comment_cases, filter_form_cases]
+
+
+def run(rows):
+    
+    '''Generate rows items and run every case, returning results keyed by case name'''
+    
+    from benchmarks import setup
+    setup()
+    
+    from django.contrib.auth.models import User
+    from django.test.client import RequestFactory
+    
+    from data import generate
+    
+    item = generate(rows)
+    user = User.objects.create(username='bench', is_superuser=True, is_staff=True)
+    factory = RequestFactory()
+    
+    results = {}
+    for cases in CASES:
+        for name, view, kwargs in cases(item, rows):
+            method = kwargs.pop('method', 'get')
+            data = kwargs.pop('data', {})
+            
+            def request():
+                request = getattr(factory, method)('/', data)
+                request.user = user
+                request.session = {}
+                return view(request, **kwargs)
+            
+            results[name] = measure(request)
+    return results
+
+
+def relative(cases, name):
+    
+    '''Return the throughput and p95 of a case as multiples of the REFERENCE case, or None'''
+    
+    reference = cases.get(REFERENCE)
+    if reference is None or name == REFERENCE:
+        return None
+    result = cases[name]
+    return {
+        'throughput': result['throughput'] / reference['throughput'],
+        'p95': result['p95'] / reference['p95'],
+    }
+
+
+def compare(results, baseline, tolerance, timings=False, absolute=False):
+    
+    '''Return descriptions of the cases in results that regressed against baseline'''
+    
+    regressions = []
+    for rows, cases in sorted(results.items()):
+        for name, result in sorted(cases.items()):
+            base = baseline.get(rows, {}).get(name)
+            if base is None:
+                continue
+            
+            unit = 'x {0}'.format(REFERENCE)
+            if absolute:
+                timing, base_timing, unit = result, base, ''
+            else:
+                timing, base_timing = relative(cases, name), relative(baseline[rows], name)
+            if timings and timing is not None and base_timing is not None:
+                if timing['throughput'] < base_timing['throughput'] * (1 - tolerance):
+                    regressions.append('{0} rows {1}: throughput {2:.3g}{4}, baseline {3:.3g}{4}'.format(rows, name, timing['throughput'], base_timing['throughput'], unit))
+                if timing['p95'] > base_timing['p95'] * (1 + tolerance):
+                    regressions.append('{0} rows {1}: p95 {2:.3g}{4}, baseline {3:.3g}{4}'.format(rows, name, timing['p95'], base_timing['p95'], unit))
+                    
+            if result['queries'] > base['queries']:
+                regressions.append('{0} rows {1}: {2} queries, baseline {3}'.format(rows, name, result['queries'], base['queries']))
+    return regressions
+
+
+def report(results, baseline, absolute=False):
+    
+    '''Print results, with the change in throughput from the baseline, relative to REFERENCE unless absolute'''
+    
+    print('{0:<10}{1:<40}{2:>10}{3:>10}{4:>10}{5:>10}{6:>9}{7:>10}'.format('rows', 'case', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'change'))
+    for rows, cases in sorted(results.items(), key=lambda item: int(item[0])):
+        for name, result in sorted(cases.items()):
+            base = baseline.get(rows, {}).get(name)
+            if base and not absolute:
+                timing, base = relative(cases, name), relative(baseline[rows], name)
+            else:
+                timing = result
+            change = '{0:+.0f}%'.format((timing['throughput'] / base['throughput'] - 1) * 100) if base and timing else ''
+            print('{0:<10}{1:<40}{2:>10.0f}{3:>10.2f}{4:>10.2f}{5:>10.2f}{6:>9}{7:>10}'.format(
+                rows, name, result['throughput'], result['p50'], result['p95'], result['p99'], result['queries'], change
+            ))
+            
+            
+def main():
+    
+    parser = OptionParser(usage='%prog [options] [rows ...]')
+    parser.add_option('--baseline', default=BASELINE, help='baseline results file')
+    parser.add_option('--save', action='store_true', default=False, help='store the results as the baseline')
+    parser.add_option('--tolerance', type='float', default=0.25, help='allowed throughput/p95 change, defaults to 0.25')
+    parser.add_option('--timings', action='store_true', default=False, help='fail on throughput/p95 regressions as well as query counts')
+    parser.add_option('--absolute', action='store_true', default=False, help='compare timings rather than timings relative to the reference case')
+    parser.add_option('--worker', type='int', help=SUPPRESS_HELP)
+    options, args = parser.parse_args()
+    
+    if options.worker is not None:
+        # child process - results are written to stdout as JSON
+        sys.stdout.write(json.dumps(run(options.worker)))
+        return 0
+    
+    results = {}
+    for rows in [int(arg) for arg in args] or SIZES:
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.suite', '--worker', str(rows)])
+        results[str(rows)] = json.loads(output)
+        
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+            
+    report(results, baseline, options.absolute)
+    
+    if options.save:
+        baseline.update(results)
+        with open(options.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        return 0
+    
+    regressions = compare(results, baseline, options.tolerance, options.timings or options.absolute, options.absolute)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+from django.conf.urls import patterns, include, url
+from django.forms.models import modelform_factory
+
+from application.crud_app import CRUDApplication
+
+from models import Item
+
+
+items = CRUDApplication(model=Item, form=modelform_factory(Item, fields=['name', 'category', 'user', 'closed', 'notes']))
+
+urlpatterns = patterns('',
+    url(r'^items/', include(items.urls)),
+)
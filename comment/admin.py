@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.contrib.contenttypes.generic import GenericStackedInline
 from django.contrib.admin import ModelAdmin, site
 
@@ -19,4 +20,6 @@ class CommentInlineAdmin(GenericStackedInline):
         # automatically fill the comment user field
         if not change:
             obj.user = request.user
-        obj.save()
\ No newline at end of file
+        # the comment counter is updated on save, keep both in one transaction
+        with transaction.atomic():
+            obj.save()
\ No newline at end of file
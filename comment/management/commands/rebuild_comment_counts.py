@@ -0,0 +1,32 @@
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from django.db.models import Count
+
+from comment.models import Comment, CommentCount
+
+
+class Command(NoArgsCommand):
+    
+    help = 'Rebuild the denormalized comment counts from the comment table'
+    
+    batch_size = 1000
+    
+    def handle_noargs(self, **options):
+        
+        counts = Comment.objects.order_by().values('content_type', 'object_id').annotate(count=Count('id'))
+        
+        total = 0
+        with transaction.atomic():
+            CommentCount.objects.all().delete()
+            
+            batch = []
+            for row in counts.iterator():
+                batch.append(CommentCount(content_type_id=row['content_type'], object_id=row['object_id'], count=row['count']))
+                if len(batch) == self.batch_size:
+                    CommentCount.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            CommentCount.objects.bulk_create(batch)
+            total += len(batch)
+        
+        self.stdout.write('Rebuilt comment counts for {0} objects'.format(total))
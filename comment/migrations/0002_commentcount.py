@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def backfill_counts(apps, schema_editor):
+    
+    '''Count the comments of each object, as the rebuild_comment_counts command'''
+    
+    Comment = apps.get_model('comment', 'Comment')
+    CommentCount = apps.get_model('comment', 'CommentCount')
+    
+    counts = Comment.objects.order_by().values('content_type', 'object_id').annotate(count=Count('id'))
+    batch = []
+    for row in counts.iterator():
+        batch.append(CommentCount(content_type_id=row['content_type'], object_id=row['object_id'], count=row['count']))
+        if len(batch) == 1000:
+            CommentCount.objects.bulk_create(batch)
+            batch = []
+    CommentCount.objects.bulk_create(batch)
+    
+    
+def clear_counts(apps, schema_editor):
+    apps.get_model('comment', 'CommentCount').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('comment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='commentcount',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+        migrations.RunPython(backfill_counts, clear_counts),
+    ]
@@ -1,4 +1,7 @@
+from django.db import IntegrityError, connection, transaction
 from django.db.models import *
+from django.db.models.signals import post_save, post_delete
+from django.conf import settings
 
 from django.contrib.auth.models import User
 
@@ -6,6 +9,27 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.generic import GenericForeignKey
 
 
+class CommentManager(Manager):
+    
+    def thread(self, object, summary=False):
+        
+        '''
+            Return the comments on object oldest first with their user joined.
+            
+            Filters and orders along the (content_type, object_id, created_date, id) index, summary=True
+            defers loading the comment content
+        '''
+        
+        content_type = ContentType.objects.get_for_model(object)
+        comments = self.filter(content_type=content_type, object_id=object.pk) \
+            .select_related('user') \
+            .order_by('created_date', 'id')
+            
+        if summary:
+            comments = comments.defer('content')
+        return comments
+
+
 class Comment(Model):
     
     # generic foreign key fields
@@ -16,8 +40,153 @@ class Comment(Model):
     user = ForeignKey(User)#, related_name='comments')
     created_date = DateTimeField(auto_now_add=True)
     content = TextField()
+    
+    objects = CommentManager()
+    
+    class Meta:
+        index_together = [['content_type', 'object_id', 'created_date', 'id']]
 
     def __unicode__(self):
         return 'Comment by {0} on {1}'.format(self.user.username, self.created_date)
+
+
+def counters_enabled():
+    '''Denormalized comment counts are maintained when settings.COMMENT_COUNTERS is True'''
+    return getattr(settings, 'COMMENT_COUNTERS', False)
+
+
+class CommentCountManager(Manager):
+    
+    def adjust(self, content_type_id, object_id, delta):
+        
+        '''Atomically add delta to the comment count of an object'''
+        
+        counts = self.filter(content_type=content_type_id, object_id=object_id)
+        if counts.update(count=F('count') + delta):
+            return
+        
+        # first count for the object, take it from the rows so earlier comments aren't missed
+        try:
+            with transaction.atomic():
+                self.create(
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    count=Comment.objects.filter(content_type=content_type_id, object_id=object_id).count()
+                )
+        except IntegrityError:
+            # created by a concurrent request in the meantime
+            counts.update(count=F('count') + delta)
+        
+    def for_object(self, object):
+        
+        '''Return the number of comments on object'''
+        
+        content_type = ContentType.objects.get_for_model(object)
+        counts = self.filter(content_type=content_type, object_id=object.pk).values_list('count', flat=True)
+        return counts[0] if counts else 0
+
+
+class CommentCount(Model):
+    
+    '''Denormalized number of comments per object, see COMMENT_COUNTERS'''
+    
+    content_type = ForeignKey(ContentType)
+    object_id = PositiveIntegerField()
+    count = PositiveIntegerField(default=0)
+    
+    objects = CommentCountManager()
+    
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+        
+    def __unicode__(self):
+        return '{0} comments on {1} {2}'.format(self.count, self.content_type, self.object_id)
     
+
+def comment_count(object):
+    
+    '''Return the number of comments on object, from the counter table when enabled'''
     
+    if counters_enabled():
+        return CommentCount.objects.for_object(object)
+    content_type = ContentType.objects.get_for_model(object)
+    return Comment.objects.filter(content_type=content_type, object_id=object.pk).count()
+        
+
+def comments_version(queryset):
+    '''Return (latest comment id, number of comments) on the objects of queryset, which change with every comment'''
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    aggregate = Comment.objects.filter(content_type=content_type, object_id__in=queryset.values('pk')) \
+        .aggregate(latest=Max('id'), count=Count('id'))
+    return aggregate['latest'], aggregate['count']
+        
+
+def attach_comments(objects, latest=2):
+    
+    '''
+        Set comment_count and latest_comments (newest first, user loaded) on each of objects.
+        
+        Uses one grouped count query and one ranked query regardless of the number of objects,
+        objects must all be instances of the same model
+    '''
+    
+    objects = list(objects)
+    if not objects:
+        return objects
+    
+    content_type = ContentType.objects.get_for_model(objects[0])
+    ids = [object.pk for object in objects]
+    
+    if counters_enabled():
+        counts = CommentCount.objects.filter(content_type=content_type, object_id__in=ids).values_list('object_id', 'count')
+    else:
+        counts = Comment.objects.filter(content_type=content_type, object_id__in=ids).order_by().values_list('object_id').annotate(Count('id'))
+    counts = dict(counts)
+    
+    comments = {}
+    if latest:
+        # rank each object's comments newest first and keep the top rows in a single query
+        qn = connection.ops.quote_name
+        column = lambda name: qn(Comment._meta.get_field(name).column)
+        table = qn(Comment._meta.db_table)
+        ranked = (
+            '{table}.{id} IN (SELECT {id} FROM ('
+                'SELECT {id}, ROW_NUMBER() OVER (PARTITION BY {object_id} ORDER BY {created_date} DESC, {id} DESC) AS comment_rank '
+                'FROM {table} WHERE {content_type} = %s AND {object_id} IN ({placeholders})'
+            ') ranked WHERE comment_rank <= %s)'
+        ).format(
+            table=table,
+            id=column('id'),
+            object_id=column('object_id'),
+            created_date=column('created_date'),
+            content_type=column('content_type'),
+            placeholders=', '.join(['%s'] * len(ids))
+        )
+        
+        latest_comments = Comment.objects.filter(content_type=content_type, object_id__in=ids) \
+            .select_related('user') \
+            .extra(where=[ranked], params=[content_type.pk] + ids + [latest]) \
+            .order_by('object_id', '-created_date', '-id')
+            
+        for comment in latest_comments:
+            comments.setdefault(comment.object_id, []).append(comment)
+    
+    for object in objects:
+        object.comment_count = counts.get(object.pk, 0)
+        object.latest_comments = comments.get(object.pk, [])
+        
+    return objects
+        
+
+def _comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and counters_enabled():
+        CommentCount.objects.adjust(instance.content_type_id, instance.object_id, 1)
+        
+        
+def _comment_deleted(sender, instance, **kwargs):
+    if counters_enabled():
+        CommentCount.objects.adjust(instance.content_type_id, instance.object_id, -1)
+        
+        
+post_save.connect(_comment_saved, sender=Comment, dispatch_uid='comment.count.save')
+post_delete.connect(_comment_deleted, sender=Comment, dispatch_uid='comment.count.delete')
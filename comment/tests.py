@@ -5,7 +5,24 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.http import HttpResponse
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from generic.testing import QueryBudgetMixin
+from generic.views.list import GenericListView
+from generic.views.mixins.list import PageMixin
+from generic.views.single import GenericReadView
+
+from models import Comment, CommentCount, attach_comments, comment_count
+from views import CommentListMixin, CommentReadMixin
 
 
 class SimpleTest(TestCase):
@@ -14,3 +31,198 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class ThreadView(CommentReadMixin, GenericReadView):
+    
+    def render_to_response(self, request, state, context):
+        # stand in for a template touching each comment's user
+        return [unicode(comment) for comment in context['comments']]
+
+
+class CommentThreadQueryTest(TestCase):
+    
+    comments = 30
+    
+    def setUp(self):
+        
+        self.target = User.objects.create(username='target')
+        users = [User.objects.create(username='user{0}'.format(i)) for i in range(5)]
+        
+        content_type = ContentType.objects.get_for_model(User)
+        for i in range(self.comments):
+            Comment.objects.create(content_type=content_type, object_id=self.target.pk, user=users[i % 5], content='comment {0}'.format(i))
+            
+        # content types are cached after the first lookup, keep that out of the counts
+        ContentType.objects.get_for_model(User)
+    
+    def test_thread_joins_user(self):
+        
+        with self.assertNumQueries(1):
+            comments = list(Comment.objects.thread(self.target)[:25])
+            usernames = [comment.user.username for comment in comments]
+            
+        self.assertEqual(len(usernames), 25)
+        self.assertEqual(comments, sorted(comments, key=lambda comment: (comment.created_date, comment.id)))
+        
+    def test_summary_defers_content(self):
+        
+        comment = Comment.objects.thread(self.target, summary=True)[0]
+        self.assertNotIn('content', comment.__dict__)
+        
+    def test_read_page_query_count(self):
+        
+        view = ThreadView(model=User)
+        request = RequestFactory().get('/')
+        
+        # object, comment count and one query for the 25 comments with their users
+        with self.assertNumQueries(3):
+            comments = view(request, object_id=self.target.pk)
+            
+        self.assertEqual(len(comments), 25)
+        
+    def test_etag_follows_comments(self):
+        
+        view = type('ConditionalThreadView', (CommentReadMixin, GenericReadView), {
+            'render_to_response': lambda self, request, state, context: HttpResponse()
+        })(model=User, last_modified_field='date_joined')
+        
+        etag = view(RequestFactory().get('/'), object_id=self.target.pk)['ETag']
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(view(request, object_id=self.target.pk).status_code, 304)
+        
+        # a new comment changes the response though the object is unchanged
+        Comment.objects.create(content_type=ContentType.objects.get_for_model(User), object_id=self.target.pk, user=self.target, content='new')
+        self.assertEqual(view(request, object_id=self.target.pk).status_code, 200)
+        
+    def test_json_mode_rejected(self):
+        
+        # JSON mode objects are values() dicts comments can't be read for
+        self.assertRaises(ImproperlyConfigured, ThreadView, model=User, json_fields=['username'])
+
+
+class CommentThreadQueryBudgetTest(QueryBudgetMixin, TestCase):
+    
+    def setUp(self):
+        self.target = User.objects.create(username='target')
+        self.content_type = ContentType.objects.get_for_model(User)
+        self.view = ThreadView(model=User, comment_page_size=100)
+        
+    def add_comments(self, count):
+        for i in range(Comment.objects.count(), count):
+            user = User.objects.create(username='user{0}'.format(i))
+            Comment.objects.create(content_type=self.content_type, object_id=self.target.pk, user=user, content='comment {0}'.format(i))
+            
+    def test_thread_queries_constant(self):
+        request = RequestFactory().get('/')
+        self.assertQueryBudget(lambda: self.view(request, object_id=self.target.pk), 3, grow=self.add_comments)
+        
+    def test_scaling_reported(self):
+        
+        # Comment.__unicode__ loads the user, so without select_related it's one query per comment
+        def unjoined():
+            return [unicode(comment) for comment in Comment.objects.filter(object_id=self.target.pk)]
+        
+        with self.assertRaisesRegexp(AssertionError, r'45 x SELECT .* FROM "auth_user"'):
+            self.assertQueryBudget(unjoined, 3, grow=self.add_comments)
+
+
+class PreviewListView(CommentListMixin, PageMixin, GenericListView):
+    
+    def render_to_response(self, request, state, context):
+        # stand in for a template showing each object's count and latest comments with their users
+        return [(user.username, user.comment_count, [unicode(comment.content) + ' ' + comment.user.username for comment in user.latest_comments])
+                for user in context['object_list']]
+
+
+class CommentPreviewTest(TestCase):
+    
+    def setUp(self):
+        
+        self.users = [User.objects.create(username='user{0}'.format(i)) for i in range(4)]
+        content_type = ContentType.objects.get_for_model(User)
+        
+        # user i has i comments, by the user after it
+        for i, user in enumerate(self.users):
+            for j in range(i):
+                Comment.objects.create(content_type=content_type, object_id=user.pk, user=self.users[(i + 1) % 4], content='comment {0}'.format(j))
+        ContentType.objects.get_for_model(User)
+        
+    def test_attach(self):
+        
+        # the objects, then one count and one latest comments query for any number of them
+        with self.assertNumQueries(3):
+            users = attach_comments(User.objects.order_by('pk'))
+            previews = [(user.comment_count, [(comment.content, comment.user.username) for comment in user.latest_comments]) for user in users]
+            
+        self.assertEqual(previews, [
+            (0, []),
+            (1, [('comment 0', 'user2')]),
+            (2, [('comment 1', 'user3'), ('comment 0', 'user3')]),
+            (3, [('comment 2', 'user0'), ('comment 1', 'user0')]),
+        ])
+        self.assertEqual(attach_comments([]), [])
+        
+    def test_counters(self):
+        
+        with self.settings(COMMENT_COUNTERS=True):
+            call_command('rebuild_comment_counts', stdout=StringIO())
+            users = attach_comments(User.objects.order_by('pk'), latest=0)
+        self.assertEqual([(user.comment_count, user.latest_comments) for user in users], [(0, []), (1, []), (2, []), (3, [])])
+        
+    def test_list_view(self):
+        
+        view = PreviewListView(model=User, queryset=User.objects.order_by('pk'), page_size=3, comment_preview_count=1)
+        
+        # count, page, comment counts and latest comments
+        with self.assertNumQueries(4):
+            rows = view(RequestFactory().get('/'))
+        self.assertEqual(rows, [('user0', 0, []), ('user1', 1, ['comment 0 user2']), ('user2', 2, ['comment 1 user3'])])
+        
+        self.assertRaises(ImproperlyConfigured, PreviewListView, model=User, json_fields=['username'])
+
+
+@override_settings(COMMENT_COUNTERS=True)
+class CommentCountTest(TestCase):
+    
+    def setUp(self):
+        self.users = [User.objects.create(username='user{0}'.format(i)) for i in range(2)]
+        self.content_type = ContentType.objects.get_for_model(User)
+        
+    def comment(self, object):
+        return Comment.objects.create(content_type=self.content_type, object_id=object.pk, user=self.users[0], content='comment')
+        
+    def test_maintained(self):
+        
+        first = self.comment(self.users[0])
+        self.comment(self.users[0])
+        self.comment(self.users[1])
+        self.assertEqual([comment_count(user) for user in self.users], [2, 1])
+        
+        first.delete()
+        self.assertEqual([comment_count(user) for user in self.users], [1, 1])
+        
+        # saving an existing comment doesn't count it again
+        Comment.objects.get(object_id=self.users[1].pk).save()
+        self.assertEqual(comment_count(self.users[1]), 1)
+        
+    def test_first_count_includes_earlier_comments(self):
+        
+        with self.settings(COMMENT_COUNTERS=False):
+            self.comment(self.users[0])
+        self.assertFalse(CommentCount.objects.exists())
+        
+        self.comment(self.users[0])
+        self.assertEqual(comment_count(self.users[0]), 2)
+        
+    def test_rebuild(self):
+        
+        for user in self.users + self.users[:1]:
+            self.comment(user)
+        CommentCount.objects.filter(object_id=self.users[0].pk).update(count=10)
+        CommentCount.objects.filter(object_id=self.users[1].pk).delete()
+        
+        stdout = StringIO()
+        call_command('rebuild_comment_counts', stdout=stdout)
+        self.assertIn('Rebuilt comment counts for 2 objects', stdout.getvalue())
+        self.assertEqual([comment_count(user) for user in self.users], [2, 1])
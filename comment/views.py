@@ -1,33 +1,72 @@
-from django.shortcuts import redirect
+from django.db import transaction
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponseRedirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib.contenttypes.models import ContentType
-from django.core.urlresolvers import reverse
-from django.http import Http404
 #from django.conf import settings
 
+from generic.callbacks import defer
+from generic.paginator import count_paginator
+from generic.reverse import cached_reverse
+
 from forms import CommentForm
-from models import Comment
+from models import Comment, CommentCount, attach_comments, comments_version, counters_enabled
 
 
 class CommentReadMixin(object):
     
-    '''Mixin class for use with single object views'''
+    '''
+        Mixin class for use with single object views
+        
+        Options -
+            comment_paginator - paginator class for the comment thread
+            comment_page_size - number of comments per page
+            comment_count_strategy - exact, cached, estimate or none, see PageMixin.count_strategy
+            comment_count_cache_timeout - seconds to cache counts for the cached strategy
+            comment_summary - defer loading comment content, for templates only showing the author and date
+            
+        NOTE -
+            not available with json_fields, the object is a values() dict in JSON mode
+    '''
     
     comment_paginator = Paginator
     comment_page_size = 25
     
+    comment_count_strategy = None
+    comment_count_cache_timeout = 300
+    
+    comment_summary = False
+    
     def __init__(self, **kwargs):
         
         self.comment_paginator = kwargs.pop('comment_paginator', self.comment_paginator)
         self.comment_page_size = kwargs.pop('comment_page_size', self.comment_page_size)
         
+        self.comment_count_strategy = kwargs.pop('comment_count_strategy', self.comment_count_strategy)
+        self.comment_count_cache_timeout = kwargs.pop('comment_count_cache_timeout', self.comment_count_cache_timeout)
+        if self.comment_count_strategy:
+            self.comment_paginator = count_paginator(self.comment_count_strategy, self.comment_count_cache_timeout)
+            
+        self.comment_summary = kwargs.pop('comment_summary', self.comment_summary)
+        
         super(CommentReadMixin, self).__init__(**kwargs)
+        
+        if self.json_fields:
+            raise ImproperlyConfigured("'%s' can't use json_fields with CommentReadMixin" % self.__class__.__name__)
+    
+    def get_etag_parts(self, request, state, queryset):
+        # the comments and the page of them shown
+        parts = super(CommentReadMixin, self).get_etag_parts(request, state, queryset)
+        return tuple(parts) + (comments_version(queryset), request.GET.get('page'))
     
-    def get_context(self, request):
-        context = super(CommentReadMixin, self).get_context(request)
-        comments = context['object'].comments.all()
+    def get_context(self, request, state):
+        context = super(CommentReadMixin, self).get_context(request, state)
+        comments = Comment.objects.thread(context['object'], summary=self.comment_summary)
     
         paginator = self.comment_paginator(comments, self.comment_page_size)
+        if counters_enabled() and hasattr(paginator, '_count'):
+            # prime the paginator with the denormalized count so it doesn't count the rows
+            paginator._count = CommentCount.objects.for_object(context['object'])
         
         page = request.GET.get('page')
         try:
@@ -35,7 +74,7 @@ class CommentReadMixin(object):
         except PageNotAnInteger:
             comments = paginator.page(1)
         except EmptyPage:
-            comments = paginator.page(self.paginator_obj.num_pages)
+            comments = paginator.page(paginator.num_pages)
             
         context.update({
             'comments': comments,
@@ -45,8 +84,59 @@ class CommentReadMixin(object):
         return context
     
     
+class CommentListMixin(object):
+    
+    '''
+        Mixin class for use with list views.  Attaches comments to every object on the current page
+        with a fixed number of queries whatever the page size.
+        
+        Options -
+            comment_preview_count - number of latest comments to attach to each object, defaults to 2
+            
+        Object attributes -
+            comment_count - number of comments on the object
+            latest_comments - latest comments on the object, newest first, with user already loaded
+            
+        NOTE -
+            not available with json_fields, the objects are values() dicts in JSON mode
+    '''
+    
+    comment_preview_count = 2
+    
+    def __init__(self, **kwargs):
+        
+        self.comment_preview_count = kwargs.pop('comment_preview_count', self.comment_preview_count)
+        
+        super(CommentListMixin, self).__init__(**kwargs)
+        
+        if self.json_fields:
+            raise ImproperlyConfigured("'%s' can't use json_fields with CommentListMixin" % self.__class__.__name__)
+        
+    def get_etag_parts(self, request, state, queryset):
+        parts = super(CommentListMixin, self).get_etag_parts(request, state, queryset)
+        return tuple(parts) + (comments_version(queryset), )
+        
+    def get_context(self, request, state):
+        context = super(CommentListMixin, self).get_context(request, state)
+        # iterating the page or queryset caches its objects, so the template sees the same instances
+        attach_comments(context['object_list'], self.comment_preview_count)
+        return context
+    
+    
 class CommentCreateMixin(object):
     
+    '''
+        Mixin class for use with single object views, saving comments posted on the object
+        
+        Options -
+            comment_form - form class with a comment field
+            comment_id_format - format of the anchor of a saved comment, defaults to 'comment-{0}'
+            comment_post_save_redirect - view to go to after saving, defaults to the object's absolute url
+            on_comment_save - callback when a comment is saved; args - comment
+            defer_on_comment_save - run on_comment_save on the generic.callbacks worker pool after the
+                                    transaction commits, defaults to False
+    '''
+    
     comment_form = CommentForm
     
     comment_id_format = 'comment-{0}'
@@ -54,6 +144,7 @@ class CommentCreateMixin(object):
     comment_post_save_redirect = None
     
     on_comment_save = None
+    defer_on_comment_save = False
         
     def __init__(self, **kwargs):
         
@@ -62,27 +153,23 @@ class CommentCreateMixin(object):
         self.comment_post_save_redirect = kwargs.pop('comment_post_save_redirect', self.comment_post_save_redirect)
         
         self.on_comment_save = kwargs.pop('on_comment_save', self.on_comment_save)
+        self.defer_on_comment_save = kwargs.pop('defer_on_comment_save', self.defer_on_comment_save)
         
         super(CommentCreateMixin, self).__init__(**kwargs)
         
-    def get_context(self, request):
-        context = super(CommentCreateMixin, self).get_context(request)
-        context['comment_form'] = self.comment_form()
+    def get_context(self, request, state):
+        context = super(CommentCreateMixin, self).get_context(request, state)
+        context['comment_form'] = getattr(state, 'comment_form', None) or self.comment_form()
         return context
     
-    def __call__(self, request, *args, **kwargs):
+    def dispatch(self, request, state):
 
-        if kwargs.has_key('object_id'):
-            object_id = kwargs['object_id']
-            object = self.model.objects.get(pk=object_id)
-        elif kwargs.has_key('slug'):
-            object = self.model.objects.get(slug=kwargs['slug'])
-            object_id = object.pk
-        else:
-            raise Http404
+        # the object is left on state for the view being mixed to reuse
+        state.object = object = self.get_object(request, state)
+        object_id = object.pk
         
         if request.method == 'POST':
-            form = self.comment_form(request.POST)
+            form = state.comment_form = self.comment_form(request.POST)
             if form.is_valid():                
                 comment = Comment(
                     content_type=ContentType.objects.get_for_model(self.model),
@@ -90,19 +177,23 @@ class CommentCreateMixin(object):
                     user=request.user,
                     content=form.cleaned_data['comment']                     
                 )
-                comment.save()
+                # the comment counter is updated on save, keep both in one transaction
+                with transaction.atomic():
+                    comment.save()
                 
-                if self.on_comment_save:
+                if self.on_comment_save and self.defer_on_comment_save:
+                    defer(self.on_comment_save, comment)
+                elif self.on_comment_save:
                     self.on_comment_save(comment)
                 
                 if self.comment_post_save_redirect:
-                    url = reverse(self.comment_post_save_redirect, kwargs={'object_id': object_id})
+                    url = cached_reverse(self.comment_post_save_redirect, kwargs={'object_id': object_id})
                     anchor = self.comment_id_format.format(comment.id)
-                    return redirect('{0}#{1}'.format(url, anchor))
+                    return HttpResponseRedirect('{0}#{1}'.format(url, anchor))
                 else:
-                    return redirect(object.get_absolute_url())
+                    return HttpResponseRedirect(object.get_absolute_url())
                 
-        return super(CommentCreateMixin, self).__call__(request, *args, **kwargs)
+        return super(CommentCreateMixin, self).dispatch(request, state)
                 
                 
                 
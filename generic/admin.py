@@ -0,0 +1,12 @@
+from django.contrib.admin import ModelAdmin, site
+
+from models import DeletionTask
+
+
+class DeletionTaskAdmin(ModelAdmin):
+    
+    list_display = ['content_type', 'object_id', 'status', 'deleted', 'attempts', 'created_date', 'heartbeat']
+    list_filter = ['status', 'content_type']
+    
+    
+site.register(DeletionTask, DeletionTaskAdmin)
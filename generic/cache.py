@@ -0,0 +1,95 @@
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+
+# models whose versions are bumped by track_model's signals
+_tracked = set()
+
+
+def _version_key(model):
+    return 'generic.version.{0}.{1}'.format(model._meta.app_label, model._meta.object_name.lower())
+
+
+def get_model_version(model):
+    
+    '''Return the current cache version of model, bumped whenever one of its rows changes'''
+    
+    version = cache.get(_version_key(model))
+    if version is None:
+        # add rather than set so a concurrent bump isn't lost
+        cache.add(_version_key(model), _seed(), None)
+        version = cache.get(_version_key(model), 0)
+    return version
+
+
+def _seed():
+    # a version evicted from the cache restarts beyond any it reached, rather than at 1 where it
+    # would find entries cached under the old versions
+    return int(time.time() * 1000000)
+
+
+def bump_model_version(model):
+    
+    '''Invalidate everything cached against model'''
+    
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        # key missing or evicted, anything cached under the old version is unreachable either way
+        cache.add(_version_key(model), _seed(), None)
+        
+        
+def bump_if_tracked(model):
+    '''Bump the version of a tracked model, for changes made without save and delete signals eg. update()'''
+    if model in _tracked:
+        bump_model_version(model)
+        
+        
+def _bump(sender, **kwargs):
+    bump_model_version(sender)
+    
+
+def track_model(model):
+    
+    '''Bump the version of model whenever an instance is saved or deleted'''
+    
+    _tracked.add(model)
+    uid = 'generic.cache.' + _version_key(model)
+    post_save.connect(_bump, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(_bump, sender=model, weak=False, dispatch_uid=uid)
+
+
+def get_or_generate(key, generate, timeout, stale_timeout=30, lock_timeout=10):
+    
+    '''
+        Return the value cached under key, calling generate to create it when missing or expired.
+        
+        Protects against a stampede of regenerations - an expired value is kept for a further
+        stale_timeout seconds and served to everyone but the one request holding the regeneration
+        lock.  Requests arriving while a missing value is being generated wait up to lock_timeout
+        seconds for it before generating it themselves.
+    '''
+    
+    lock = key + '.lock'
+    entry = cache.get(key)
+    
+    if entry is not None:
+        expires, value = entry
+        if expires > time.time() or not cache.add(lock, 1, lock_timeout):
+            return value
+    elif not cache.add(lock, 1, lock_timeout):
+        deadline = time.time() + lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[1]
+        
+    try:
+        value = generate()
+        cache.set(key, (time.time() + timeout, value), timeout + stale_timeout)
+    finally:
+        cache.delete(lock)
+    return value
@@ -0,0 +1,291 @@
+'''
+    Deferred callbacks, run on a bounded worker pool once the current transaction has committed.
+    
+    defer(callback, *args, **kwargs) queues a call.  When the database transaction of the caller
+    commits the call is handed to the pool, if the transaction rolls back it is dropped.  Failed calls
+    are retried with exponential backoff, calls still failing after the retries are moved to the
+    quarantine table of the durable queue.  Where django has no transaction.on_commit, calls made
+    in an atomic block are held until the outermost block commits, and dropped if it rolls back.
+    
+    Settings -
+        GENERIC_CALLBACK_WORKERS - worker threads, defaults to 4
+        GENERIC_CALLBACK_QUEUE_SIZE - calls waiting for a worker before defer() runs them in the
+                                      caller, defaults to 1000
+        GENERIC_CALLBACK_RETRIES - retries of a failing call, defaults to 3
+        GENERIC_CALLBACK_BACKOFF - seconds before the first retry, doubled for each retry, defaults to 0.5
+        GENERIC_CALLBACK_QUEUE - path of a SQLite file recording queued calls until they have run, so
+                                 calls queued when the process stops run after restart.  Callbacks must
+                                 then be module level functions and arguments picklable.  Use a file per
+                                 process.  Recorded calls that can no longer be imported or unpickled are
+                                 logged and moved to its quarantine table.  Defaults to None
+'''
+
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from importlib import import_module
+from Queue import Queue, Full
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connection, connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+def callback_name(callback):
+    return '{0}.{1}'.format(getattr(callback, '__module__', None), getattr(callback, '__name__', repr(callback)))
+
+
+def import_callback(name):
+    module, attr = name.rsplit('.', 1)
+    return getattr(import_module(module), attr)
+
+
+class CallbackStats(object):
+    
+    '''Calls, failures and latency of one callback'''
+    
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        
+    def as_dict(self):
+        return dict(vars(self))
+        
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, seconds, failed, retry):
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = CallbackStats()
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        if failed:
+            stats.failures += 1
+        if retry:
+            stats.retries += 1
+            
+
+def callback_stats():
+    '''Return stats of every deferred callback keyed by name'''
+    with _stats_lock:
+        return dict((name, stats.as_dict()) for name, stats in _stats.items())
+    
+    
+class DurableQueue(object):
+    
+    '''SQLite record of queued calls, removed once they have run'''
+    
+    def __init__(self, path):
+        
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS callbacks (id INTEGER PRIMARY KEY, callback TEXT, payload BLOB)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS quarantine (id INTEGER PRIMARY KEY, callback TEXT, payload BLOB)')
+            
+    def put(self, callback, args, kwargs):
+        payload = sqlite3.Binary(pickle.dumps((args, kwargs), pickle.HIGHEST_PROTOCOL))
+        with self.lock, self.db:
+            return self.db.execute('INSERT INTO callbacks (callback, payload) VALUES (?, ?)', (callback_name(callback), payload)).lastrowid
+        
+    def remove(self, id):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM callbacks WHERE id = ?', (id, ))
+            
+    def quarantine(self, id):
+        '''Move a recorded call out of the queue, kept for inspection'''
+        with self.lock, self.db:
+            self.db.execute('INSERT INTO quarantine SELECT id, callback, payload FROM callbacks WHERE id = ?', (id, ))
+            self.db.execute('DELETE FROM callbacks WHERE id = ?', (id, ))
+            
+    def pending(self):
+        
+        '''Yield (id, callback, args, kwargs) of every recorded call, quarantining those that can't be loaded'''
+        
+        with self.lock:
+            rows = self.db.execute('SELECT id, callback, payload FROM callbacks ORDER BY id').fetchall()
+        for id, name, payload in rows:
+            try:
+                args, kwargs = pickle.loads(bytes(payload))
+                callback = import_callback(name)
+            except Exception:
+                logger.exception('Quarantined recorded call %s of %s', id, name)
+                self.quarantine(id)
+                continue
+            yield id, callback, args, kwargs
+            
+    
+class CallbackPool(object):
+    
+    '''Bounded pool of worker threads running callbacks with retries'''
+    
+    def __init__(self, workers=4, queue_size=1000, retries=3, backoff=0.5, durable=None):
+        
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.durable = durable
+        self.queue = Queue(queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+        
+    def start(self):
+        
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.work, name='generic.callbacks.{0}'.format(i))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+                
+        if self.durable is not None:
+            # calls left from a previous process
+            for id, callback, args, kwargs in self.durable.pending():
+                self.put(callback, args, kwargs, id)
+                
+    def submit(self, callback, args, kwargs):
+        # started first, so the replay of earlier calls doesn't pick up this one
+        self.start()
+        id = self.durable.put(callback, args, kwargs) if self.durable is not None else None
+        self.put(callback, args, kwargs, id)
+        
+    def put(self, callback, args, kwargs, id=None):
+        try:
+            self.queue.put_nowait((callback, args, kwargs, 0, id))
+        except Full:
+            # back pressure - run in the caller rather than queue without bound
+            logger.warning('Callback queue full, running %s in caller', callback_name(callback))
+            self.call(callback, args, kwargs, self.retries, id)
+            
+    def call(self, callback, args, kwargs, attempt, id):
+        
+        '''Run a call once, returning True when it should be retried'''
+        
+        start = default_timer()
+        try:
+            callback(*args, **kwargs)
+        except Exception:
+            retry = attempt < self.retries
+            _record(callback_name(callback), default_timer() - start, True, retry)
+            logger.exception('Callback %s failed, attempt %s', callback_name(callback), attempt + 1)
+            if retry:
+                return True
+            if id is not None:
+                # kept for inspection
+                self.durable.quarantine(id)
+            return False
+        else:
+            _record(callback_name(callback), default_timer() - start, False, False)
+            
+        if id is not None:
+            self.durable.remove(id)
+        return False
+            
+    def work(self):
+        
+        while True:
+            callback, args, kwargs, attempt, id = self.queue.get()
+            try:
+                while True:
+                    # worker connections outlive requests, drop those the server has timed out or closed
+                    close_old_connections()
+                    retry = self.call(callback, args, kwargs, attempt, id)
+                    close_old_connections()
+                    if not retry:
+                        break
+                    time.sleep(self.backoff * 2 ** attempt)
+                    attempt += 1
+            finally:
+                self.queue.task_done()
+                
+                
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    
+    '''Return the process's callback pool, configured from settings'''
+    
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            path = getattr(settings, 'GENERIC_CALLBACK_QUEUE', None)
+            _pool = CallbackPool(
+                workers=getattr(settings, 'GENERIC_CALLBACK_WORKERS', 4),
+                queue_size=getattr(settings, 'GENERIC_CALLBACK_QUEUE_SIZE', 1000),
+                retries=getattr(settings, 'GENERIC_CALLBACK_RETRIES', 3),
+                backoff=getattr(settings, 'GENERIC_CALLBACK_BACKOFF', 0.5),
+                durable=DurableQueue(path) if path else None,
+            )
+        return _pool
+    
+
+# calls waiting for the transaction of the thread's connection, where there is no transaction.on_commit
+_local = threading.local()
+
+
+def _hold(submit):
+    
+    '''
+        Hold submit until the outermost atomic block of the default connection commits, dropping it if
+        the block rolls back.  The connection's commit, rollback and close are wrapped while calls are held
+    '''
+    
+    if getattr(_local, 'pending', None) is None:
+        _local.pending = []
+        wrapper = connections[DEFAULT_DB_ALIAS]
+        commit, rollback, close = wrapper.commit, wrapper.rollback, wrapper.close
+        
+        def release():
+            pending, _local.pending = _local.pending, None
+            del wrapper.commit, wrapper.rollback, wrapper.close
+            return pending
+        
+        def held_commit():
+            commit()
+            for submit in release():
+                submit()
+                
+        def held_rollback():
+            release()
+            rollback()
+            
+        def held_close():
+            # closed mid transaction, which rolls it back
+            if wrapper.in_atomic_block:
+                release()
+            close()
+            
+        wrapper.commit, wrapper.rollback, wrapper.close = held_commit, held_rollback, held_close
+    _local.pending.append(submit)
+    
+
+def defer(callback, *args, **kwargs):
+    
+    '''Run callback(*args, **kwargs) on the worker pool after the current transaction commits'''
+    
+    submit = lambda: get_pool().submit(callback, args, kwargs)
+    
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(submit)
+    elif connection.in_atomic_block:
+        _hold(submit)
+    else:
+        # autocommit, the write is already committed
+        submit()
@@ -0,0 +1,142 @@
+'''
+    Background deletion of objects with large cascades.
+    
+    GenericDeleteView with background_delete=True queues the object as a DeletionTask and returns.
+    process() then deletes the object's cascaded children in chunks of chunk_size rows, each chunk
+    in its own transaction, before deleting the object itself.  Every chunk is a complete delete, so
+    a task interrupted by a crash is simply taken up again and continues with the rows left.
+    
+    Run the worker with the process_deletions management command, or start_worker() for a thread in
+    the web process.
+'''
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import CASCADE, F, Q
+from django.utils import timezone
+
+from generic.models import DeletionTask
+
+
+logger = logging.getLogger(__name__)
+
+
+def cascades(object):
+    
+    '''Yield querysets of the rows deleted along with object - reverse CASCADE foreign keys and generic relations'''
+    
+    opts = object._meta
+    for related in opts.get_all_related_objects(include_hidden=True):
+        if related.field.rel.on_delete is CASCADE:
+            # the model holding the foreign key, related.model is the target on newer django
+            yield related.field.model._base_manager.filter(**{related.field.name: object})
+    for field in opts.virtual_fields:
+        if hasattr(field, 'bulk_related_objects'):
+            yield field.bulk_related_objects([object])
+            
+
+def delete_chunked(queryset, chunk_size, progress):
+    
+    '''Delete the rows of queryset chunk_size at a time, calling progress(rows) after each chunk'''
+    
+    model = queryset.model
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        with transaction.atomic():
+            model._base_manager.filter(pk__in=pks).delete()
+        progress(len(pks))
+        
+        
+def run_task(task, chunk_size=500):
+    
+    '''Delete the object of a claimed task, recording progress on the task'''
+    
+    model = task.content_type.model_class()
+    try:
+        object = model._base_manager.get(pk=task.object_id)
+    except model.DoesNotExist:
+        object = None
+        
+    def progress(rows):
+        DeletionTask.objects.filter(pk=task.pk).update(deleted=F('deleted') + rows, heartbeat=timezone.now())
+        
+    if object is not None:
+        for queryset in cascades(object):
+            delete_chunked(queryset, chunk_size, progress)
+        with transaction.atomic():
+            object.delete()
+        progress(1)
+        
+    DeletionTask.objects.filter(pk=task.pk).update(status=DeletionTask.DONE, heartbeat=timezone.now())
+    
+    
+def claim(stale_timeout=300):
+    
+    '''
+        Claim the next task for this worker, or return None when there are none.  Running tasks whose
+        heartbeat is older than stale_timeout seconds are claimed again.
+    '''
+    
+    stale = timezone.now() - timedelta(seconds=stale_timeout)
+    claimable = Q(status=DeletionTask.PENDING) | Q(status=DeletionTask.RUNNING, heartbeat__lt=stale)
+    
+    for task in DeletionTask.objects.filter(claimable).order_by('created_date', 'pk')[:10]:
+        # the conditional update only succeeds for one of several competing workers
+        claimed = DeletionTask.objects.filter(pk=task.pk, status=task.status, heartbeat=task.heartbeat).update(
+            status=DeletionTask.RUNNING, heartbeat=timezone.now(), attempts=F('attempts') + 1
+        )
+        if claimed:
+            return DeletionTask.objects.get(pk=task.pk)
+    return None
+
+
+def process(limit=None, chunk_size=500, stale_timeout=300, max_attempts=3):
+    
+    '''Run queued tasks until the queue is empty or limit tasks have run, returns the number run'''
+    
+    count = 0
+    while limit is None or count < limit:
+        task = claim(stale_timeout)
+        if task is None:
+            break
+        count += 1
+        
+        try:
+            run_task(task, chunk_size)
+        except Exception as e:
+            logger.exception('Deletion of %s %s failed', task.content_type, task.object_id)
+            status = DeletionTask.FAILED if task.attempts >= max_attempts else DeletionTask.PENDING
+            DeletionTask.objects.filter(pk=task.pk).update(status=status, error=repr(e))
+    return count
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(interval=5, **options):
+    
+    '''Start a daemon thread processing the queue every interval seconds, once per process'''
+    
+    global _worker
+    
+    def work():
+        while True:
+            try:
+                process(**options)
+            except Exception:
+                logger.exception('Deletion worker failed')
+            time.sleep(interval)
+            
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=work, name='generic.deletion')
+            _worker.daemon = True
+            _worker.start()
+    return _worker
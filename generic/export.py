@@ -0,0 +1,72 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import force_bytes
+
+from generic.paginator import keyset_filter, keyset_ordering, nulls_largest
+
+
+def iter_rows(queryset, fields, chunk_size=2000):
+    
+    '''
+        Yield values_list rows of fields from queryset, fetching chunk_size rows per query.
+        
+        Chunks are selected by keyset on the queryset ordering plus pk rather than by offset, so
+        memory stays flat and every chunk costs the same however deep into the queryset it is.
+        Nullable sort fields are followed past NULLs with isnull conditions
+    '''
+    
+    ordering = keyset_ordering(queryset)
+    nulls = nulls_largest(queryset)
+    width = len(fields)
+    
+    # the sort values of the last row of each chunk are fetched alongside the exported fields
+    rows = queryset.order_by(*ordering).values_list(*(list(fields) + [field.lstrip('-') for field in ordering]))
+    
+    chunk = list(rows[:chunk_size])
+    while chunk:
+        for row in chunk:
+            yield row[:width]
+        if len(chunk) < chunk_size:
+            break
+        chunk = list(rows.filter(keyset_filter(ordering, chunk[-1][width:], nulls_largest=nulls))[:chunk_size])
+        
+        
+class _Echo(object):
+    
+    '''File-like object for csv.writer returning each written line rather than storing it'''
+    
+    def write(self, value):
+        return value
+    
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    return force_bytes(value)
+
+
+def csv_lines(rows, fields):
+    
+    '''Yield CSV lines for rows, starting with a header of fields'''
+    
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+        
+
+def json_lines(rows, fields):
+    
+    '''Yield newline delimited JSON objects for rows'''
+    
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+        
+        
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'json': (json_lines, 'application/x-ndjson'),
+}
@@ -0,0 +1,78 @@
+from hashlib import md5
+
+from django.core.cache import cache
+from django.forms import ChoiceField, ModelChoiceField, TextInput
+from django.forms.models import ModelChoiceIterator
+from django.utils.encoding import force_bytes
+
+from generic.cache import get_model_version, track_model
+
+
+class CachedModelChoiceField(ModelChoiceField):
+    
+    '''
+        ModelChoiceField which caches its choice list rather than loading the related table on every render.
+        
+        The cached choices are invalidated whenever an instance of the related model is saved or deleted.
+        Validation still looks up the submitted value in the queryset.
+        
+        Options -
+            cache_timeout - seconds to cache the choices, defaults to 300
+            max_choices - largest number of choices listed, defaults to 500.  Above it no choices
+                          are loaded or cached and the field falls back to lookup_widget, where the
+                          value (the pk or to_field_name) is entered directly
+    '''
+    
+    cache_timeout = 300
+    max_choices = 500
+    lookup_widget = TextInput
+    limited = False
+    
+    def __init__(self, queryset, **kwargs):
+        
+        self.cache_timeout = kwargs.pop('cache_timeout', self.cache_timeout)
+        self.max_choices = kwargs.pop('max_choices', self.max_choices)
+        
+        # ModelChoiceField reads the choices while setting its queryset, before to_field_name is set
+        self.to_field_name = kwargs.get('to_field_name')
+        
+        super(CachedModelChoiceField, self).__init__(queryset, **kwargs)
+        
+        track_model(queryset.model)
+    
+    def _get_choices(self):
+        
+        if hasattr(self, '_choices'):
+            return self._choices
+        
+        model = self.queryset.model
+        query = md5(force_bytes(str(self.queryset.query))).hexdigest()
+        key = 'generic.choices.{0}.{1}.{2}.{3}'.format(model._meta.app_label, model._meta.object_name.lower(), get_model_version(model), query)
+        
+        choices = cache.get(key)
+        if choices is None:
+            # one row past the limit tells a large table apart without counting it
+            objects = list(self.queryset[:self.max_choices + 1])
+            if len(objects) > self.max_choices:
+                choices = False
+            else:
+                iterator = ModelChoiceIterator(self)
+                choices = [(u'', self.empty_label)] if self.empty_label is not None else []
+                choices.extend(iterator.choice(obj) for obj in objects)
+            cache.set(key, choices, self.cache_timeout)
+        
+        self.limited = choices is False
+        return [] if self.limited else choices
+    
+    choices = property(_get_choices, ChoiceField._set_choices)
+    
+    def _set_queryset(self, queryset):
+        
+        ModelChoiceField._set_queryset(self, queryset)
+        
+        if self.limited and not isinstance(self.widget, self.lookup_widget):
+            widget = self.lookup_widget(attrs=self.widget.attrs)
+            widget.is_required = self.widget.is_required
+            self.widget = widget
+    
+    queryset = property(ModelChoiceField._get_queryset, _set_queryset)
@@ -0,0 +1,43 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from generic.deletion import process
+from generic.models import DeletionTask
+
+
+class Command(NoArgsCommand):
+    
+    help = 'Run queued background deletions, or show their progress with --status'
+    
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', type='int', dest='chunk_size', default=500,
+            help='Rows deleted per transaction'),
+        make_option('--stale-timeout', type='int', dest='stale_timeout', default=300,
+            help='Seconds without progress before a running task is taken up by another worker'),
+        make_option('--max-attempts', type='int', dest='max_attempts', default=3,
+            help='Attempts before a task is marked failed'),
+        make_option('--loop', type='int', dest='loop', default=None,
+            help='Keep running, checking the queue every LOOP seconds'),
+        make_option('--status', action='store_true', dest='status', default=False,
+            help='List outstanding tasks and their progress'),
+    )
+    
+    def handle_noargs(self, **options):
+        
+        if options['status']:
+            tasks = DeletionTask.objects.exclude(status=DeletionTask.DONE).select_related('content_type').order_by('created_date')
+            for task in tasks:
+                self.stdout.write('{0} {1} {2} - {3}, {4} rows deleted, {5} attempts, last progress {6}'.format(
+                    task.content_type, task.object_id, task.created_date, task.status, task.deleted, task.attempts, task.heartbeat
+                ))
+            return
+        
+        while True:
+            count = process(chunk_size=options['chunk_size'], stale_timeout=options['stale_timeout'], max_attempts=options['max_attempts'])
+            if count:
+                self.stdout.write('Ran {0} deletions'.format(count))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
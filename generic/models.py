@@ -1,3 +1,74 @@
 from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.generic import GenericForeignKey
 
-# Create your models here.
+
+class DeletionTaskManager(models.Manager):
+    
+    def outstanding(self, model):
+        '''Return tasks of model that are pending or running'''
+        content_type = ContentType.objects.get_for_model(model)
+        return self.filter(content_type=content_type, status__in=[DeletionTask.PENDING, DeletionTask.RUNNING])
+    
+    def schedule(self, object):
+        
+        '''Queue object for background deletion, returns the task'''
+        
+        content_type = ContentType.objects.get_for_model(object)
+        task, created = self.get_or_create(content_type=content_type, object_id=object.pk)
+        if not created and task.status != DeletionTask.RUNNING:
+            # a failed or finished task for a recreated pk
+            task.status = DeletionTask.PENDING
+            task.deleted = task.attempts = 0
+            task.error = ''
+            task.save()
+        return task
+    
+
+class DeletionTask(models.Model):
+    
+    '''
+        Object queued for deletion in the background, see GenericDeleteView.background_delete.
+        
+        Objects are hidden from generic views from the time they are queued until the task is done.
+        Objects of failed tasks are shown again, with the cascaded rows deleted so far, and deleting
+        them again queues a fresh task.
+        deleted counts rows removed so far and heartbeat is updated after every chunk, running tasks
+        with an old heartbeat were abandoned by a worker and are taken up again.
+        
+        NOTE -
+            object_id is an integer, so only models with integer pks can be deleted in the background.
+            Views raise ImproperlyConfigured for other models
+    '''
+    
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    object = GenericForeignKey()
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    deleted = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    
+    objects = DeletionTaskManager()
+    
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+        index_together = [['status', 'heartbeat']]
+        
+    def __unicode__(self):
+        return 'Delete {0} {1} - {2}, {3} rows'.format(self.content_type, self.object_id, self.status, self.deleted)
@@ -0,0 +1,465 @@
+import re
+import json
+import datetime
+from hashlib import md5
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.paginator import Paginator, PageNotAnInteger
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.encoding import force_bytes
+
+from generic.cache import get_model_version
+
+
+def _path_field(model, field):
+
+    '''Return the model field a field path (eg. user__username) ends on, or None if it can't be followed'''
+
+    db_field = None
+    try:
+        for attr in field.split('__'):
+            if db_field is not None:
+                model = db_field.rel.to
+            db_field = model._meta.pk if attr == 'pk' else model._meta.get_field(attr)
+    except (AttributeError, FieldDoesNotExist):
+        # reverse relations and non-relation lookups
+        return None
+    return db_field
+
+
+def keyset_field(model, field):
+
+    '''Return the name a sort field seeks on - a foreign key's related pk (field__pk), otherwise field'''
+
+    db_field = _path_field(model, field.lstrip('-'))
+    if db_field is not None and db_field.rel is not None:
+        return field + '__pk'
+    return field
+
+
+def keyset_ordering(queryset):
+
+    '''
+        Return the ordering of a queryset as a list of field names with a trailing pk tiebreaker.
+
+        Uses the explicit order_by of the queryset (as applied by SortMixin) falling back to the
+        model's default ordering.  Foreign keys sort by the related pk (field__pk) rather than the
+        related model's ordering, so rows compare on the id stored with them
+    '''
+
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+
+    # random ordering and expressions can't be used to seek
+    ordering = [keyset_field(queryset.model, field) for field in ordering if isinstance(field, basestring) and field != '?']
+
+    if not [field for field in ordering if field.lstrip('-') in ('pk', queryset.model._meta.pk.name)]:
+        # follow the direction of the last sort field so the tiebreaker can share its index
+        if ordering and ordering[-1].startswith('-'):
+            ordering.append('-pk')
+        else:
+            ordering.append('pk')
+
+    return ordering
+
+
+def nulls_largest(queryset):
+    '''Return whether the database of queryset sorts NULLs after every other value'''
+    return connections[queryset.db].vendor in ('postgresql', 'oracle')
+
+
+def _equal(name, value):
+    if value is None:
+        return Q(**{name + '__isnull': True})
+    return Q(**{name: value})
+
+
+def _beyond(name, value, descending, nulls_last):
+
+    '''Return a Q object selecting values of name that come after value, or None when none can'''
+
+    if value is None:
+        # NULLs are the last values, or followed by every other value
+        return None if nulls_last else Q(**{name + '__isnull': False})
+    condition = Q(**{'{0}__{1}'.format(name, 'lt' if descending else 'gt'): value})
+    if nulls_last:
+        condition |= Q(**{name + '__isnull': True})
+    return condition
+
+
+def keyset_filter(ordering, values, reverse=False, nulls_largest=False):
+
+    '''
+        Build a Q object selecting rows that come after values in ordering, ie. the equivalent of
+        WHERE (a, b, pk) > (x, y, z) expanded to (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+
+        Descending fields compare with lt, reverse=True selects rows that come before values.  NULL
+        values compare with isnull, placed where the database sorts them - nulls_largest for
+        PostgreSQL and Oracle, see nulls_largest()
+    '''
+
+    q = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+
+        # all previous fields equal and this field beyond the cursor
+        condition = _beyond(name, values[i], descending, nulls_largest != descending)
+        if condition is None:
+            continue
+        for previous, value in zip(ordering[:i], values[:i]):
+            condition &= _equal(previous.lstrip('-'), value)
+        q |= condition
+
+    return q
+
+
+def row_value(row, field):
+
+    '''
+        Return value of possibly related field path (eg. user__username) from a model instance or
+        values() dict.  A foreign key pk (eg. user__pk) is read from the key's column without loading
+        the related object
+    '''
+
+    if isinstance(row, dict):
+        return row[field]
+
+    attrs = field.split('__')
+    value = row
+    for i, attr in enumerate(attrs):
+        if value is None:
+            break
+        if attrs[i + 1:] == ['pk']:
+            foreign_keys = [db_field for db_field in value._meta.fields if db_field.name == attr and db_field.rel is not None]
+            if foreign_keys:
+                return getattr(value, foreign_keys[0].attname)
+        value = getattr(value, attr)
+    return value
+
+
+def sort_field(model, field):
+
+    '''Return the model field the values of a sort field path are compared as, foreign keys as their target field'''
+
+    db_field = _path_field(model, field)
+    while db_field is not None and db_field.rel is not None:
+        db_field = db_field.rel.get_related_field()
+    return db_field
+
+
+class KeysetPage(object):
+
+    '''
+        Single page of a KeysetPaginator.  Similar interface to django.core.paginator.Page, but with
+        opaque cursors in place of page numbers
+    '''
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of {0} objects>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+        return None
+
+
+class KeysetPaginator(object):
+
+    '''
+        Keyset (seek) paginator.  Rather than LIMIT/OFFSET each page is selected with a WHERE clause
+        on the sort fields of the queryset plus a pk tiebreaker, so deep pages cost the same as the first.
+
+        Pages are requested by opaque cursor rather than page number, an invalid or missing cursor
+        returns the first page, as does a cursor whose values don't convert to the sort fields' types.
+        There is no count so num_pages is unavailable.
+
+        NOTE -
+            foreign key sort fields are encoded as ids, other values must be JSON serialisable
+            with DjangoJSONEncoder
+    '''
+
+    def __init__(self, object_list, per_page):
+
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = keyset_ordering(object_list)
+        self.fields = [sort_field(object_list.model, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, row, reverse=False):
+
+        values = [row_value(row, field.lstrip('-')) for field in self.ordering]
+        # DjangoJSONEncoder drops microseconds, which would skip or repeat rows
+        values = [value.isoformat() if isinstance(value, (datetime.datetime, datetime.time)) else value
+                  for value in values]
+        data = json.dumps([reverse, values], cls=DjangoJSONEncoder, separators=(',', ':'))
+        return urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+
+        try:
+            cursor = str(cursor)
+            data = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            reverse, values = json.loads(data.decode('utf-8'))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                return None
+            values = [field.to_python(value) if field is not None else value
+                      for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            return None
+
+        return bool(reverse), values
+
+    def page(self, cursor):
+
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            objects = list(self.object_list.order_by(*self.ordering)[:self.per_page + 1])
+            return KeysetPage(objects[:self.per_page], self, len(objects) > self.per_page, False)
+
+        reverse, values = decoded
+        queryset = self.object_list.filter(keyset_filter(self.ordering, values, reverse, nulls_largest(self.object_list)))
+
+        if reverse:
+            # walk backwards from the cursor, then restore display order
+            ordering = [field[1:] if field.startswith('-') else '-' + field for field in self.ordering]
+            objects = list(queryset.order_by(*ordering)[:self.per_page + 1])
+            has_previous = len(objects) > self.per_page
+            objects = objects[:self.per_page]
+            objects.reverse()
+            return KeysetPage(objects, self, True, has_previous)
+
+        objects = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+        return KeysetPage(objects[:self.per_page], self, len(objects) > self.per_page, True)
+
+
+class CachedCountPaginator(Paginator):
+
+    '''
+        Paginator which caches the object count for cache_timeout seconds.  The cache key is built from
+        the filtered SQL with ordering removed, so each filter state has its own count shared by all sorts,
+        and the model version so counts are dropped when rows change
+    '''
+
+    cache_timeout = 300
+
+    def _get_count(self):
+
+        if self._count is None:
+            try:
+                sql, params = self.object_list.order_by().query.sql_with_params()
+            except EmptyResultSet:
+                self._count = 0
+                return self._count
+
+            model = self.object_list.model
+            key = 'generic.count.{0}.{1}.{2}'.format(model._meta.db_table, get_model_version(model), md5(force_bytes(repr((sql, params)))).hexdigest())
+            self._count = cache.get(key)
+            if self._count is None:
+                self._count = self.object_list.count()
+                cache.set(key, self._count, self.cache_timeout)
+
+        return self._count
+    count = property(_get_count)
+
+
+def estimate_count(queryset):
+
+    '''
+        Return the query planner's estimate of the number of rows in queryset.  Supports PostgreSQL
+        and MySQL, returns None for other databases or when the plan can't be read.
+    '''
+
+    connection = connections[queryset.db]
+    if connection.vendor not in ('postgresql', 'mysql'):
+        return None
+
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN ' + sql, params)
+
+    if connection.vendor == 'postgresql':
+        # top plan node looks like: Seq Scan on app_model  (cost=0.00..1.00 rows=1234 width=8)
+        match = re.search(r'rows=(\d+)', cursor.fetchone()[0])
+        return int(match.group(1)) if match else None
+
+    return mysql_estimate([column[0] for column in cursor.description], cursor.fetchall())
+
+
+def mysql_estimate(columns, rows):
+
+    '''
+        Return the number of result rows estimated by MySQL EXPLAIN output, None where it has no rows
+        column.  Each table of the outer select is joined to the ones before, so the estimate is the
+        product of their rows scaled by the percentage their conditions keep (filtered, MySQL 5.7+)
+    '''
+
+    if not rows or 'rows' not in columns:
+        return None
+
+    # rows of subqueries have their own select id, the outer select comes first
+    select = columns.index('id')
+    filtered = columns.index('filtered') if 'filtered' in columns else None
+
+    estimate = 1.0
+    for row in rows:
+        if row[select] != rows[0][select]:
+            continue
+        estimate *= float(row[columns.index('rows')] or 0)
+        if filtered is not None and row[filtered] is not None:
+            estimate *= float(row[filtered]) / 100
+    return int(round(estimate))
+
+
+class EstimatedCountPaginator(Paginator):
+
+    '''
+        Paginator using the database planner statistics in place of COUNT(*).
+
+        Estimates below exact_threshold are replaced with an exact count as planner statistics are
+        unreliable for small results.  Falls back to an exact count where no estimate is available.
+    '''
+
+    exact_threshold = 1000
+
+    def _get_count(self):
+
+        if self._count is None:
+            estimate = estimate_count(self.object_list)
+            if estimate is None or estimate < self.exact_threshold:
+                self._count = self.object_list.count()
+            else:
+                self._count = estimate
+
+        return self._count
+    count = property(_get_count)
+
+
+class CountlessPage(object):
+
+    '''
+        Single page of a CountlessPaginator.  Knows only whether neighbouring pages exist
+    '''
+
+    def __init__(self, object_list, number, paginator, has_next):
+
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page {0}>'.format(self.number)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class CountlessPaginator(object):
+
+    '''
+        Page number paginator that never counts.  Fetches page_size + 1 rows to find whether there is
+        a following page, so count and num_pages are unavailable.
+    '''
+
+    def __init__(self, object_list, per_page):
+
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    def page(self, number):
+
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return CountlessPage(objects[:self.per_page], number, self, len(objects) > self.per_page)
+
+
+COUNT_STRATEGIES = {
+    'exact': Paginator,
+    'cached': CachedCountPaginator,
+    'estimate': EstimatedCountPaginator,
+    'none': CountlessPaginator,
+}
+
+
+def count_paginator(strategy, cache_timeout=None):
+
+    '''
+        Return the paginator class for a count strategy - exact, cached, estimate or none
+    '''
+
+    try:
+        paginator = COUNT_STRATEGIES[strategy]
+    except KeyError:
+        raise ImproperlyConfigured("Unknown count strategy '%s'" % strategy)
+
+    if strategy == 'cached' and cache_timeout is not None:
+        paginator = type(paginator.__name__, (paginator, ), {'cache_timeout': cache_timeout})
+    return paginator
@@ -0,0 +1,337 @@
+'''
+    Field projection from templates.
+    
+    template_projection() reads a compiled template for the attributes it uses of the view's objects -
+    object.* for single object views, and the loop variables of {% for %} over object_list for list
+    views - and maps them onto model fields.  Views then load only those fields, with select_related
+    for the relations the template follows.
+    
+    Extended and included templates are read too, and an {% include %} of a template name only known
+    at render time loads the objects whole.
+    
+    Attributes the template can't be seen to use are not loaded - those used by methods, properties,
+    custom tags and python code.  Name them in the view's projection_extra option, and set
+    GENERIC_PROJECTION_WARNINGS to True to log a warning whenever a deferred field is loaded while a
+    projecting view handles a request.
+    
+    related_lookups() maps the same attribute paths onto select_related and prefetch_related lookups,
+    for views with related='auto'.
+'''
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.query_utils import DeferredAttribute
+from django.template.base import FilterExpression, Node, NodeList, Template, Variable
+from django.template.defaulttags import ForNode, IfNode, WithNode
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+try:
+    from django.template.loader_tags import ConstantIncludeNode
+except ImportError:
+    # django 1.7 and later compile every include to IncludeNode
+    ConstantIncludeNode = None
+from django.template.smartif import TokenBase
+
+
+logger = logging.getLogger(__name__)
+
+# depth of projecting views handling a request in the thread, deferred loads are only logged within them
+_warnings = threading.local()
+
+
+class Uses(object):
+    
+    '''Attribute paths a template uses of its objects, and whether it uses the objects themselves'''
+    
+    def __init__(self):
+        self.paths = set()
+        self.whole = False
+        
+
+def _lookups(expression):
+    
+    '''Yield the variable lookups of a FilterExpression, including filter arguments'''
+    
+    if isinstance(expression.var, Variable) and expression.var.lookups:
+        yield expression.var.lookups
+    for func, args in expression.filters:
+        for lookup, arg in args:
+            if lookup and arg.lookups:
+                yield arg.lookups
+                
+                
+def _use(lookups, aliases, uses, bare_ok=False):
+    
+    root = lookups[0]
+    if root not in aliases:
+        return
+    path = aliases[root] + tuple(lookups[1:])
+    if path:
+        uses.paths.add(path)
+    elif not bare_ok:
+        # the object itself is rendered or handed to a tag, any of its fields may be read
+        uses.whole = True
+        
+        
+def _template(name):
+    '''Return the compiled template of name, unwrapped from the template backend on django 1.8'''
+    template = get_template(name)
+    return getattr(template, 'template', template)
+
+
+def _included(node):
+    
+    '''Return the compiled template an include renders, or None when its name is only known at render time'''
+    
+    # template_name on django 1.6, template on later versions
+    expression = getattr(node, 'template_name', None) or node.template
+    if not isinstance(expression, FilterExpression):
+        # a django 1.6 ConstantIncludeNode, loaded when compiled and rendering nothing when missing
+        return expression or NodeList()
+    if isinstance(expression.var, Variable) or expression.filters:
+        return None
+    return _template(expression.var)
+
+
+def _walk(value, aliases, sequences, uses, seen):
+    
+    if isinstance(value, (Node, Template)):
+        # once per node and aliases, a template may be included more than once or include itself.
+        # The node is kept so its id isn't reused by a template compiled later
+        key = (id(value), tuple(sorted(aliases.items())), tuple(sorted(sequences)))
+        if key in seen:
+            return
+        seen[key] = value
+        
+    if isinstance(value, ForNode):
+        inner = dict((name, path) for name, path in aliases.items() if name not in value.loopvars)
+        for lookups in _lookups(value.sequence):
+            _use(lookups, aliases, uses, bare_ok=True)
+            if len(lookups) == 1 and lookups[0] in sequences:
+                # loop over the objects, the loop variable is an object
+                inner[value.loopvars[0]] = ()
+        _walk(value.nodelist_loop, inner, sequences, uses, seen)
+        _walk(value.nodelist_empty, aliases, sequences, uses, seen)
+        
+    elif isinstance(value, WithNode):
+        inner = dict(aliases)
+        for name, expression in value.extra_context.items():
+            inner.pop(name, None)
+            for lookups in _lookups(expression):
+                _use(lookups, aliases, uses, bare_ok=True)
+                if lookups[0] in aliases:
+                    inner[name] = aliases[lookups[0]] + tuple(lookups[1:])
+        _walk(value.nodelist, inner, sequences, uses, seen)
+        
+    elif isinstance(value, IfNode):
+        for condition, nodelist in value.conditions_nodelists:
+            _walk_condition(condition, aliases, uses)
+            _walk(nodelist, aliases, sequences, uses, seen)
+            
+    elif isinstance(value, ExtendsNode):
+        if not isinstance(value.parent_name.var, Variable):
+            _walk(_template(value.parent_name.var), aliases, sequences, uses, seen)
+        _walk(value.nodelist, aliases, sequences, uses, seen)
+        
+    elif isinstance(value, IncludeNode) or (ConstantIncludeNode is not None and isinstance(value, ConstantIncludeNode)):
+        # the included template sees the context, or with only just its with arguments
+        inner = {} if value.isolated_context else dict(aliases)
+        inner_sequences = set() if value.isolated_context else set(sequences)
+        for name, expression in value.extra_context.items():
+            inner.pop(name, None)
+            inner_sequences.discard(name)
+            for lookups in _lookups(expression):
+                _use(lookups, aliases, uses, bare_ok=True)
+                if lookups[0] in aliases:
+                    inner[name] = aliases[lookups[0]] + tuple(lookups[1:])
+                elif len(lookups) == 1 and lookups[0] in sequences:
+                    inner_sequences.add(name)
+        template = _included(value)
+        if template is None:
+            # any template may be included, which may read any field
+            if inner or inner_sequences:
+                uses.whole = True
+        else:
+            _walk(template, inner, inner_sequences, uses, seen)
+        
+    elif isinstance(value, FilterExpression):
+        for lookups in _lookups(value):
+            _use(lookups, aliases, uses)
+            
+    elif isinstance(value, (Node, Template)):
+        for attr in vars(value).values():
+            _walk(attr, aliases, sequences, uses, seen)
+            
+    elif isinstance(value, (NodeList, list, tuple)):
+        for item in value:
+            _walk(item, aliases, sequences, uses, seen)
+            
+    elif isinstance(value, dict):
+        for item in value.values():
+            _walk(item, aliases, sequences, uses, seen)
+            
+            
+def _walk_condition(condition, aliases, uses):
+    
+    # truth tests of an object don't read its fields
+    if condition is None:
+        return
+    if isinstance(getattr(condition, 'value', None), FilterExpression):
+        for lookups in _lookups(condition.value):
+            _use(lookups, aliases, uses, bare_ok=True)
+    elif isinstance(condition, TokenBase):
+        _walk_condition(getattr(condition, 'first', None), aliases, uses)
+        _walk_condition(getattr(condition, 'second', None), aliases, uses)
+        
+
+def template_uses(template, objects=(), sequences=()):
+    
+    '''
+        Return Uses of a template, given the context names of single objects and sequences of objects
+    '''
+    
+    if isinstance(template, basestring):
+        template = _template(template)
+    template = getattr(template, 'template', template)
+        
+    uses = Uses()
+    _walk(template, dict((name, ()) for name in objects), set(sequences), uses, {})
+    return uses
+
+
+def _concrete_fields(model, prefix):
+    return [prefix + field.name for field in model._meta.fields]
+
+
+def project(model, paths):
+    
+    '''
+        Map attribute paths onto model fields, returning (only fields, select_related relations).
+        Paths that aren't fields, such as methods and reverse relations, are ignored.
+    '''
+    
+    fields = set()
+    relations = set()
+    
+    for path in paths:
+        current = model
+        prefix = ''
+        for i, attr in enumerate(path):
+            if attr == 'pk':
+                break
+            opts = current._meta
+            try:
+                field = opts.get_field(attr, many_to_many=False)
+            except FieldDoesNotExist:
+                attnames = [field for field in opts.fields if field.attname == attr]
+                if attnames:
+                    fields.add(prefix + attnames[0].name)
+                break
+            
+            if field.rel is None:
+                fields.add(prefix + field.name)
+                break
+            
+            # a related object, loaded with the same query
+            relations.add(prefix + field.name)
+            fields.add(prefix + field.name)
+            current = field.rel.to
+            prefix += field.name + '__'
+            if i == len(path) - 1:
+                # rendered itself, eg. {{ object.category }}
+                fields.update(_concrete_fields(current, prefix))
+                
+    # a relation's fields are only restricted where the template reads some of them
+    for relation in relations:
+        if not [field for field in fields if field.startswith(relation + '__')]:
+            related = model
+            for attr in relation.split('__'):
+                related = related._meta.get_field(attr).rel.to
+            fields.update(_concrete_fields(related, relation + '__'))
+            
+    return sorted(fields), sorted(relations)
+
+
+def _many_valued(opts):
+    
+    '''Return attribute names of the many valued relations - many to many, generic and reverse foreign keys'''
+    
+    names = set(field.name for field in opts.many_to_many)
+    names.update(field.name for field in opts.virtual_fields if hasattr(field, 'bulk_related_objects'))
+    names.update(related.get_accessor_name() for related in opts.get_all_related_objects() + opts.get_all_related_many_to_many_objects())
+    return names
+
+
+def related_lookups(model, paths):
+    
+    '''
+        Map attribute paths onto relation lookups, returning (select_related lookups, prefetch_related
+        lookups).  Forward foreign keys along a path are joined, and the first many valued relation
+        reached is prefetched.
+    '''
+    
+    select = set()
+    prefetch = set()
+    
+    for path in paths:
+        current = model
+        prefix = ''
+        for attr in path:
+            opts = current._meta
+            fields = [field for field in opts.fields if field.name == attr]
+            if fields and fields[0].rel is not None:
+                select.add(prefix + attr)
+                current = fields[0].rel.to
+                prefix += attr + '__'
+                continue
+            if attr in _many_valued(opts):
+                prefetch.add(prefix + attr)
+            break
+            
+    return sorted(select), sorted(prefetch)
+
+
+def template_projection(model, template, objects=(), sequences=(), extra=()):
+    
+    '''
+        Return (only fields, select_related relations) for the objects of model used by template, or
+        None when the objects are used whole
+    '''
+    
+    uses = template_uses(template, objects, sequences)
+    if uses.whole:
+        return None
+    return project(model, uses.paths | set(tuple(field.split('__')) for field in extra))
+
+
+def warn_deferred_loads():
+    
+    '''
+        Install logging of deferred field loads, with the model and field, made within a
+        deferred_load_warnings() block
+    '''
+    
+    if getattr(DeferredAttribute, '_warns', False):
+        return
+    get = DeferredAttribute.__get__
+    
+    def __get__(self, instance, owner):
+        if instance is not None and getattr(_warnings, 'depth', 0) and instance.__dict__.get(self.field_name, self) is self:
+            logger.warning('Deferred field %s.%s loaded, add it to projection_extra', instance._meta.proxy_for_model.__name__, self.field_name)
+        return get(self, instance, owner)
+    
+    DeferredAttribute.__get__ = __get__
+    DeferredAttribute._warns = True
+    
+    
+@contextmanager
+def deferred_load_warnings():
+    '''Log deferred field loads made by the thread within the block, see warn_deferred_loads'''
+    _warnings.depth = getattr(_warnings, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _warnings.depth -= 1
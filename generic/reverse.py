@@ -0,0 +1,117 @@
+'''
+    Cached reverse() for named URLConfs.
+    
+    The first reverse of a name takes the resolver's URL templates for it, split into literal text
+    and parameter names, along with the compiled patterns that validate them.  Later reverses of the
+    name only substitute and validate the parameters.  Names that can't be handled this way, such as
+    namespaced names, views given as callables and positional args, go through django's reverse().
+'''
+
+import re
+
+from django.core.urlresolvers import NoReverseMatch, get_resolver, get_script_prefix, get_urlconf, reverse
+from django.test.signals import setting_changed
+from django.utils.encoding import force_text, iri_to_uri
+from django.utils.http import urlquote
+from django.utils.regex_helper import normalize
+from django.utils.translation import get_language
+
+try:
+    # django 1.8 reverse() leaves the RFC 3986 sub-delimiters and ~:@ unquoted in parameters
+    from django.utils.http import RFC3986_SUBDELIMS
+    _safe = RFC3986_SUBDELIMS + str('/~:@')
+except ImportError:
+    _safe = '/'
+
+
+# (urlconf, script prefix, language, name) -> compiled templates, or None to use reverse()
+_templates = {}
+
+_parameter = re.compile(r'%\((\w+)\)s')
+
+
+def _split(template):
+    '''Split a resolver URL template into alternating literal text and parameter names'''
+    parts = _parameter.split(template)
+    for i in range(0, len(parts), 2):
+        parts[i] = parts[i].replace('%%', '%')
+    return parts
+
+
+def _compile(name):
+    
+    prefix, prefix_args = normalize(urlquote(get_script_prefix()))[0]
+    possibilities = get_resolver(get_urlconf()).reverse_dict.getlist(name)
+    if prefix_args or not possibilities:
+        return None
+    
+    templates = []
+    for possibility, pattern, defaults in possibilities:
+        regex = re.compile('^%s%s' % (prefix, pattern), re.UNICODE)
+        for result, params in possibility:
+            templates.append((_split(prefix.replace('%', '%%') + result), set(params), defaults, regex))
+    return templates
+
+
+def _substitute(parts, values):
+    return ''.join(part if i % 2 == 0 else values[part] for i, part in enumerate(parts))
+
+
+def cached_reverse(viewname, args=None, kwargs=None):
+    
+    '''Return the url of the URLConf named viewname, as django.core.urlresolvers.reverse'''
+    
+    if args or not isinstance(viewname, basestring) or ':' in viewname:
+        return reverse(viewname, args=args, kwargs=kwargs)
+    
+    key = (get_urlconf(), get_script_prefix(), get_language(), viewname)
+    try:
+        templates = _templates[key]
+    except KeyError:
+        templates = _templates[key] = _compile(viewname)
+    if templates is None:
+        return reverse(viewname, kwargs=kwargs)
+    
+    kwargs = kwargs or {}
+    values = dict((key, force_text(value)) for key, value in kwargs.items())
+    
+    # the same matching rules as RegexURLResolver._reverse_with_prefix
+    for parts, params, defaults, regex in templates:
+        if set(kwargs) | set(defaults) != params | set(defaults):
+            continue
+        if [key for key, value in defaults.items() if kwargs.get(key, value) != value]:
+            continue
+        if regex.search(_substitute(parts, values)):
+            url = _substitute(parts, dict((key, urlquote(value, safe=_safe)) for key, value in values.items()))
+            # never a scheme relative url, which would redirect to another host
+            if url.startswith('//'):
+                url = '/%2F' + url[2:]
+            return iri_to_uri(url)
+        
+    # let reverse() raise NoReverseMatch with its description of the patterns tried
+    return reverse(viewname, kwargs=kwargs)
+
+
+def cached_resolve_url(to, kwargs=None):
+    
+    '''Return the url of the URLConf named to, or to itself where it's already a url'''
+    
+    if '/' in to:
+        return to
+    try:
+        return cached_reverse(to, kwargs=kwargs)
+    except NoReverseMatch:
+        if '.' in to:
+            return to
+        raise
+    
+    
+def clear_reverse_cache():
+    '''Drop the compiled URL templates, needed when URLConfs change at runtime'''
+    _templates.clear()
+    
+    
+def _setting_changed(sender, setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        clear_reverse_cache()
+setting_changed.connect(_setting_changed, dispatch_uid='generic.reverse')
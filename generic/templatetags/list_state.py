@@ -0,0 +1,24 @@
+from django import template
+
+from generic.views.mixins.list import canonical_query
+
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def list_query(context, **changes):
+    
+    '''
+        Return the canonical query string of the current list state with changes applied, eg.
+            <a href='{% list_query sort_field='name' sort_order='dec' %}'>
+            
+        Changing anything other than the page returns to the first page.  An empty value removes a parameter.
+    '''
+    
+    query = dict(context.get('list_state') or {})
+    if [key for key in changes if key != 'page']:
+        query.pop('page', None)
+    query.update(changes)
+    
+    return '?' + canonical_query(query, context.get('list_state_defaults'))
@@ -0,0 +1,106 @@
+'''
+    Query budget assertions for view tests.
+'''
+
+import re
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+# literals are replaced so the same statement with different parameters compares equal
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# the SQLite backend records queries as the repr of the statement and its parameters
+_sqlite_query = re.compile(r"^QUERY = u?(['\"])(.*)\1 - PARAMS = ", re.DOTALL)
+
+
+def normalize_sql(sql):
+    '''Return the statement of sql with string and number literals replaced by ?'''
+    match = _sqlite_query.match(sql)
+    if match:
+        sql = match.group(2)
+    return _literals.sub('?', sql)
+
+
+def capture_queries(request, using=DEFAULT_DB_ALIAS):
+    '''Call request and return the SQL of the queries it ran'''
+    with CaptureQueriesContext(connections[using]) as context:
+        request()
+    return [query['sql'] for query in context.captured_queries]
+
+
+def extra_queries(small, large):
+    '''Return (count, sql) of the statements run more often in large than in small, most frequent first'''
+    extra = Counter(normalize_sql(sql) for sql in large)
+    extra.subtract(Counter(normalize_sql(sql) for sql in small))
+    return sorted(((count, sql) for sql, count in extra.items() if count > 0), reverse=True)
+
+
+def _label(view):
+    return getattr(view, '__name__', view)
+
+
+class QueryBudgetMixin(object):
+    
+    '''
+        TestCase mixin for asserting the number of queries a view runs.
+        
+        The view is given either as a url, requested with the test client, or as a callable.  With
+        grow, the view is requested at two data sizes and must run the same number of queries at both,
+        the statements added at the larger size are reported on failure, eg.
+        
+            class ItemListTest(QueryBudgetMixin, TestCase):
+            
+                def add_items(self, count):
+                    for i in range(count - Item.objects.count()):
+                        Item.objects.create(...)
+                        
+                def test_list(self):
+                    self.assertQueryBudget('/items/', 3, grow=self.add_items)
+    '''
+    
+    query_budget_sizes = (5, 50)
+    
+    def _query_budget_request(self, view, **kwargs):
+        if callable(view):
+            return view
+        return lambda: self.client.get(view, **kwargs)
+    
+    def assertQueryBudget(self, view, budget, grow=None, sizes=None, using=DEFAULT_DB_ALIAS, **kwargs):
+        
+        '''
+            Assert view runs at most budget queries, and with grow(size) a callable setting the data
+            to size rows, that the query count doesn't change between the sizes
+        '''
+        
+        request = self._query_budget_request(view, **kwargs)
+        
+        if grow is None:
+            queries = capture_queries(request, using)
+            self._check_budget(view, budget, queries)
+            return
+        
+        small_size, large_size = sizes or self.query_budget_sizes
+        grow(small_size)
+        # a first request fills caches such as content types, keep them out of the counts
+        request()
+        small = capture_queries(request, using)
+        grow(large_size)
+        large = capture_queries(request, using)
+        
+        # growth first, the statements repeated per row say more than the budget listing
+        if len(small) != len(large):
+            lines = ['{0} ran {1} queries at size {2} and {3} at size {4}, extra statements -'.format(_label(view), len(small), small_size, len(large), large_size)]
+            for count, sql in extra_queries(small, large):
+                lines.append('{0} x {1}'.format(count, sql))
+            self.fail('\n'.join(lines))
+            
+        self._check_budget(view, budget, large)
+            
+    def _check_budget(self, view, budget, queries):
+        if len(queries) > budget:
+            lines = ['{0} ran {1} queries, budget is {2} -'.format(_label(view), len(queries), budget)]
+            lines.extend(queries)
+            self.fail('\n'.join(lines))
@@ -5,7 +5,56 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import copy
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
+from unittest import skipIf
+
+import django
+
+from django.conf.urls import include, patterns, url
+from django.contrib.auth.models import AnonymousUser, Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.paginator import PageNotAnInteger, Paginator
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template import Template
+from django.test import TestCase, SimpleTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from application import metrics
+from application.crud_app import CRUDApplication
+from application.decorators import View
+from application.management.commands.index_advisor import Command, query_shapes
+from generic import callbacks
+from generic.cache import bump_if_tracked, bump_model_version, get_model_version
+from generic.callbacks import CallbackPool, DurableQueue, callback_name, callback_stats, defer
+from generic.deletion import process
+from generic.export import iter_rows
+from generic.fields import CachedModelChoiceField
+from generic.models import DeletionTask
+from generic.paginator import CachedCountPaginator, CountlessPaginator, EstimatedCountPaginator, KeysetPaginator
+from generic.paginator import count_paginator, estimate_count, mysql_estimate
+from generic.projection import related_lookups, template_projection
+from generic.reverse import cached_reverse, clear_reverse_cache
+from generic.views.bulk import GenericBulkDeleteView, GenericBulkUpdateView
+from generic.views import ViewState
+from generic.views.list import GenericListView
+from generic.views.mixins.list import FILTER_FORM_FIELD, FilterMixin, PageMixin, ResultCacheMixin, SortMixin
+from generic.views.single import GenericDeleteView, GenericReadView
 
 
 class SimpleTest(TestCase):
@@ -14,3 +63,896 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class StubOptions(object):
+    app_label = 'stub'
+    
+
+class StubObject(object):
+    
+    _meta = StubOptions()
+    
+    def __init__(self, pk):
+        self.pk = pk
+        
+
+class StubQuerySet(object):
+    
+    '''Queryset stand in which yields the thread to other requests mid lookup'''
+    
+    def get(self, pk):
+        time.sleep(random.random() / 1000)
+        return StubObject(int(pk))
+
+
+class EchoReadView(GenericReadView):
+    
+    def render_to_response(self, request, state, context):
+        # give other threads a chance to overwrite anything stored on the view
+        time.sleep(random.random() / 1000)
+        return context['object'].pk
+
+
+class EchoListView(PageMixin, GenericListView):
+    
+    def render_to_response(self, request, state, context):
+        time.sleep(random.random() / 1000)
+        return context['object_list'].number, list(context['object_list'])
+
+
+class SharedViewConcurrencyTest(SimpleTestCase):
+    
+    '''Hammer a single view instance from a thread pool and check requests never see each others data'''
+    
+    requests = 2000
+    threads = 16
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.pool = ThreadPool(self.threads)
+        
+    def tearDown(self):
+        self.pool.close()
+        self.pool.join()
+    
+    def test_read_view(self):
+        
+        view = EchoReadView(model=StubObject, queryset=StubQuerySet())
+        
+        def read(object_id):
+            return object_id, view(self.factory.get('/'), object_id=str(object_id))
+        
+        for requested, seen in self.pool.map(read, range(self.requests)):
+            self.assertEqual(requested, seen)
+            
+    def test_paged_list_view(self):
+        
+        view = EchoListView(model=StubObject, queryset=range(1000), page_size=10)
+        
+        def page(number):
+            number = number % 100 + 1
+            return number, view(self.factory.get('/', {'page': number}))
+        
+        for requested, (seen, objects) in self.pool.map(page, range(self.requests)):
+            self.assertEqual(requested, seen)
+            self.assertEqual(objects, range((requested - 1) * 10, requested * 10))
+
+
+def reverse_target(request, object_id=None):
+    pass
+
+
+# the default form includes every field
+groups = CRUDApplication(model=Group)
+
+urlpatterns = patterns('',
+    url(r'^groups/', include(groups.urls)),
+    url(r'^items/$', reverse_target, name='test.item.list'),
+    url(r'^items/(?P<object_id>\d+)/$', reverse_target, name='test.item.read'),
+    url(r'^files/(?P<path>.+)$', reverse_target, name='test.file'),
+    url(r'^(?P<slug>.+)/$', reverse_target, name='test.page'),
+)
+
+
+class CachedReverseTest(SimpleTestCase):
+    
+    urls = 'generic.tests'
+    
+    def setUp(self):
+        clear_reverse_cache()
+    
+    def test_matches_reverse(self):
+        
+        cases = [
+            ('test.item.list', {}),
+            ('test.item.read', {'object_id': 12}),
+            ('test.file', {'path': u'a b/\xe9.txt'}),
+            ('test.file', {'path': u"~:@!$&'()*+,;=/%.txt"}),
+        ]
+        for name, kwargs in cases:
+            # second call is served from the compiled templates
+            self.assertEqual(cached_reverse(name, kwargs=kwargs), reverse(name, kwargs=kwargs))
+            self.assertEqual(cached_reverse(name, kwargs=kwargs), reverse(name, kwargs=kwargs))
+            
+    def test_no_match(self):
+        
+        self.assertRaises(NoReverseMatch, cached_reverse, 'test.item.read', kwargs={'object_id': 'abc'})
+        self.assertRaises(NoReverseMatch, cached_reverse, 'test.item.read', kwargs={})
+        self.assertRaises(NoReverseMatch, cached_reverse, 'test.missing')
+        
+    def test_scheme_relative(self):
+        
+        # a leading // would be another host to the browser
+        self.assertEqual(cached_reverse('test.page', kwargs={'slug': '/evil.com'}), '/%2Fevil.com/')
+        self.assertEqual(cached_reverse('test.page', kwargs={'slug': 'about'}), '/about/')
+        
+    def test_bound_view(self):
+        
+        # views of the instance are bound to it, those of the class aren't
+        self.assertEqual(groups.list.view.get_absolute_url(), '/groups/')
+        self.assertEqual(groups.read.view.get_absolute_url(object_id=3), '/groups/read/3/')
+        self.assertIs(groups.list.view, groups.get_view('list'))
+        self.assertIn(CRUDApplication.list.view, CRUDApplication._view_registry)
+        self.assertFalse(hasattr(CRUDApplication.list.view, 'application'))
+        self.assertEqual(sorted(groups.form.base_fields), ['name', 'permissions'])
+
+
+class IndexAdvisorTest(TestCase):
+    
+    urls = 'generic.tests'
+    
+    def setUp(self):
+        self.command = Command()
+        self.command.stdout = StringIO()
+        
+    def test_shapes(self):
+        
+        view = EchoListView(model=Group)
+        view.filter_fields = ['name']
+        view.sort_fields = ['pk']
+        self.assertEqual(query_shapes(view), [([], 'pk'), (['name'], None), (['name'], 'pk')])
+        
+    def test_report(self):
+        
+        class PermissionApplication(CRUDApplication):
+            list_view_class = type('SortListView', (SortMixin, GenericListView), {'sort_fields': ['name']})
+            
+        # the command finds the views of live applications
+        application = PermissionApplication(model=Permission)
+        self.command.handle_noargs(database='default', explain=True, migration=False)
+        output = self.command.stdout.getvalue()
+        self.assertIn('PermissionApplication.list_view: WHERE - ORDER BY content_type__app_label  [skipped, lookup across a relation]', output)
+        self.assertIn('PermissionApplication.list_view: WHERE - ORDER BY name  [missing]', output)
+        self.assertIn('auth_permission (name)', output)
+        
+    @skipIf(django.VERSION < (1, 7), 'migrations need django 1.7')
+    def test_migration(self):
+        
+        from django.db.migrations.loader import MigrationLoader
+        
+        self.command.connection = connection
+        self.command.write_migration([(Permission, ['content_type_id', 'name'])])
+        namespace = {}
+        exec self.command.stdout.getvalue() in namespace
+        migration = namespace['Migration']
+        
+        # runs after the migration which created the table
+        self.assertEqual(migration.dependencies, MigrationLoader(connection).graph.leaf_nodes('auth'))
+        
+        # the reverse sql drops the index the forward sql creates
+        cursor = connection.cursor()
+        cursor.execute(migration.operations[0].sql)
+        self.assertIn(['content_type_id', 'name'], self.command.indexes(Permission))
+        cursor.execute(migration.operations[0].reverse_sql)
+        self.assertNotIn(['content_type_id', 'name'], self.command.indexes(Permission))
+        
+
+class BulkViewTest(TestCase):
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.users = [User.objects.create(username='user{0}'.format(i)) for i in range(5)]
+        
+    def test_update_selected(self):
+        
+        view = GenericBulkUpdateView(model=User, set_model_fields={'is_active': False}, post_action_redirect='/users/')
+        request = self.factory.post('/', {'pk': [self.users[0].pk, self.users[1].pk]})
+        
+        with self.assertNumQueries(1):
+            response = view(request)
+            
+        self.assertEqual(response['Location'], '/users/')
+        self.assertEqual(User.objects.filter(is_active=False).count(), 2)
+        
+    def test_delete_batches(self):
+        
+        view = GenericBulkDeleteView(model=User, batch_size=2, json_fields=['count'])
+        self.assertEqual(view(self.factory.get('/')).status_code, 405)
+        
+        # nothing selected and the whole list not asked for
+        self.assertEqual(view(self.factory.post('/')).status_code, 400)
+        self.assertEqual(User.objects.count(), 5)
+        
+        response = view(self.factory.post('/', {'all': 1}))
+        self.assertEqual(json.loads(response.content), {'count': 5})
+        self.assertFalse(User.objects.exists())
+        
+    def test_update_callable(self):
+        
+        view = GenericBulkUpdateView(model=User, set_model_fields={'is_active': False, 'email': lambda user: user.username + '@example.com'}, json_fields=['count'])
+        view(self.factory.post('/', {'pk': [self.users[0].pk, self.users[1].pk]}))
+        
+        self.assertEqual(sorted(User.objects.filter(is_active=False).values_list('email', flat=True)), ['user0@example.com', 'user1@example.com'])
+        
+    def test_application_scope(self):
+        
+        class GroupApplication(CRUDApplication):
+            list_view_class = type('FilterListView', (FilterMixin, GenericListView), {'filter_fields': ['name']})
+            
+        application = GroupApplication(model=Group, bulk_delete_enabled=True)
+        callback = [pattern.callback for pattern in application.urls if pattern.name == application.url_name('bulk_delete')][0]
+        for name in ('a', 'b'):
+            Group.objects.create(name=name)
+            
+        # login and Django's delete permission are enforced, on the bulk views only
+        request = self.factory.post('/', {'all': 1})
+        request.user = AnonymousUser()
+        self.assertEqual(callback(request).status_code, 302)
+        request.user = self.users[0]
+        self.assertRaises(PermissionDenied, callback, request)
+        self.assertEqual(Group.objects.count(), 2)
+        callback_stub = lambda request: None
+        self.assertIs(application.get_view('create').protect(callback_stub), callback_stub)
+        
+        # the list's session filter applies
+        request.user = User.objects.get(pk=self.users[1].pk)
+        request.user.user_permissions.add(Permission.objects.get(codename='delete_group'))
+        request.user = User.objects.get(pk=request.user.pk)
+        request.session = {'filter': {'name': 'a'}}
+        callback(request)
+        self.assertEqual([group.name for group in Group.objects.all()], ['b'])
+        
+    def test_filter_form_marker(self):
+        
+        view = type('FilterListView', (FilterMixin, GenericListView), {})(model=User, filter_fields=['is_active'], template='x.html')
+        request = self.factory.post('/', {'pk': 1})
+        request.session = {'filter': {'is_active': True}}
+        
+        # other forms leave the filter, the filter form sets it even with every box unchecked
+        view.get_queryset(request, ViewState(request))
+        self.assertEqual(request.session['filter'], {'is_active': True})
+        request.POST = self.factory.post('/', {FILTER_FORM_FIELD: '1'}).POST
+        view.get_queryset(request, ViewState(request))
+        self.assertEqual(request.session['filter'], {'is_active': False})
+
+
+class ResultCacheTest(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        
+    def test_related_version(self):
+        
+        view = type('CachedListView', (ResultCacheMixin, PageMixin, GenericListView), {
+            'render_to_response': lambda self, request, state, context: [(permission.codename, permission.content_type.model) for permission in context['object_list']]
+        })(model=Permission, queryset=Permission.objects.filter(codename='add_group'), related=['content_type'], page_size=10)
+        self.assertEqual(view.get_result_cache_models(), [Permission, ContentType])
+        
+        self.assertEqual(view(self.factory.get('/')), [('add_group', 'group')])
+        with self.assertNumQueries(1):
+            # the count, the page is cached
+            self.assertEqual(view(self.factory.get('/')), [('add_group', 'group')])
+            
+        # a save of a joined model is a new version of the page
+        content_type = ContentType.objects.get_for_model(Group)
+        self.addCleanup(ContentType.objects.clear_cache)
+        content_type.model = 'team'
+        content_type.save()
+        self.assertEqual(view(self.factory.get('/')), [('add_group', 'team')])
+        
+    def test_versions(self):
+        
+        # evicted versions restart beyond the old ones rather than at 1
+        version = get_model_version(Session)
+        bump_model_version(Session)
+        self.assertEqual(get_model_version(Session), version + 1)
+        cache.clear()
+        self.assertGreater(get_model_version(Session), version + 1)
+        
+        # untracked models are only bumped by explicit calls
+        version = get_model_version(Session)
+        bump_if_tracked(Session)
+        self.assertEqual(get_model_version(Session), version)
+        
+        
+class CachedChoiceTest(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        for name in ('editors', 'staff', 'visitors'):
+            Group.objects.create(name=name)
+        
+    def test_cached(self):
+        
+        field = CachedModelChoiceField(Group.objects.order_by('name'), max_choices=4)
+        self.assertEqual([label for value, label in field.choices], [field.empty_label, 'editors', 'staff', 'visitors'])
+        with self.assertNumQueries(0):
+            field.choices
+            
+        # a save is a new version of the choices
+        Group.objects.create(name='admins')
+        self.assertEqual(len(field.choices), 5)
+        
+    def test_limited(self):
+        
+        field = CachedModelChoiceField(Group.objects.order_by('name'), max_choices=2)
+        self.assertEqual(field.choices, [])
+        self.assertTrue(isinstance(field.widget, field.lookup_widget))
+        
+        # the value is entered directly and still validated against the queryset
+        group = Group.objects.get(name='staff')
+        self.assertEqual(field.clean(str(group.pk)), group)
+        
+        # forms copy the field, the cached limit keeps the lookup widget without reloading
+        with self.assertNumQueries(0):
+            self.assertTrue(isinstance(copy.deepcopy(field).widget, field.lookup_widget))
+        
+        
+class ConditionalGetTest(TestCase):
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.users = [User.objects.create(username='user{0}'.format(i)) for i in range(3)]
+        
+    def test_cached_list(self):
+        
+        # the result cache fetches the objects as a list, the validators are still aggregated
+        view = type('CachedListView', (ResultCacheMixin, GenericListView), {
+            'render_to_response': lambda self, request, state, context: HttpResponse(len(context['object_list']))
+        })(model=User, last_modified_field='date_joined')
+        
+        response = view(self.factory.get('/'))
+        self.assertEqual(response.content, '3')
+        request = self.factory.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(view(request).status_code, 304)
+        
+        # a new object changes the count
+        User.objects.create(username='user3', date_joined=self.users[0].date_joined)
+        self.assertEqual(view(request).status_code, 200)
+        
+    def test_read(self):
+        
+        view = type('ConditionalReadView', (GenericReadView, ), {
+            'render_to_response': lambda self, request, state, context: HttpResponse(context['object'].username)
+        })(model=User, last_modified_field='last_login')
+        user = self.users[0]
+        
+        response = view(self.factory.get('/'), object_id=str(user.pk))
+        request = self.factory.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        with self.assertNumQueries(1):
+            self.assertEqual(view(request, object_id=str(user.pk)).status_code, 304)
+            
+        User.objects.filter(pk=user.pk).update(last_login=user.date_joined.replace(year=2000))
+        self.assertEqual(view(request, object_id=str(user.pk)).status_code, 200)
+        
+        
+class StatelessListTest(TestCase):
+    
+    def setUp(self):
+        
+        for name in 'abcde':
+            Group.objects.create(name=name)
+            
+        self.view = type('StatelessListView', (PageMixin, FilterMixin, SortMixin, GenericListView), {
+            'render_to_response': lambda self, request, state, context: ([group.name for group in context['object_list']], context['list_state'])
+        })(model=Group, queryset=Group.objects.order_by('pk'), filter_fields=['name'], sort_fields=['name'], page_size=2, stateless=True)
+        self.factory = RequestFactory()
+        
+    def test_redirect(self):
+        
+        # defaults, empty values and unknown sorts are left out, other parameters kept, before any query
+        with self.assertNumQueries(0):
+            response = self.view(self.factory.get('/groups/', [('sort_order', 'asc'), ('ref', 'b'), ('ref', 'a'), ('page', '1'), ('name', ''), ('sort_field', 'password')]))
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], '/groups/?ref=b&ref=a')
+        
+        response = self.view(self.factory.get('/groups/', [('sort_order', 'dec'), ('sort_field', 'name')]))
+        self.assertEqual(response['Location'], '/groups/?sort_field=name&sort_order=dec')
+        
+    def test_list_state(self):
+        
+        names, query = self.view(self.factory.get('/groups/', [('page', '2'), ('ref', 'a'), ('sort_field', 'name'), ('sort_order', 'dec')]))
+        self.assertEqual(names, ['c', 'b'])
+        self.assertEqual(query, {'page': 2, 'sort_field': 'name', 'sort_order': 'dec'})
+        
+        names, query = self.view(self.factory.get('/groups/', [('name', 'd')]))
+        self.assertEqual(names, ['d'])
+        
+        # an invalid filter leaves the list unfiltered
+        names, query = self.view(self.factory.get('/groups/', [('name', 'x' * 81)]))
+        self.assertEqual(names, ['a', 'b'])
+        self.assertNotIn('name', query)
+        
+        
+class JsonModeTest(TestCase):
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        
+    def test_keyset_list(self):
+        
+        # Permission is ordered by its content type's app label and model, then codename
+        view = type('JsonListView', (PageMixin, SortMixin, GenericListView), {})(
+            model=Permission, json_fields=['codename'], paginator=KeysetPaginator, page_size=5,
+            sort_fields=['content_type'], stateless=True)
+        
+        for query in ({}, {'sort_field': 'content_type'}):
+            codenames, page = [], None
+            while True:
+                # parameters in canonical order, or the stateless view redirects
+                response = view(self.factory.get('/', sorted(dict(query, page=page).items() if page else query.items())))
+                data = json.loads(response.content)
+                self.assertEqual(sorted(data['objects'][0]), ['codename'])
+                codenames += [row['codename'] for row in data['objects']]
+                page = data['next_cursor']
+                if not page:
+                    break
+            queryset = Permission.objects.order_by('content_type__pk', 'pk') if query else Permission.objects.order_by(*list(Permission._meta.ordering) + ['pk'])
+            self.assertEqual(codenames, list(queryset.values_list('codename', flat=True)))
+            
+    def test_read(self):
+        
+        group = Group.objects.create(name='a')
+        view = GenericReadView(model=Group, json_fields=['name'])
+        self.assertEqual(json.loads(view(self.factory.get('/'), object_id=str(group.pk)).content), {'name': 'a'})
+        
+        
+class BackgroundDeleteTest(TestCase):
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create(username='user')
+        for i in range(5):
+            self.user.user_permissions.create(codename='perm{0}'.format(i), name='perm {0}'.format(i), content_type_id=1)
+        
+    def test_queue_and_process(self):
+        
+        view = GenericDeleteView(model=User, post_delete_redirect='/users/', background_delete=True)
+        list_view = EchoReadView(model=User, background_delete=True)
+        
+        view(self.factory.post('/'), object_id=self.user.pk)
+        
+        # hidden while queued, deleted by the worker
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(list_view.get_queryset(self.factory.get('/'), ViewState(None)).exists())
+        
+        self.assertEqual(process(chunk_size=2), 1)
+        
+        task = DeletionTask.objects.get()
+        self.assertEqual(task.status, DeletionTask.DONE)
+        self.assertEqual(task.deleted, 6)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(process(), 0)
+        
+    def test_integer_pk(self):
+        
+        # DeletionTask.object_id can't hold a session key
+        self.assertRaises(ImproperlyConfigured, GenericDeleteView, model=Session, post_delete_redirect='/', background_delete=True)
+        GenericDeleteView(model=Session, post_delete_redirect='/')
+        
+    def test_failed_shown(self):
+        
+        list_view = EchoReadView(model=User, background_delete=True)
+        task = DeletionTask.objects.schedule(self.user)
+        DeletionTask.objects.filter(pk=task.pk).update(status=DeletionTask.FAILED)
+        self.assertTrue(list_view.get_queryset(self.factory.get('/'), ViewState(None)).exists())
+
+
+class ExportTest(TestCase):
+    
+    def setUp(self):
+        for i in range(5):
+            User.objects.create(username='user{0}'.format(i), email='user{0}@example.com'.format(4 - i),
+                                date_joined='2014-01-01 00:00:00.{0:06d}'.format(i // 2))
+            
+    def test_chunks(self):
+        
+        # repeated values at chunk boundaries, in both directions
+        for ordering in ('date_joined', '-date_joined', 'email'):
+            queryset = User.objects.order_by(ordering)
+            expected = list(queryset.order_by(ordering, ordering.replace(ordering.lstrip('-'), 'pk')).values_list('username', 'date_joined'))
+            with self.assertNumQueries(3):
+                self.assertEqual(list(iter_rows(queryset, ['username', 'date_joined'], chunk_size=2)), expected)
+                
+    @skipIf(django.VERSION < (1, 8), 'last_login is nullable from django 1.8')
+    def test_nullable_sort_field(self):
+        
+        # NULLs at chunk boundaries, in both directions
+        for user, last_login in zip(User.objects.order_by('pk'), [None, None, '2014-01-01', None, '2014-01-02']):
+            user.last_login = last_login
+            user.save()
+            
+        for ordering in ('last_login', '-last_login'):
+            queryset = User.objects.order_by(ordering)
+            expected = list(queryset.order_by(ordering, ordering.replace('last_login', 'pk')).values_list('username', 'last_login'))
+            self.assertEqual(list(iter_rows(queryset, ['username', 'last_login'], chunk_size=2)), expected)
+            
+    def test_view(self):
+        
+        view = EchoListView(model=User, queryset=User.objects.order_by('email'), export_fields=['username', 'email'], page_size=2)
+        
+        response = view(RequestFactory().get('/', {'export': 'csv'}))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="user.csv"')
+        lines = ''.join(response.streaming_content).splitlines()
+        # every row despite the page size
+        self.assertEqual(lines, ['username,email'] + ['user{0},user{1}@example.com'.format(4 - i, i) for i in range(5)])
+        
+        response = view(RequestFactory().get('/', {'export': 'json'}))
+        rows = [json.loads(line) for line in ''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0], {'username': 'user4', 'email': 'user0@example.com'})
+        
+        # exports only where export_fields are set
+        view = EchoListView(model=User, page_size=2)
+        self.assertEqual(len(view(RequestFactory().get('/', {'export': 'csv'}))), 2)
+
+
+class KeysetPaginatorTest(TestCase):
+    
+    def pages(self, paginator):
+        page, pages = paginator.page(None), []
+        while True:
+            pages.append(list(page))
+            if not page.has_next():
+                return pages, page
+            page = paginator.page(page.next_cursor)
+            
+    def test_pages(self):
+        
+        for i in range(5):
+            # equal microsecond dates need the pk tiebreaker
+            User.objects.create(username='user{0}'.format(i), date_joined='2014-01-01 00:00:00.{0:06d}'.format(i // 2))
+            
+        for ordering in ('date_joined', '-date_joined', 'username'):
+            queryset = User.objects.order_by(ordering)
+            paginator = KeysetPaginator(queryset, 2)
+            pages, page = self.pages(paginator)
+            self.assertEqual([len(objects) for objects in pages], [2, 2, 1])
+            self.assertEqual(sum(pages, []), list(queryset.order_by(ordering, ordering.replace(ordering.lstrip('-'), 'pk'))))
+            
+            # walking back from the last page
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), pages[-2])
+            self.assertTrue(page.has_next())
+            self.assertTrue(page.has_previous())
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), pages[0])
+            self.assertFalse(page.has_previous())
+            
+    def test_foreign_key_cursor(self):
+        
+        for ordering in ('content_type', '-content_type'):
+            queryset = Permission.objects.order_by(ordering)
+            pages, page = self.pages(KeysetPaginator(queryset, 7))
+            # foreign keys page in id order
+            self.assertEqual(sum(pages, []), list(queryset.order_by(ordering + '__pk', ordering.replace('content_type', 'pk'))))
+            
+    def test_invalid_cursor(self):
+        
+        Group.objects.create(name='staff')
+        paginator = KeysetPaginator(Group.objects.order_by('name'), 2)
+        for cursor in ('x', paginator.encode_cursor({'name': 'a', 'pk': 'x'}), paginator.encode_cursor({'name': 'a', 'pk': [1]})):
+            page = paginator.page(cursor)
+            self.assertFalse(page.has_previous())
+            self.assertEqual(len(page), 1)
+
+
+class CountPaginatorTest(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        for name in 'abcde':
+            Group.objects.create(name=name)
+            
+    def test_cached(self):
+        
+        queryset = Group.objects.order_by('name')
+        self.assertEqual(CachedCountPaginator(queryset, 2).count, 5)
+        with self.assertNumQueries(0):
+            # shared by every sort of the filter state
+            self.assertEqual(CachedCountPaginator(Group.objects.order_by('-name'), 2).count, 5)
+        self.assertEqual(CachedCountPaginator(queryset.filter(name__in=['a', 'b']), 2).count, 2)
+        self.assertEqual(CachedCountPaginator(queryset.none(), 2).count, 0)
+        
+        # a save is a new version of the count
+        Group.objects.create(name='f')
+        self.assertEqual(CachedCountPaginator(queryset, 2).count, 6)
+        
+    def test_estimated(self):
+        
+        # no planner estimate on sqlite, the count is exact
+        self.assertEqual(estimate_count(Group.objects.all()), None)
+        self.assertEqual(EstimatedCountPaginator(Group.objects.all(), 2).num_pages, 3)
+        
+        # joined tables multiply, subqueries are left out
+        columns = ['id', 'select_type', 'table', 'rows', 'filtered']
+        self.assertEqual(mysql_estimate(columns, [(1, 'SIMPLE', 'auth_user', 1000, 10.0)]), 100)
+        self.assertEqual(mysql_estimate(columns, [
+            (1, 'PRIMARY', 'auth_user', 1000, 50.0),
+            (1, 'PRIMARY', 'auth_user_groups', 3, 100.0),
+            (2, 'SUBQUERY', 'auth_group', 40, 100.0),
+        ]), 1500)
+        self.assertEqual(mysql_estimate(['id', 'rows'], [(1, 1000), (1, None)]), 0)
+        self.assertEqual(mysql_estimate(['id', 'Extra'], [(1, 'Impossible WHERE')]), None)
+        
+    def test_countless(self):
+        
+        paginator = CountlessPaginator(Group.objects.order_by('name'), 2)
+        with self.assertNumQueries(1):
+            page = paginator.page(2)
+            self.assertEqual([group.name for group in page], ['c', 'd'])
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+        
+        page = paginator.page(3)
+        self.assertEqual([group.name for group in page], ['e'])
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.page(0).number, 1)
+        self.assertRaises(PageNotAnInteger, paginator.page, 'x')
+        
+    def test_strategies(self):
+        
+        self.assertIs(count_paginator('exact'), Paginator)
+        self.assertIs(count_paginator('none'), CountlessPaginator)
+        self.assertIs(count_paginator('cached'), CachedCountPaginator)
+        paginator = count_paginator('cached', cache_timeout=10)
+        self.assertTrue(issubclass(paginator, CachedCountPaginator))
+        self.assertEqual(paginator.cache_timeout, 10)
+        self.assertRaises(ImproperlyConfigured, count_paginator, 'approximate')
+
+
+def metered_view(request):
+    if 'query' in request.GET:
+        Group.objects.count()
+    return HttpResponse('ok')
+
+
+class MetricsTest(TestCase):
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        
+    def call_in_thread(self, callback, request):
+        
+        def call():
+            try:
+                callback(request)
+            finally:
+                connection.close()
+                
+        thread = threading.Thread(target=call)
+        thread.start()
+        thread.join()
+        
+    def test_instrument(self):
+        
+        view = View(r'^$', 'metered')
+        with override_settings(VIEW_METRICS_SAMPLE_RATE=1):
+            callback = metrics.instrument(view, 'test.metered', metered_view)
+            
+        callback(self.factory.get('/', {'query': 1}))
+        self.call_in_thread(callback, self.factory.get('/'))
+        
+        # the finished thread's shard is folded into the retired total, once its state is cleared
+        view_metrics = metrics.registry[view]
+        for i in range(100):
+            if len(view_metrics._shards) == 1:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(view_metrics._shards), 1)
+        totals = view_metrics.snapshot()
+        self.assertEqual((totals.requests, totals.sampled, totals.queries, totals.bytes), (2, 2, 1, 4))
+        
+        request = self.factory.get('/')
+        request.user = User(is_staff=True)
+        data = json.loads(metrics.stats(request).content)['views']['test.metered']
+        self.assertEqual((data['requests'], data['db_queries']), (2, 1))
+        self.assertIn('view_request_seconds_count{view="test.metered"} 2\n', metrics.prometheus(request).content)
+        
+        request.user = User()
+        self.assertRaises(PermissionDenied, metrics.stats, request)
+
+
+calls = []
+
+
+def record_call(value):
+    calls.append(value)
+    
+
+def flaky_call(value):
+    calls.append(value)
+    if len(calls) < 3:
+        raise ValueError(value)
+    
+
+def failing_call(value):
+    calls.append(value)
+    raise ValueError(value)
+    
+
+class DeferredCallbackTest(SimpleTestCase):
+    
+    def setUp(self):
+        del calls[:]
+        
+    def test_held_until_commit(self):
+        
+        pool = CallbackPool(workers=1)
+        pool.submit = lambda callback, args, kwargs: callback(*args, **kwargs)
+        
+        callbacks._pool, saved = pool, callbacks._pool
+        try:
+            with transaction.atomic():
+                defer(record_call, 'committed')
+                with transaction.atomic():
+                    defer(record_call, 'nested')
+                self.assertEqual(calls, [])
+            self.assertEqual(calls, ['committed', 'nested'])
+            
+            try:
+                with transaction.atomic():
+                    defer(record_call, 'rolled back')
+                    raise ValueError
+            except ValueError:
+                pass
+            
+            # outside any atomic block, and a later commit doesn't run the dropped call
+            defer(record_call, 'autocommit')
+            with transaction.atomic():
+                pass
+        finally:
+            callbacks._pool = saved
+                
+        self.assertEqual(calls, ['committed', 'nested', 'autocommit'])
+        
+    def test_retry(self):
+        
+        pool = CallbackPool(workers=1, retries=3, backoff=0)
+        pool.submit(flaky_call, ('flaky', ), {})
+        pool.queue.join()
+        
+        self.assertEqual(calls, ['flaky'] * 3)
+        stats = callback_stats()[callback_name(flaky_call)]
+        self.assertEqual((stats['failures'], stats['retries']), (2, 2))
+        
+    def test_exhausted_quarantined(self):
+        
+        pool = CallbackPool(workers=1, retries=1, backoff=0, durable=DurableQueue(':memory:'))
+        pool.submit(failing_call, ('failing', ), {})
+        pool.queue.join()
+        
+        self.assertEqual(calls, ['failing'] * 2)
+        self.assertEqual(list(pool.durable.pending()), [])
+        self.assertEqual(pool.durable.db.execute('SELECT callback FROM quarantine').fetchall(), [(callback_name(failing_call), )])
+        
+    def test_durable_replay(self):
+        
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            # recorded by a process that stopped before running it, and a callback since removed
+            queue = DurableQueue(path)
+            queue.put(record_call, ('replayed', ), {})
+            queue.db.execute('UPDATE callbacks SET callback = ? WHERE id = ?', ('generic.tests.removed_call', queue.put(record_call, (), {})))
+            queue.db.commit()
+            
+            pool = CallbackPool(workers=1, durable=DurableQueue(path))
+            pool.start()
+            pool.queue.join()
+            
+            self.assertEqual(calls, ['replayed'])
+            self.assertEqual(list(pool.durable.pending()), [])
+            self.assertEqual(pool.durable.db.execute('SELECT callback FROM quarantine').fetchall(), [('generic.tests.removed_call', )])
+        finally:
+            os.remove(path)
+
+
+class TemplateProjectionTest(SimpleTestCase):
+    
+    def projection(self, source, **kwargs):
+        return template_projection(User, Template(source), **kwargs)
+    
+    def test_object_fields(self):
+        
+        source = '{{ object.username }}{% if object.is_staff %}{{ object.get_full_name }}{% endif %}{% with u=object %}{{ u.email|default:object.first_name }}{% endwith %}'
+        self.assertEqual(self.projection(source, objects=['object']), (['email', 'first_name', 'is_staff', 'username'], []))
+        
+    def test_loop_variables(self):
+        
+        source = '{% for user in object_list %}{{ user.username }}{% for user in other %}{{ user.email }}{% endfor %}{% endfor %}'
+        self.assertEqual(self.projection(source, sequences=['object_list'], extra=['last_login']), (['last_login', 'username'], []))
+        
+    def test_whole_object(self):
+        self.assertEqual(self.projection('{{ object }}', objects=['object']), None)
+        self.assertEqual(self.projection('{% for user in object_list %}{% include user %}{% endfor %}', sequences=['object_list']), None)
+        
+    def test_includes(self):
+        
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'email.html'), 'w') as f:
+                f.write('{{ object.email }}{{ person.first_name }}')
+            with override_settings(TEMPLATE_DIRS=[directory]):
+                source = '{{ object.username }}{% include "email.html" %}{% include "email.html" with person=object only %}'
+                self.assertEqual(self.projection(source, objects=['object']), (['email', 'first_name', 'username'], []))
+                self.assertEqual(self.projection('{% for user in object_list %}{% include "email.html" with object=user %}{% endfor %}', sequences=['object_list']), (['email'], []))
+                self.assertEqual(self.projection('{{ object.username }}{% include name %}', objects=['object']), None)
+        finally:
+            shutil.rmtree(directory)
+
+
+class ProjectionWarningTest(TestCase):
+    
+    def test_scoped_to_view(self):
+        
+        user = User.objects.create(username='user', email='user@example.com')
+        with override_settings(GENERIC_PROJECTION_WARNINGS=True):
+            view = type('ProjectedReadView', (GenericReadView, ), {
+                'render_to_response': lambda self, request, state, context: HttpResponse(context['object'].email)
+            })(model=User, projection_fields=['username'], last_modified_field='date_joined')
+        self.assertEqual(view.get_projection(), (['date_joined', 'username'], []))
+        
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger('generic.projection').addHandler(handler)
+        self.addCleanup(logging.getLogger('generic.projection').removeHandler, handler)
+        
+        # loads made by the view are logged, those of other code aren't
+        view(RequestFactory().get('/'), object_id=str(user.pk))
+        self.assertEqual(User.objects.only('username').get(pk=user.pk).email, 'user@example.com')
+        self.assertEqual([record.getMessage() for record in records], ['Deferred field User.email loaded, add it to projection_extra'])
+        
+        
+class RelatedLoadingTest(TestCase):
+    
+    def setUp(self):
+        group = Group.objects.create(name='staff')
+        for i in range(3):
+            User.objects.create(username='user{0}'.format(i)).groups.add(group)
+            
+    def test_lookups(self):
+        
+        paths = [('content_type', 'app_label'), ('group_set', 'all'), ('codename', ), ('content_type_id', )]
+        self.assertEqual(related_lookups(Permission, paths), (['content_type'], ['group_set']))
+        
+    def test_auto(self):
+        
+        template = Template('{% for user in object_list %}{% for group in user.groups.all %}{{ group.name }}{% endfor %}{% endfor %}')
+        view = EchoListView(model=User, template=template, related='auto')
+        view.filter_fields = ['groups']
+        self.assertEqual(view.get_related(), ([], ['groups']))
+        
+        view = EchoListView(model=Permission, template=template, related='auto')
+        view.sort_fields = ['content_type__model']
+        self.assertEqual(view.get_related(), (['content_type'], []))
+        
+        # filtering and sorting on the foreign key only compare its column
+        view = EchoListView(model=Permission, template=Template(''), related='auto')
+        view.filter_fields = ['content_type']
+        view.sort_fields = ['content_type']
+        self.assertEqual(view.get_related(), ([], []))
+        
+    def test_prefetch_current_page(self):
+        
+        view = EchoListView(model=User, queryset=User.objects.order_by('pk'), page_size=2, prefetch=['groups'])
+        request = RequestFactory().get('/')
+        state = ViewState(request)
+        
+        # count, page and a single prefetch for the page's users
+        with self.assertNumQueries(3):
+            objects = view.get_context(request, state)['object_list']
+            self.assertEqual([[group.name for group in user.groups.all()] for user in objects], [['staff'], ['staff']])
@@ -1,7 +1,77 @@
+import json
+import calendar
 from abc import ABCMeta, abstractmethod
+from hashlib import md5
+from timeit import default_timer
 
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import AutoField, IntegerField
+from django.db.models.query import QuerySet, prefetch_related_objects
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import render
+from django.template import TemplateDoesNotExist
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
 
+from generic.paginator import keyset_field
+from generic.projection import deferred_load_warnings, project, related_lookups, template_projection, template_uses, warn_deferred_loads
+
+
+def _timestamp(value):
+    '''Return seconds since the epoch of a (naive UTC or aware) datetime'''
+    return calendar.timegm(value.utctimetuple())
+
+
+def _integer_pk(model):
+    '''Return whether model's pk (or the pk it is a key to) is an integer, as DeletionTask.object_id is'''
+    pk = model._meta.pk
+    while pk.rel is not None:
+        pk = pk.rel.get_related_field()
+    return isinstance(pk, (AutoField, IntegerField))
+
+
+class ViewState(object):
+    
+    '''
+        Request scoped state of a generic view.
+        
+        Created by the view for each request and passed through get_queryset and get_context, so
+        that view instances only hold configuration and can be shared between concurrent requests.
+        
+        Attributes -
+            request - the current request
+            args, kwargs - URLConf arguments
+            object - object looked up by single object views
+            form - bound form of the current request
+            paginator - paginator created by PageMixin
+            page - current page created by PageMixin
+            object_list - queryset or page of list views, once fetched
+            paginate - whether PageMixin should paginate the queryset, cleared for exports
+            values - fields the queryset is projected to with values() in JSON mode
+            query - list state (filter, sort, page) of stateless views as query string parameters
+            query_defaults - default values of query parameters, left out of canonical urls
+            
+        Mixins may store further attributes of their own.
+    '''
+    
+    def __init__(self, request, *args, **kwargs):
+        
+        self.request = request
+        self.args = args
+        self.kwargs = kwargs
+        
+        self.object = None
+        self.form = None
+        self.paginator = None
+        self.page = None
+        self.object_list = None
+        self.paginate = True
+        self.values = None
+        self.query = {}
+        self.query_defaults = {}
+        
 
 class GenericView(object):
     
@@ -12,6 +82,34 @@ class GenericView(object):
             model - the model to create view for. Required 
             queryset - base queryset for list views, defaults to all objects
             extra_context - dictionary containing extra template context, defaults to {}
+            last_modified_field - date/time field used for conditional GET, eg. 'updated_at', defaults to None
+            json_fields - fields to render as JSON in place of the template, for the list and read views.
+                          Serialized straight from a values() projection without creating model instances.
+                          Defaults to None for template rendering
+            stateless - keep list filter, sort and page state in a canonical query string rather than
+                        the session, defaults to False
+            background_delete - objects are deleted by the generic.deletion worker rather than in the
+                                request.  Set on every view of the model so objects queued for deletion
+                                are hidden, defaults to False.  Needs generic in INSTALLED_APPS, and
+                                a model with an integer pk
+            projection - load only the fields the template uses of the view's objects, with
+                         select_related for the relations it follows, defaults to False
+            projection_fields - fields (or related lookups) to load in place of reading the template,
+                                defaults to None
+            projection_extra - further fields to load, for attributes used by python code such as
+                               methods and properties, defaults to []
+            related - select_related lookups joined into the queryset, or 'auto' to join the forward
+                      foreign keys followed by sort_fields and the template, and to
+                      prefetch the many valued relations the template uses.  Defaults to None
+            prefetch - prefetch_related lookups.  List views prefetch after pagination, for the objects
+                       of the current page only.  Defaults to []
+                               
+        NOTE -
+            the conditional GET validators cover the view's own objects.  Mixins rendering other
+            content, eg. comments, add it to the entity tag with get_etag_parts
+            
+            set GENERIC_PROJECTION_WARNINGS to True to log the deferred field loads of views with
+            projection, which are a query per object each
             
     '''
     # this is an abstract base class, so disallow direct instantiation
@@ -20,6 +118,19 @@ class GenericView(object):
     model = None
     queryset = None
     extra_context = {}
+    last_modified_field = None
+    json_fields = None
+    stateless = False
+    background_delete = False
+    projection = False
+    projection_fields = None
+    projection_extra = []
+    related = None
+    prefetch = []
+    
+    # context names of the objects and sequences of objects the template is read for
+    projection_objects = ()
+    projection_sequences = ()
     
     def __init__(self, **kwargs):
         
@@ -30,20 +141,207 @@ class GenericView(object):
         
         self.extra_context = kwargs.pop('extra_context', self.extra_context)
         self.queryset = kwargs.pop('queryset', self.queryset)
+        self.last_modified_field = kwargs.pop('last_modified_field', self.last_modified_field)
+        self.json_fields = kwargs.pop('json_fields', self.json_fields)
+        self.stateless = kwargs.pop('stateless', self.stateless)
+        self.background_delete = kwargs.pop('background_delete', self.background_delete)
+        if self.background_delete and not _integer_pk(self.model):
+            raise ImproperlyConfigured("'%s' background_delete needs a model with an integer pk" % self.__class__.__name__)
+        
+        self.projection = kwargs.pop('projection', self.projection)
+        self.projection_fields = kwargs.pop('projection_fields', self.projection_fields)
+        self.projection_extra = kwargs.pop('projection_extra', self.projection_extra)
+        self.projection_warnings = (self.projection or self.projection_fields is not None) and getattr(settings, 'GENERIC_PROJECTION_WARNINGS', False)
+        if self.projection_warnings:
+            warn_deferred_loads()
+                
+        self.related = kwargs.pop('related', self.related)
+        self.prefetch = kwargs.pop('prefetch', self.prefetch)
         
         super(GenericView, self).__init__()
         
-    def get_queryset(self, request):
+    def get_queryset(self, request, state):
         '''Return supplied queryset, or all objects for supplied model'''
-        if self.queryset is None:
-            return self.model.objects.all()
-        return self.queryset
+        queryset = self.queryset
+        if queryset is None:
+            queryset = self.model.objects.all()
+        if self.background_delete:
+            # imported here so generic is only an installed app for views deleting in the background
+            from generic.models import DeletionTask
+            queryset = queryset.exclude(pk__in=DeletionTask.objects.outstanding(self.model).values('object_id'))
+        if state.values:
+            return queryset.values(*state.values)
+        
+        select = self.get_related()[0]
+        if select:
+            queryset = queryset.select_related(*select)
+        
+        projection = self.get_projection()
+        if projection is not None:
+            fields, relations = projection
+            if relations:
+                queryset = queryset.select_related(*relations)
+            queryset = queryset.only(*(fields or [self.model._meta.pk.name]))
+        return queryset
     
-    def get_context(self, request):
-        '''Return supplied extra_context'''
-        return self.extra_context
+    def get_projection_extra(self):
+        '''Return fields loaded with a projection whatever the template uses'''
+        extra = [field for field in self.projection_extra]
+        if self.last_modified_field:
+            # read for the Last-Modified header
+            extra.append(self.last_modified_field)
+        return extra
+    
+    def get_projection(self):
+        
+        '''Return (only fields, select_related relations) of the objects, or None to load every field'''
+        
+        # read once, on first use after the subclass has set the template
+        if '_projection' not in self.__dict__:
+            projection = None
+            # joined relations are loaded whole, only() can't defer a relation select_related follows
+            extra = self.get_projection_extra() + self.get_related()[0]
+            if self.projection_fields is not None:
+                fields = [field for field in self.projection_fields] + extra
+                projection = project(self.model, [tuple(field.split('__')) for field in fields])
+            elif self.projection:
+                try:
+                    projection = template_projection(self.model, self.template, self.projection_objects, self.projection_sequences, extra)
+                except TemplateDoesNotExist:
+                    projection = None
+            self._projection = projection
+        return self._projection
+    
+    def get_related(self):
+        
+        '''Return (select_related lookups, prefetch_related lookups) of the objects'''
+        
+        # read once, on first use after the subclass has set the template
+        if '_related' not in self.__dict__:
+            select = []
+            prefetch = [lookup for lookup in self.prefetch]
+            if self.related == 'auto':
+                # sorts follow the relations before their last field, filters only compare columns
+                paths = set(tuple(field.split('__'))[:-1] for field in getattr(self, 'sort_fields', []))
+                if getattr(self, 'template', None):
+                    try:
+                        paths.update(template_uses(self.template, self.projection_objects, self.projection_sequences).paths)
+                    except TemplateDoesNotExist:
+                        pass
+                select, auto = related_lookups(self.model, paths)
+                prefetch += [lookup for lookup in auto if lookup not in prefetch]
+            elif self.related:
+                select = [lookup for lookup in self.related]
+            self._related = select, prefetch
+        return self._related
+    
+    def prefetch_objects(self, objects):
+        
+        '''
+            Prefetch the prefetch_related lookups for a queryset, page or list of objects, returning it.
+            Pages are prefetched for their own objects, so only the current page is loaded.
+        '''
+        
+        prefetch = self.get_related()[1]
+        if not prefetch:
+            return objects
+        if isinstance(objects, QuerySet):
+            return objects.prefetch_related(*prefetch)
+        
+        instances = getattr(objects, 'object_list', objects)
+        if isinstance(instances, QuerySet):
+            # evaluate the page once, the template iterates the prefetched instances
+            instances = [instance for instance in instances]
+            objects.object_list = instances
+        prefetch_related_objects(instances, prefetch)
+        return objects
+    
+    def get_values_fields(self):
+        
+        '''
+            Return fields projected in JSON mode - json_fields plus the pk and the sort fields, default
+            ordering and their keyset names (eg. user__pk) that paginators build cursors from
+        '''
+        
+        # NOTE - list is shadowed by the generic.views.list module in this namespace
+        ordering = [field for field in getattr(self, 'sort_fields', [])] + [field for field in self.model._meta.ordering]
+        if self.queryset is not None:
+            ordering += [field for field in self.queryset.query.order_by]
+        ordering = [field.lstrip('-') for field in ordering if isinstance(field, basestring) and field != '?']
+        
+        fields = [field for field in self.json_fields]
+        for field in ['pk'] + ordering + [keyset_field(self.model, field) for field in ordering]:
+            if field not in fields:
+                fields.append(field)
+        return fields
+    
+    def render_json(self, data, status=200):
+        '''Return data serialized as a JSON response'''
+        return HttpResponse(json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json', status=status)
+    
+    def get_lookup(self, request, state):
+        '''Return filter identifying a single object from object_id or slug URLConf kwargs'''
+        if 'object_id' in state.kwargs:
+            return {'pk': state.kwargs['object_id']}
+        elif 'slug' in state.kwargs:
+            return {'slug': state.kwargs['slug']}
+        raise Http404
+    
+    def get_object(self, request, state):
+        '''Return the object identified by object_id or slug URLConf kwargs'''
+        return self.get_queryset(request, state).get(**self.get_lookup(request, state))
+    
+    def get_etag_parts(self, request, state, queryset):
+        '''Return further parts of the entity tag for the objects of queryset, for mixins adding content of their own'''
+        return ()
+    
+    def get_etag(self, request, *parts):
+        '''Return an entity tag for the model, user and parts identifying a response'''
+        user = getattr(getattr(request, 'user', None), 'pk', None)
+        return md5(force_bytes(repr((self.model._meta.db_table, user) + parts))).hexdigest()
+    
+    def not_modified(self, request, etag, last_modified):
+        
+        '''Return a 304 response if the request's validators match etag/last_modified, otherwise None'''
+        
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = parse_etags(if_none_match)
+            matches = etag in etags or '*' in etags
+        else:
+            if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+            matches = if_modified_since is not None and last_modified is not None and _timestamp(last_modified) <= if_modified_since
+            
+        if matches:
+            return self.set_validators(HttpResponseNotModified(), etag, last_modified)
+        return None
+    
+    def set_validators(self, response, etag, last_modified):
+        '''Set ETag and Last-Modified headers on response'''
+        response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(_timestamp(last_modified))
+        return response
+    
+    def get_context(self, request, state):
+        '''Return a copy of supplied extra_context'''
+        return dict(self.extra_context)
+    
+    def render_to_response(self, request, state, context):
+        '''Render view template with context, noting the render time on the response for metrics'''
+        start = default_timer()
+        response = render(request, self.template, context)
+        response.render_time = default_timer() - start
+        return response
     
-    @abstractmethod
     def __call__(self, request, *args, **kwargs):
+        '''Create the request state and dispatch'''
+        if self.projection_warnings:
+            with deferred_load_warnings():
+                return self.dispatch(request, ViewState(request, *args, **kwargs))
+        return self.dispatch(request, ViewState(request, *args, **kwargs))
+    
+    @abstractmethod
+    def dispatch(self, request, state):
         '''Abstract method must be overridden.  Implement view rendering here'''        
-        # instantiating a sublass without overriding __call__ will result in TypeError exception
\ No newline at end of file
+        # instantiating a sublass without overriding dispatch will result in TypeError exception
\ No newline at end of file
@@ -0,0 +1,147 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseRedirect
+
+from generic.cache import bump_if_tracked
+from generic.reverse import cached_resolve_url
+from generic.views import GenericView
+
+
+class GenericBulkView(GenericView):
+    
+    '''
+        Abstract base of views acting on many objects at once.
+        
+        The objects are the posted pks of the view's queryset, so mix in FilterMixin and FilterByUser
+        to act within the current filter and user scope.  Posting all_field in place of pks acts on
+        every object of the queryset, a post with neither is refused with a 400.  Only POST requests
+        are accepted.
+        
+        Options -
+            pk_field - POST parameter holding selected pks, defaults to 'pk'
+            all_field - POST parameter asking to act on every object of the current filter, defaults to 'all'
+            post_action_redirect - view to go to after the action.  Required unless json_fields is set,
+                                   in which case the number of objects changed is returned as JSON
+    '''
+    
+    pk_field = 'pk'
+    all_field = 'all'
+    post_action_redirect = None
+    
+    def __init__(self, **kwargs):
+        
+        self.pk_field = kwargs.pop('pk_field', self.pk_field)
+        self.all_field = kwargs.pop('all_field', self.all_field)
+        self.post_action_redirect = kwargs.pop('post_action_redirect', self.post_action_redirect)
+        
+        super(GenericBulkView, self).__init__(**kwargs)
+        
+        if not self.post_action_redirect and not self.json_fields:
+            raise ImproperlyConfigured("'%s' must define 'post_action_redirect'" % self.__class__.__name__)
+        
+    def get_queryset(self, request, state):
+        
+        # act on every matching object, not the current page
+        state.paginate = False
+        queryset = super(GenericBulkView, self).get_queryset(request, state).order_by()
+        
+        if request.POST.get(self.all_field):
+            return queryset
+        return queryset.filter(pk__in=request.POST.getlist(self.pk_field))
+    
+    def act(self, request, state, queryset):
+        '''Apply the action to queryset, returning the number of objects changed'''
+        raise NotImplementedError
+    
+    def dispatch(self, request, state):
+        
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        
+        # acting on the whole queryset must be asked for, a form posting no selection changes nothing
+        if not request.POST.getlist(self.pk_field) and not request.POST.get(self.all_field):
+            return HttpResponseBadRequest()
+        
+        count = self.act(request, state, self.get_queryset(request, state))
+        
+        if self.json_fields:
+            return self.render_json({'count': count})
+        return HttpResponseRedirect(cached_resolve_url(self.post_action_redirect))
+    
+    
+class GenericBulkUpdateView(GenericBulkView):
+    
+    '''
+        Generic view setting fields on many model instances with a single UPDATE query.
+        
+        Options -
+            set_model_fields - dictionary of field:value pairs to set.  Values may be callables taking
+                               the object, as for GenericUpdateView.  Required
+            
+        NOTE -
+            the update is done in the database, so model save() methods and save signals are not called.
+            Callable values are computed for each object, so those updates save the objects one by one
+            in batches of batch_size, each in its own transaction
+    '''
+    
+    set_model_fields = {}
+    batch_size = 500
+    
+    def __init__(self, **kwargs):
+        
+        self.set_model_fields = kwargs.pop('set_model_fields', self.set_model_fields)
+        if not self.set_model_fields:
+            raise ImproperlyConfigured("'%s' must define 'set_model_fields'" % self.__class__.__name__)
+        self.batch_size = kwargs.pop('batch_size', self.batch_size)
+        
+        super(GenericBulkUpdateView, self).__init__(**kwargs)
+        
+    def act(self, request, state, queryset):
+        
+        if not [value for value in self.set_model_fields.values() if callable(value)]:
+            count = queryset.update(**self.set_model_fields)
+            # update() sends no save signals
+            bump_if_tracked(self.model)
+            return count
+        
+        # the pks are fetched up front, the update may move objects out of the queryset's filter
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+        for start in xrange(0, len(pks), self.batch_size):
+            with transaction.atomic():
+                for object in self.model._default_manager.filter(pk__in=pks[start:start + self.batch_size]):
+                    for key, value in self.set_model_fields.iteritems():
+                        setattr(object, key, value(object) if callable(value) else value)
+                    object.save(update_fields=list(self.set_model_fields))
+        return len(pks)
+    
+    
+class GenericBulkDeleteView(GenericBulkView):
+    
+    '''
+        Generic view deleting many model instances.
+        
+        Objects are deleted in batches of batch_size, each in its own transaction, so locks are held
+        briefly and cascades stay bounded.  Delete signals and cascades run as for a single delete.
+        
+        Options -
+            batch_size - number of objects deleted per transaction, defaults to 500
+    '''
+    
+    batch_size = 500
+    
+    def __init__(self, **kwargs):
+        
+        self.batch_size = kwargs.pop('batch_size', self.batch_size)
+        
+        super(GenericBulkDeleteView, self).__init__(**kwargs)
+        
+    def act(self, request, state, queryset):
+        
+        count = 0
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return count
+            with transaction.atomic():
+                self.model._default_manager.filter(pk__in=pks).delete()
+            count += len(pks)
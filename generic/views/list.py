@@ -1,27 +1,160 @@
-from django.shortcuts import render
+from django.db.models import Count, Max
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.http import HttpResponsePermanentRedirect, StreamingHttpResponse
 
+from generic.export import EXPORT_FORMATS, iter_rows
 from generic.views import GenericView
+from generic.views.mixins.list import canonical_query
 
 
 class GenericListView(GenericView):
     
+    '''
+        Generic view for lists of model instances.
+        
+        Options -
+            template - template path, defaults to app_name/read.html
+            last_modified_field - date/time field for conditional GET.  The list validators are the
+                                  latest value of the field and the number of objects in the list
+            export_fields - fields (or related lookups) streamed by ?export=csv or ?export=json, defaults
+                            to None which disables exports.  Exports follow the current filter, sort
+                            and user scope but are never paginated
+            export_chunk_size - number of rows fetched per query while exporting, defaults to 2000
+                                  
+        Template Context -
+            object_list - the queryset, or current page when used with PageMixin
+            list_state - current list state query parameters, for building links with the list_query tag
+            list_state_defaults - default values of list_state parameters
+    '''
+    
     template = None
     
+    projection_sequences = ('object_list', )
+    
+    export_fields = None
+    export_chunk_size = 2000
+    
     def __init__(self, **kwargs):
+        
+        self.export_fields = kwargs.pop('export_fields', self.export_fields)
+        self.export_chunk_size = kwargs.pop('export_chunk_size', self.export_chunk_size)
             
         super(GenericListView, self).__init__(**kwargs)
         
         self.template = kwargs.get('template', getattr(self.__class__, 'template', '{0}/read.html'.format(self.model._meta.app_label)))
         
-    def get_context(self, request):
+    def get_list_state(self, request, state):
+        
+        '''
+            Set state.query and state.query_defaults of a stateless view from the request, without
+            querying the database.  List mixins add their own parameters
+        '''
+        
+    def get_context(self, request, state):
         
-        context = super(GenericListView, self).get_context(request)
-        context['object_list'] = self.get_queryset(request)
+        context = super(GenericListView, self).get_context(request, state)
+        if state.object_list is None:
+            state.object_list = self.get_queryset(request, state)
+        if not state.values:
+            state.object_list = self.prefetch_objects(state.object_list)
+        context['object_list'] = state.object_list
+        context['list_state'] = state.query
+        context['list_state_defaults'] = state.query_defaults
         return context
+    
+    def get_validators(self, request, state):
+        
+        '''Return etag and last modified time of the list from an aggregate query, without fetching the objects'''
+        
+        if state.object_list is None:
+            state.object_list = self.get_queryset(request, state)
+        
+        # aggregate over the whole filtered list rather than the page
+        if state.paginator is not None:
+            queryset = state.paginator.object_list
+        elif isinstance(state.object_list, QuerySet):
+            queryset = state.object_list
+        else:
+            # the objects were fetched (eg. by ResultCacheMixin), build the unpaginated queryset
+            state.paginate = False
+            queryset = self.get_queryset(request, state)
+            state.paginate = True
+        
+        aggregate = queryset.order_by().aggregate(last_modified=Max(self.last_modified_field), count=Count('pk'))
+        last_modified = aggregate['last_modified']
+        
+        # the query identifies filter, sort and user scope held outside the url
+        try:
+            query = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            query = None
+        
+        etag = self.get_etag(request, query, sorted(request.GET.items()), last_modified, aggregate['count'], *self.get_etag_parts(request, state, queryset))
+        return etag, last_modified
         
-    def __call__(self, request, *args, **kwargs):
+    def export(self, request, state, format):
+        
+        '''Stream the whole list as CSV or newline delimited JSON'''
+        
+        state.paginate = False
+        queryset = self.get_queryset(request, state)
+        
+        lines, content_type = EXPORT_FORMATS[format]
+        rows = iter_rows(queryset, self.export_fields, self.export_chunk_size)
+        
+        response = StreamingHttpResponse(lines(rows, self.export_fields), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(self.model._meta.model_name, format)
+        return response
+        
+    def render_to_response(self, request, state, context):
+        
+        if not self.json_fields:
+            return super(GenericListView, self).render_to_response(request, state, context)
+        
+        data = {'objects': [dict((field, row[field]) for field in self.json_fields) for row in context['object_list']]}
+        
+        page = state.page
+        if page is not None:
+            data['has_next'] = page.has_next()
+            data['has_previous'] = page.has_previous()
+            for attr in ('number', 'next_cursor', 'previous_cursor'):
+                if hasattr(page, attr):
+                    data[attr] = getattr(page, attr)
+            # only paginators that have already counted
+            if hasattr(state.paginator, 'num_pages'):
+                data['count'] = state.paginator.count
+                data['num_pages'] = state.paginator.num_pages
+                
+        return self.render_json(data)
+        
+    def dispatch(self, request, state):
+        
+        format = request.GET.get('export')
+        if self.export_fields and format in EXPORT_FORMATS:
+            return self.export(request, state, format)
+        
+        if self.json_fields:
+            state.values = self.get_values_fields()
+            
+        if self.stateless and request.method in ('GET', 'HEAD'):
+            # one url per list state, so responses can be cached by url.  Checked from the request
+            # alone, before the queryset is built, keeping parameters which aren't list state
+            self.get_list_state(request, state)
+            query = canonical_query(state.query, state.query_defaults, request.GET)
+            if query != request.META.get('QUERY_STRING', ''):
+                return HttpResponsePermanentRedirect(request.path + ('?' + query if query else ''))
+        
+        if self.last_modified_field and request.method in ('GET', 'HEAD'):
+            etag, last_modified = self.get_validators(request, state)
+            response = self.not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+            
+            context = self.get_context(request, state)
+            return self.set_validators(self.render_to_response(request, state, context), etag, last_modified)
         
-        context = self.get_context(request)
-        return render(request, self.template, context)
+        context = self.get_context(request, state)
+        return self.render_to_response(request, state, context)
     
     
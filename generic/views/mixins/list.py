@@ -1,5 +1,46 @@
-from django.forms import Form
+from hashlib import md5
+
+from django.db.models import ForeignKey
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.forms import CharField, Form, HiddenInput
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlencode
+
+from generic.cache import get_model_version, get_or_generate, track_model
+from generic.fields import CachedModelChoiceField
+from generic.paginator import count_paginator
+
+
+# generated filter form classes keyed by view class, model, filter fields, choice caching and statelessness
+_filter_forms = {}
+
+# hidden field marking posts of the filter form, which set the session filter
+FILTER_FORM_FIELD = '_filter'
+
+
+def canonical_query(query, defaults=None, extra=None):
+    
+    '''
+        Return the canonical query string of list state - parameters sorted, with empty values and
+        values equal to their default left out, so each list state has exactly one url.  Parameters
+        of the QueryDict extra which aren't list state are kept as they are
+    '''
+    
+    defaults = defaults or {}
+    items = []
+    for key, value in sorted(query.items()):
+        if value is None or value == '':
+            continue
+        if key in defaults and force_text(value) == force_text(defaults[key]):
+            continue
+        items.append((key, value))
+        
+    if extra is not None:
+        items.extend((key, value) for key, values in extra.lists() if key not in query and key not in defaults for value in values)
+        items.sort(key=lambda item: item[0])
+    return urlencode(items)
 
 
 class PageMixin(object):
@@ -9,10 +50,19 @@ class PageMixin(object):
         
         Options -
             paginator - paginator object. Should have the same interface as django.core.paginator.Paginator
+                        or generic.paginator.KeysetPaginator for cursor based pagination of large tables
             page_size - number of objects per page
+            count_strategy - how the total object count is found, replaces paginator when set
+                             exact - SELECT COUNT(*) on every request
+                             cached - count cached for count_cache_timeout seconds per filter state
+                             estimate - query planner estimate from database statistics
+                             none - no count, page only knows has_next/has_previous
+            count_cache_timeout - seconds to cache counts for the cached strategy, defaults to 300
             
         Template Context -
             page - paginator object for collection of page number and available pages
+            next_cursor - cursor of the following page when using KeysetPaginator, otherwise None
+            previous_cursor - cursor of the preceding page when using KeysetPaginator, otherwise None
             
         NOTE-
             In most cases PageMixin should be the last generic list mixin applied due to its effect on the
@@ -21,37 +71,153 @@ class PageMixin(object):
     
     paginator = Paginator
     page_size = 50 
+    
+    count_strategy = None
+    count_cache_timeout = 300
             
     def __init__(self, **kwargs):
         
         self.paginator = kwargs.pop('paginator', self.paginator)
         self.page_size = kwargs.pop('page_size', self.page_size)
         
+        self.count_strategy = kwargs.pop('count_strategy', self.count_strategy)
+        self.count_cache_timeout = kwargs.pop('count_cache_timeout', self.count_cache_timeout)
+        if self.count_strategy:
+            self.paginator = count_paginator(self.count_strategy, self.count_cache_timeout)
+        
         super(PageMixin, self).__init__(**kwargs)
         
-    def get_queryset(self, request):
+        if self.count_strategy == 'cached':
+            track_model(self.model)
+            
+    def get_list_state(self, request, state):
+        
+        super(PageMixin, self).get_list_state(request, state)
+        # the page as requested, get_queryset replaces it with the page found once the list is paginated
+        state.query['page'] = request.GET.get('page')
+        state.query_defaults['page'] = 1
         
-        queryset = super(PageMixin, self).get_queryset(request)
-        self.paginator_obj = self.paginator(queryset, self.page_size)
+    def get_queryset(self, request, state):
+        
+        queryset = super(PageMixin, self).get_queryset(request, state)
+        if not state.paginate:
+            return queryset
+        
+        state.paginator = self.paginator(queryset, self.page_size)
         
         # modify queryset to only contain objects that should be on the current page
+        # keyset paginators take an opaque cursor in the page parameter and never raise for a bad one
         page = request.GET.get('page')
         try:
-            queryset = self.paginator_obj.page(page)
+            queryset = state.paginator.page(page)
         except PageNotAnInteger:
-            queryset = self.paginator_obj.page(1)
+            queryset = state.paginator.page(1)
         except EmptyPage:
-            queryset = self.paginator_obj.page(self.paginator_obj.num_pages)
+            queryset = state.paginator.page(state.paginator.num_pages)
+        
+        state.page = queryset
+        
+        # page state for stateless urls, the first page needs no parameter
+        if hasattr(queryset, 'number'):
+            state.query['page'] = queryset.number
+        elif queryset.has_previous():
+            state.query['page'] = page
+        state.query_defaults['page'] = 1
         
         return queryset
     
-    def get_context(self, request):
+    def get_context(self, request, state):
         
-        context = super(PageMixin, self).get_context(request)
-        context['page'] = self.paginator_obj
+        context = super(PageMixin, self).get_context(request, state)
+        context['page'] = state.paginator
+        context['next_cursor'] = getattr(state.page, 'next_cursor', None)
+        context['previous_cursor'] = getattr(state.page, 'previous_cursor', None)
         return context
                
         
+class ResultCacheMixin(object):
+    
+    '''
+        Result cache mixin for generic list views
+        
+        Caches the objects of each list page in Django's cache framework.  The key is built from the
+        versions of the model and of the related models joined into its queryset, and the SQL of the
+        page query, which covers the filter, sort, page and user scope.  Model versions are bumped
+        whenever one of their rows is saved or deleted, so cached pages never outlive a write.
+        
+        Options -
+            result_cache_timeout - seconds a page is fresh, defaults to 60
+            result_cache_stale_timeout - seconds an expired page is served while a single request
+                                         regenerates it, defaults to 30
+            result_cache_models - further models the page depends on, eg. of relations only a
+                                  template method loads, defaults to []
+                                         
+        NOTE -
+            ResultCacheMixin should be applied before PageMixin so that it caches the current page only.
+            Pages that are already evaluated (keyset and count free paginators) are not cached.
+            Combine with count_strategy='cached' to also skip the count query.
+    '''
+    
+    result_cache_timeout = 60
+    result_cache_stale_timeout = 30
+    result_cache_models = []
+    
+    def __init__(self, **kwargs):
+        
+        self.result_cache_timeout = kwargs.pop('result_cache_timeout', self.result_cache_timeout)
+        self.result_cache_stale_timeout = kwargs.pop('result_cache_stale_timeout', self.result_cache_stale_timeout)
+        self.result_cache_models = kwargs.pop('result_cache_models', self.result_cache_models)
+        
+        super(ResultCacheMixin, self).__init__(**kwargs)
+        
+        for model in self.get_result_cache_models():
+            track_model(model)
+            
+    def get_result_cache_models(self):
+        
+        '''Return the models whose versions key cached pages - the model, the relations select_related joins and result_cache_models'''
+        
+        if '_result_cache_models' not in self.__dict__:
+            lookups = [lookup for lookup in self.get_related()[0]]
+            projection = self.get_projection()
+            if projection is not None:
+                lookups += projection[1]
+                
+            models = [self.model] + [model for model in self.result_cache_models]
+            for lookup in lookups:
+                model = self.model
+                for name in lookup.split('__'):
+                    model = model._meta.get_field(name).rel.to
+                    if model not in models:
+                        models.append(model)
+            self._result_cache_models = models
+        return self._result_cache_models
+        
+    def get_queryset(self, request, state):
+        
+        result = super(ResultCacheMixin, self).get_queryset(request, state)
+        if not state.paginate:
+            return result
+        
+        queryset = getattr(result, 'object_list', result)
+        if not isinstance(queryset, QuerySet):
+            return result
+        
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return result
+        
+        versions = '.'.join(str(get_model_version(model)) for model in self.get_result_cache_models())
+        key = 'generic.results.{0}.{1}.{2}'.format(self.model._meta.db_table, versions, md5(force_bytes(repr((sql, params)))).hexdigest())
+        objects = get_or_generate(key, lambda: list(queryset), self.result_cache_timeout, self.result_cache_stale_timeout)
+        
+        if result is queryset:
+            return objects
+        result.object_list = objects
+        return result
+    
+    
 class FilterMixin(object):
     
     '''
@@ -61,52 +227,109 @@ class FilterMixin(object):
             filter_fields - list of fields that may be filtered
             default_filter - dictionary containing default filtering with keys as field name
                              eg. {'closed': False}
+            filter_choice_cache_timeout - seconds to cache the choices of foreign key filter fields
+                                          rather than loading the related table on every render,
+                                          defaults to None for no caching
                              
         Template context -
             filter_form - auto generated form for selection filters
+            filter_form_method - method the filter form should submit with, get for stateless views
+            filter_form_state - (name, value) pairs of the other list state for hidden inputs of a get form
             
         NOTE -
-            this mixin requires sessions
+            this mixin requires sessions unless the view is stateless, in which case the filter is
+            read from the query string.  The session filter is only set by posts of filter_form, which
+            carries a hidden marker field, so other forms posted to the view leave it unchanged
     '''
     
     filter_fields = []
     default_filter = {}
+    filter_choice_cache_timeout = None
     
     def __init__(self, **kwargs):
         
         self.filter_fields = kwargs.pop('filter_fields', self.filter_fields)
         self.default_filter = kwargs.pop('default_filter', self.default_filter)
+        self.filter_choice_cache_timeout = kwargs.pop('filter_choice_cache_timeout', self.filter_choice_cache_timeout)
         
         super(FilterMixin, self).__init__(**kwargs)
         
     
     def _filter_form(self):
         
+        # the form class only depends on configuration so is built once and shared
+        key = (self.__class__, self.model, tuple(self.filter_fields), self.filter_choice_cache_timeout, self.stateless)
+        form = _filter_forms.get(key)
+        if form is not None:
+            return form
+        
         # this function uses hidden internal django methods and may not be safe in the future
         # loops through defined filter_fields names, finds the actual db field object and gets
         # its appropriate form field
         fields = {}
         for field in self.filter_fields:
             db_field = self.model._meta.get_field_by_name(field)[0]
-            fields[field] = db_field.formfield(required=False)
+            if self.filter_choice_cache_timeout is not None and isinstance(db_field, ForeignKey):
+                fields[field] = db_field.formfield(required=False, form_class=CachedModelChoiceField, cache_timeout=self.filter_choice_cache_timeout)
+            else:
+                fields[field] = db_field.formfield(required=False)
+        if not self.stateless:
+            fields[FILTER_FORM_FIELD] = CharField(widget=HiddenInput, initial='1', required=False)
             
         # dynamically create a Form subclass from generated form fields                
-        return type(self.__class__.__name__ + 'Form', (Form, ), fields)
+        form = _filter_forms[key] = type(self.__class__.__name__ + 'Form', (Form, ), fields)
+        return form
     
-    def get_queryset(self, request):
+    def _stateless_filters(self, request, state):
         
-        queryset = super(FilterMixin, self).get_queryset(request)
+        # only valid filters are list state
+        for key in self.filter_fields:
+            state.query.pop(key, None)
+            
+        # only fields present in the query string filter, otherwise the default filter applies
+        keys = [key for key in self.filter_fields if request.GET.get(key, '') != '']
+        if not keys:
+            return dict(self.default_filter)
+        
+        filters = {}
+        form = self._filter_form()(request.GET)
+        if form.is_valid():
+            for key in keys:
+                val = form.cleaned_data[key]
+                if val or val is False:
+                    filters[key] = val
+                    state.query[key] = request.GET[key]
+        return filters
+    
+    def get_list_state(self, request, state):
+        
+        super(FilterMixin, self).get_list_state(request, state)
+        if self.stateless:
+            # values are validated by get_queryset, an invalid one leaves the list unfiltered
+            for key in self.filter_fields:
+                state.query[key] = request.GET.get(key)
+                state.query_defaults[key] = ''
+                
+    def get_queryset(self, request, state):
+        
+        queryset = super(FilterMixin, self).get_queryset(request, state)
+        
+        if self.stateless:
+            state.filters = self._stateless_filters(request, state)
+            return queryset.filter(**state.filters)
         
         # set filter to be default_filter if nothing is already set
-        if request.session.get('filter', None):
-            request.session.filter = self.default_filter
+        if 'filter' not in request.session:
+            request.session['filter'] = self.default_filter
         
-        if request.method == 'POST':
+        # only posts of the filter form change the filter, other forms (eg. bulk actions) leave it
+        if request.method == 'POST' and FILTER_FORM_FIELD in request.POST:
             form = self._filter_form()(request.POST)
             if form.is_valid():
                 # django forms give empty strings for missing, we need to not have them in the filter
                 filters = {}
-                for key, val in form.cleaned_data.iteritems():
+                for key in self.filter_fields:
+                    val = form.cleaned_data[key]
                     # this is dangerous for boolean field filters
                     # probably need to remove False condition and use NullableBooleanField in cases
                     # where querysets need to be filtered by boolean fields
@@ -115,17 +338,18 @@ class FilterMixin(object):
                 
                 request.session['filter'] = filters
                 
-        filters = request.session.get('filter', {})
+        filters = state.filters = request.session.get('filter', {})
         
         # filter queryset
         return queryset.filter(**filters)
     
-    def get_context(self, request):
-        context = super(FilterMixin, self).get_context(request)
+    def get_context(self, request, state):
+        context = super(FilterMixin, self).get_context(request, state)
         
-        filters = request.session.get('filter', [])
-        form = self._filter_form()(initial=filters)
+        form = self._filter_form()(initial=state.filters)
         context['filter_form'] = form 
+        context['filter_form_method'] = 'get' if self.stateless else 'post'
+        context['filter_form_state'] = [(key, value) for key, value in sorted(state.query.items()) if key not in self.filter_fields and key != 'page']
         return context
         
         
@@ -145,7 +369,8 @@ class SortMixin(object):
             sort_order - current sort direction
             
         NOTE -
-            this mixin requires sessions
+            this mixin requires sessions unless the view is stateless, in which case the sort is
+            read from the query string
     '''
     
     sort_fields = []
@@ -159,32 +384,56 @@ class SortMixin(object):
         self.default_sort_order = kwargs.pop('default_sort_order', self.default_sort_order)
     
         super(SortMixin, self).__init__(**kwargs)
-    
-    def get_queryset(self, request):
         
-        queryset = super(SortMixin, self).get_queryset(request)
+    def _stateless_sort(self, request, state):
         
-        if request.method == 'GET':
-            sort_field = request.GET.get('sort_field', None)
-            if sort_field:
-                request.session['sort_field'] = sort_field
-                request.session['sort_order'] = request.GET.get('sort_order', 'asc')
+        # unknown fields are ignored rather than passed on to order_by
+        sort_field = request.GET.get('sort_field')
+        if sort_field not in self.sort_fields:
+            sort_field = self.default_sort_field
+        sort_order = request.GET.get('sort_order')
+        if sort_order not in ('asc', 'dec'):
+            sort_order = self.default_sort_order
+            
+        state.query.update(sort_field=sort_field, sort_order=sort_order)
+        state.query_defaults.update(sort_field=self.default_sort_field, sort_order=self.default_sort_order)
+        return sort_field, sort_order
+        
+    def get_list_state(self, request, state):
+        
+        super(SortMixin, self).get_list_state(request, state)
+        if self.stateless:
+            self._stateless_sort(request, state)
+    
+    def get_queryset(self, request, state):
         
-        sort_field = request.session.get('sort_field', self.default_sort_field)
+        queryset = super(SortMixin, self).get_queryset(request, state)
+        
+        if self.stateless:
+            sort_field, sort_order = self._stateless_sort(request, state)
+        else:
+            if request.method == 'GET':
+                sort_field = request.GET.get('sort_field', None)
+                if sort_field:
+                    request.session['sort_field'] = sort_field
+                    request.session['sort_order'] = request.GET.get('sort_order', 'asc')
+            
+            sort_field = request.session.get('sort_field', self.default_sort_field)
+            sort_order = request.session.get('sort_order', self.default_sort_order)
+            
+        state.sort_field, state.sort_order = sort_field, sort_order
         if not sort_field:
             return queryset
         
-        sort_order = request.session.get('sort_order', self.default_sort_order)
-        
         if sort_order == 'dec':
             sort_field = '-' + sort_field
             
         return queryset.order_by(sort_field)
     
-    def get_context(self, request):
+    def get_context(self, request, state):
         
-        context = super(SortMixin, self).get_context(request)
+        context = super(SortMixin, self).get_context(request, state)
         context['sort_fields'] = self.sort_fields 
-        context['sort_field'] = request.session.get('sort_field', None)
-        context['sort_order'] = request.session.get('sort_order', None)
+        context['sort_field'] = state.sort_field
+        context['sort_order'] = state.sort_order
         return context
\ No newline at end of file
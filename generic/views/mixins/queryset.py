@@ -14,7 +14,7 @@ class FilterByUser(object):
         
         super(FilterByUser, self).__init__(**kwargs)
     
-    def get_queryset(self, request):
+    def get_queryset(self, request, state):
         
-        queryset = super(FilterByUser, self).get_queryset(request)
-        return queryset.filter()
\ No newline at end of file
+        queryset = super(FilterByUser, self).get_queryset(request, state)
+        return queryset.filter(**{self.user_field: request.user})
\ No newline at end of file
@@ -1,10 +1,11 @@
 from django.core.exceptions import ImproperlyConfigured
 from django.forms.models import modelform_factory
-from django.shortcuts import redirect, render
-from django.core.urlresolvers import reverse
-from django.http import Http404, HttpResponse
+from django.http import HttpResponse, HttpResponseRedirect
 from django.dispatch import Signal
 
+from generic.cache import bump_if_tracked
+from generic.callbacks import defer
+from generic.reverse import cached_resolve_url, cached_reverse
 from generic.views import GenericView
 
 
@@ -24,6 +25,8 @@ class GenericCreateView(GenericView):
             post_save_key_field - field name of key used to identify object post save, deafults to 'object_id'
             
             on_save - callback when object is saved; args - instance
+            defer_on_save - run on_save on the generic.callbacks worker pool after the transaction
+                            commits rather than before responding, defaults to False
             
         Template Context -
             form - created model form or form supplied by form option 
@@ -40,6 +43,7 @@ class GenericCreateView(GenericView):
     post_save_key_field = 'object_id'
     
     on_save = None
+    defer_on_save = False
     
     def __init__(self, **kwargs):
         
@@ -51,42 +55,44 @@ class GenericCreateView(GenericView):
         self.post_save_key_field = kwargs.pop('post_save_key_field', self.post_save_key_field)
         
         self.on_save = kwargs.pop('on_save', self.on_save)
+        self.defer_on_save = kwargs.pop('defer_on_save', self.defer_on_save)
         
         super(GenericCreateView, self).__init__(**kwargs)
         
         # this needs to be done after the super call because it relies on model attribute created by superclass
         self.form = kwargs.pop('form', self.form)
         if not self.form:
-            self.form = modelform_factory(self.model)
+            self.form = modelform_factory(self.model, fields='__all__')
             
         self.template = kwargs.get('template', getattr(self.__class__, 'template', '{0}/create.html'.format(self.model._meta.app_label)))
         
-    def get_context(self, request):
-        context = super(GenericCreateView, self).get_context(request)
-        context['form'] = self.form()
+    def get_context(self, request, state):
+        context = super(GenericCreateView, self).get_context(request, state)
+        context['form'] = state.form or self.form()
         return context
         
-    def __call__(self, request, *args, **kwargs):
+    def dispatch(self, request, state):
+        
         # checks if the page has post variables from a submitted form and tries to save a model instance
         # anything failing results in being directed back to form page which can have form error msgs
         if request.method == 'POST':
-            form = self.form(request.POST, request.FILES)
+            form = state.form = self.form(request.POST, request.FILES)
             if form.is_valid():
                 object = form.save(commit=False)
                 if self.autofill_user:
                     setattr(object, self.user_field, request.user)
                 object.save()
-                if self.on_save:
+                if self.on_save and self.defer_on_save:
+                    defer(self.on_save, object)
+                elif self.on_save:
                     self.on_save(object)
                 if self.post_save_redirect:
-                    return redirect(reverse(self.post_save_redirect, kwargs={self.post_save_key_field: getattr(object, self.post_save_model_field)}))
+                    return HttpResponseRedirect(cached_reverse(self.post_save_redirect, kwargs={self.post_save_key_field: getattr(object, self.post_save_model_field)}))
                 else:
-                    return redirect(object.get_absolute_url())
+                    return HttpResponseRedirect(object.get_absolute_url())
             
-        else:
-                
-            context = self.get_context(request)
-            return render(request, self.template, context)
+        context = self.get_context(request, state)
+        return self.render_to_response(request, state, context)
         
 
 class GenericReadView(GenericView):
@@ -96,6 +102,8 @@ class GenericReadView(GenericView):
         
         Options -
             template - template path, defaults to app_name/read.html 
+            last_modified_field - date/time field for conditional GET, a matching request gets a 304
+                                  after fetching only that field
             
         Template Context -
             object - the object being read 
@@ -104,6 +112,8 @@ class GenericReadView(GenericView):
     '''
     
     template = None
+    
+    projection_objects = ('object', )
        
     def __init__(self, **kwargs):
                                 
@@ -111,22 +121,53 @@ class GenericReadView(GenericView):
         
         self.template = kwargs.get('template', getattr(self.__class__, 'template', '{0}/read.html'.format(self.model._meta.app_label)))
         
-    def get_context(self, request):
-        context = super(GenericReadView, self).get_context(request)
-        context['object'] = self.object
+    def get_context(self, request, state):
+        context = super(GenericReadView, self).get_context(request, state)
+        context['object'] = state.object
         return context
+    
+    def render_to_response(self, request, state, context):
         
-    def __call__(self, request, *args, **kwargs):
+        if not self.json_fields:
+            return super(GenericReadView, self).render_to_response(request, state, context)
         
-        if kwargs.has_key('object_id'):
-            self.object = self.model.objects.get(pk=kwargs['object_id'])
-        elif kwargs.has_key('slug'):
-            self.object = self.model.objects.get(slug=kwargs['slug'])
-        else:
-            raise Http404
+        return self.render_json(dict((field, state.object[field]) for field in self.json_fields))
+    
+    def get_validators(self, request, state):
+        
+        '''Return etag and last modified time of the object, fetching only last_modified_field'''
+        
+        lookup = self.get_lookup(request, state)
+        queryset = self.get_queryset(request, state).filter(**lookup)
+        values = queryset.values_list(self.last_modified_field, flat=True)[:1]
+        if not values:
+            return None, None
+        
+        etag = self.get_etag(request, sorted(lookup.items()), values[0], *self.get_etag_parts(request, state, queryset))
+        return etag, values[0]
         
-        context = self.get_context(request)
-        return render(request, self.template, context)
+    def dispatch(self, request, state):
+        
+        etag = last_modified = None
+        if self.last_modified_field and request.method in ('GET', 'HEAD'):
+            etag, last_modified = self.get_validators(request, state)
+            response = self.not_modified(request, etag, last_modified) if etag else None
+            if response is not None:
+                return response
+            
+        if self.json_fields:
+            state.values = self.get_values_fields()
+        
+        if state.object is None:
+            state.object = self.get_object(request, state)
+        if not state.values:
+            self.prefetch_objects([state.object])
+        
+        context = self.get_context(request, state)
+        response = self.render_to_response(request, state, context)
+        if etag:
+            self.set_validators(response, etag, last_modified)
+        return response
     
     
 class GenericUpdateView(GenericView):
@@ -138,9 +179,12 @@ class GenericUpdateView(GenericView):
             form - the form to use if model is no defined. NOTE - model or form is required
             template - template path, defaults to app_name/create.html 
             set_model_fields - a dictionary of predetermined field:value pairs to save
+            projection - see GenericView, the form fields and set_model_fields are always loaded
             post_save_redirect - view to go to after save.  If not defined, redirects to saved object's absolute url
             post_save_key_field - field name of key used to identify object post save, deafults to 'object_id'
             on_save - callback when object is saved; args - instance
+            defer_on_save - run on_save on the generic.callbacks worker pool after the transaction
+                            commits rather than before responding, defaults to False
             
         Template Context -
             form - created model form or form supplied by form option
@@ -161,6 +205,9 @@ class GenericUpdateView(GenericView):
     post_save_key_field = 'object_id'
     
     on_save = None
+    defer_on_save = False
+    
+    projection_objects = ('object', )
         
     def __init__(self, **kwargs):
                    
@@ -171,34 +218,42 @@ class GenericUpdateView(GenericView):
         self.post_save_key_field = kwargs.pop('post_save_key_field', self.post_save_key_field)
         
         self.on_save = kwargs.pop('on_save', self.on_save)
+        self.defer_on_save = kwargs.pop('defer_on_save', self.defer_on_save)
         
         super(GenericUpdateView, self).__init__(**kwargs)
         
         # this needs to be done after the super call because it relies on model attribute created by superclass
         self.form = kwargs.pop('form', self.form)
         if not self.form:
-            self.form = modelform_factory(self.model)
+            self.form = modelform_factory(self.model, fields='__all__')
             
         self.template = kwargs.get('template', getattr(self.__class__, 'template', '{0}/update.html'.format(self.model._meta.app_label)))
         
-    def get_context(self, request):
+    def get_projection_extra(self):
         
-        context = super(GenericUpdateView, self).get_context(request)
-        context['form'] = self.form(instance=self.object)
-        context['object'] = self.object
+        # deferred fields are left out of the save, so load every field the view or save() may set
+        extra = super(GenericUpdateView, self).get_projection_extra()
+        names = list(self.form.base_fields) + list(self.set_model_fields) + [self.post_save_model_key]
+        for field in self.model._meta.fields:
+            # attnames, so foreign keys load their id rather than join the related row
+            if field.name in names or getattr(field, 'auto_now', False):
+                extra.append(field.attname)
+        return extra
+        
+    def get_context(self, request, state):
+        
+        context = super(GenericUpdateView, self).get_context(request, state)
+        context['form'] = state.form or self.form(instance=state.object)
+        context['object'] = state.object
         return context
             
-    def __call__(self, request, *args, **kwargs):
+    def dispatch(self, request, state):
     
-        if kwargs.has_key('object_id'):
-            self.object = self.model.objects.get(pk=kwargs['object_id'])
-        elif kwargs.has_key('slug'):
-            self.object = self.model.objects.get(slug=kwargs['slug'])
-        else:
-            raise Http404
+        if state.object is None:
+            state.object = self.get_object(request, state)
 
         if request.method == 'POST':
-            form = self.form(request.POST, request.FILES, instance=self.object)
+            form = state.form = self.form(request.POST, request.FILES, instance=state.object)
             if form.is_valid():
                 object = form.save(commit=False)
                 for key, value in self.set_model_fields.iteritems():
@@ -208,26 +263,29 @@ class GenericUpdateView(GenericView):
                         setattr(object, key, value)
                 object.save()
                 
-                if self.on_save:
+                if self.on_save and self.defer_on_save:
+                    defer(self.on_save, object)
+                elif self.on_save:
                     self.on_save(object)
                     
                 if self.post_save_redirect:
-                    return redirect(reverse(self.post_save_redirect, kwargs={self.post_save_key_field: getattr(object, self.post_save_model_key)}))
+                    return HttpResponseRedirect(cached_reverse(self.post_save_redirect, kwargs={self.post_save_key_field: getattr(object, self.post_save_model_key)}))
                 else:
-                    return redirect(object.get_absolute_url())
+                    return HttpResponseRedirect(object.get_absolute_url())
             
-        else:  
-            context = self.get_context(request)
-            return render(request, self.template, context)
+        context = self.get_context(request, state)
+        return self.render_to_response(request, state, context)
         
         
-class GenericDeleteView(object):
+class GenericDeleteView(GenericView):
     
     '''
         Generic view for deleting model instances.
         
         Options -
             post_delete_redirect - view to go to after delete.  Required.
+            background_delete - queue the object for the generic.deletion worker and redirect at once,
+                                for objects with large cascades
                     
         Expects to receive either object_id or slug from URLConf
     '''
@@ -242,22 +300,24 @@ class GenericDeleteView(object):
         
         super(GenericDeleteView, self).__init__(**kwargs)
         
-    def get_context(self, request):
+    def get_context(self, request, state):
         
-        context = super(GenericDeleteView, self).get_context(request)
-        context['object'] = self.object
+        context = super(GenericDeleteView, self).get_context(request, state)
+        context['object'] = state.object
         return context
          
-    def __call__(self, request, *args, **kwargs):
+    def dispatch(self, request, state):
         
-        if kwargs.has_key('object_id'):
-            self.object = self.model.objects.get(pk=kwargs['object_id'])
-        elif kwargs.has_key('slug'):
-            self.object = self.model.objects.get(slug=kwargs['slug'])
-        else:
-            raise Http404
+        if state.object is None:
+            state.object = self.get_object(request, state)
         
-        self.object.delete()
-        return redirect(self.post_delete_redirect)
+        if self.background_delete:
+            from generic.models import DeletionTask
+            DeletionTask.objects.schedule(state.object)
+            # the object is hidden without a delete signal
+            bump_if_tracked(self.model)
+        else:
+            state.object.delete()
+        return HttpResponseRedirect(cached_resolve_url(self.post_delete_redirect))
         
     